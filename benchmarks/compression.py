@@ -0,0 +1,199 @@
+"""
+Бенчмарк сжатия .csv файлов кэша.
+
+Для каждого кодека и уровня фиксируются время записи файла кэша
+(write_csv), время чтения целиком и по чанкам CSV_CHUNK_SIZE строк
+(read_csv), размер файла на диске и степень сжатия. Пропускная
+способность считается по объему несжатого .csv файла.
+
+Данные - синтетический отчет Директа, разобранный парсером отчетов
+(как в {client}_direct.csv), либо реальный файл кэша из --file.
+Кодек zstd пропускается, если не установлен пакет zstandard.
+
+Запуск из корня репозитория:
+    python -m benchmarks.compression --rows 1000000 --output comp.json
+    python -m benchmarks.compression --file data/client_direct.csv
+"""
+import argparse
+import datetime as dt
+import importlib.util
+import io
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.stub_server import DATE_FORMAT, SyntheticData
+from parser.constants import CSV_CHUNK_SIZE
+from parser.http_cache import ResponseCache
+from parser.storage import get_cache_path, read_csv, write_csv
+from parser.ya_direct import YandexDirectReports
+
+CODECS = 'none,gzip:1,gzip:6,gzip:9,xz:0,xz:6,zstd:3,zstd:19'
+
+DIRECT_HEADER = (
+    'Date\tCampaignName\tCampaignId\tDevice\t'
+    'Impressions\tClicks\tCost\n'
+)
+
+
+def make_direct_frame(rows: int, logins: int, campaigns: int) -> pd.DataFrame:
+    """
+    Возвращает синтетический отчет Директа из rows строк в схеме
+    файла кэша. Период отчета подбирается по количеству строк.
+    """
+    data = SyntheticData(logins, campaigns)
+    days = rows // (campaigns * 2) + 1
+    date_to = dt.date(2025, 1, 31)
+    date_from = date_to - dt.timedelta(days=days - 1)
+    direct = YandexDirectReports(
+        token='bench',
+        dates_list=[],
+        login=data.logins,
+        cache=ResponseCache(enabled=False)
+    )
+    frames = []
+    for login in data.logins:
+        report = DIRECT_HEADER + ''.join(data.iter_direct_rows(
+            login,
+            date_from.strftime(DATE_FORMAT),
+            date_to.strftime(DATE_FORMAT)
+        ))
+        frames.extend(direct._parse_direct_report(
+            login,
+            io.BytesIO(report.encode('utf-8'))
+        ))
+    return pd.concat(frames, ignore_index=True).head(rows)
+
+
+def parse_codecs(value: str) -> list:
+    """Разбирает список кодек:уровень через запятую."""
+    codecs = []
+    for item in value.split(','):
+        if item == 'none':
+            codecs.append(None)
+            continue
+        codec, level = item.split(':')
+        if codec == 'zstd' and importlib.util.find_spec('zstandard') is None:
+            print(f'{item}: пропущен, не установлен пакет zstandard')
+            continue
+        codecs.append((codec, int(level)))
+    return codecs
+
+
+def measure(func, repeat: int) -> float:
+    """Возвращает минимальное время выполнения func из repeat запусков."""
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+def run_codec(
+    df: pd.DataFrame,
+    compression: tuple | None,
+    workdir: Path,
+    repeat: int
+) -> dict:
+    """Замеряет запись и чтение df с кодеком compression."""
+    path = get_cache_path(workdir / 'bench_direct.csv', compression)
+    write_time = measure(lambda: write_csv(df, path, compression), repeat)
+    read_time = measure(lambda: read_csv(path), repeat)
+    chunks_time = measure(
+        lambda: sum(
+            len(chunk)
+            for chunk in read_csv(path, chunksize=CSV_CHUNK_SIZE)
+        ),
+        repeat
+    )
+    result = {
+        'codec': 'none' if compression is None else ':'.join(
+            map(str, compression)
+        ),
+        'write_seconds': round(write_time, 3),
+        'read_seconds': round(read_time, 3),
+        'read_chunks_seconds': round(chunks_time, 3),
+        'size_bytes': path.stat().st_size
+    }
+    path.unlink()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Бенчмарк сжатия .csv файлов кэша.'
+    )
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--logins', type=int, default=180)
+    parser.add_argument('--campaigns', type=int, default=10000)
+    parser.add_argument(
+        '--file',
+        help='Реальный файл кэша вместо синтетического отчета Директа.'
+    )
+    parser.add_argument(
+        '--codecs',
+        default=CODECS,
+        help='Кодеки через запятую в виде кодек:уровень или none.'
+    )
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Файл для результатов в JSON.')
+    args = parser.parse_args()
+
+    if args.file:
+        df = read_csv(Path(args.file))
+    else:
+        df = make_direct_frame(args.rows, args.logins, args.campaigns)
+    codecs = parse_codecs(args.codecs)
+
+    workdir = Path(tempfile.mkdtemp(prefix='bench_compression_'))
+    try:
+        raw_path = workdir / 'raw.csv'
+        write_csv(df, raw_path)
+        raw_bytes = raw_path.stat().st_size
+        raw_path.unlink()
+        print(
+            f'Строк: {len(df)}, '
+            f'размер без сжатия: {raw_bytes / 2**20:.1f} МБ'
+        )
+
+        results = []
+        for compression in codecs:
+            result = run_codec(df, compression, workdir, args.repeat)
+            result['ratio'] = round(raw_bytes / result['size_bytes'], 2)
+            results.append(result)
+            raw_mb = raw_bytes / 2**20
+            print(
+                f'{result["codec"]:<9} '
+                f'запись {raw_mb / result["write_seconds"]:>7.1f} МБ/с  '
+                f'чтение {raw_mb / result["read_seconds"]:>7.1f} МБ/с  '
+                f'по чанкам {raw_mb / result["read_chunks_seconds"]:>7.1f} '
+                f'МБ/с  '
+                f'размер {result["size_bytes"] / 2**20:>7.1f} МБ  '
+                f'сжатие {result["ratio"]:>5}x'
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        Path(args.output).write_text(
+            json.dumps(
+                {
+                    'params': vars(args),
+                    'rows': len(df),
+                    'raw_bytes': raw_bytes,
+                    'results': results
+                },
+                ensure_ascii=False,
+                indent=2
+            ),
+            encoding='utf-8'
+        )
+
+
+if __name__ == '__main__':
+    main()
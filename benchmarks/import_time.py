@@ -0,0 +1,108 @@
+"""
+Бенчмарк времени импорта модулей парсера и запуска легких команд.
+
+Каждый замер выполняется в новом процессе интерпретатора. Для модулей
+дополнительно выводятся самые тяжелые импорты по данным -X importtime.
+
+Запуск из корня репозитория:
+    python -m benchmarks.import_time --repeat 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+MODULES = [
+    'parser.constants',
+    'parser.main',
+    'parser.utils',
+    'parser.ya_direct',
+]
+
+COMMANDS = [
+    ['-m', 'parser.main', 'clients'],
+    ['-m', 'parser.main', 'plan'],
+]
+
+
+def run_python(args: list, importtime: bool = False) -> tuple[float, str]:
+    """Запускает интерпретатор и возвращает время в мс и stderr."""
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    env = {**os.environ, 'PYTHONPATH': str(ROOT)}
+    start_time = time.perf_counter()
+    process = subprocess.run(
+        command + args,
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    elapsed = (time.perf_counter() - start_time) * 1000
+    if process.returncode:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+    return elapsed, process.stderr
+
+
+def get_heaviest_imports(stderr: str, top: int = 5) -> list:
+    """
+    Возвращает самые тяжелые импортированные пакеты по данным
+    -X importtime, кроме самого parser и site.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        if '.' in name or name in ('parser', 'site'):
+            continue
+        imports.append((int(cumulative), name))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Время импорта модулей и запуска легких команд.'
+    )
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    baseline = statistics.median(
+        run_python(['-c', 'pass'])[0] for _ in range(args.repeat)
+    )
+    print(f'{"python -c pass":<32} {baseline:>8.1f} мс')
+
+    for module in MODULES:
+        times = [
+            run_python(['-c', f'import {module}'])[0]
+            for _ in range(args.repeat)
+        ]
+        _, stderr = run_python(['-c', f'import {module}'], importtime=True)
+        heaviest = ', '.join(
+            f'{name} {cumulative / 1000:.0f} мс'
+            for cumulative, name in get_heaviest_imports(stderr)
+        )
+        print(
+            f'{"import " + module:<32} {statistics.median(times):>8.1f} мс'
+            f'  ({heaviest})'
+        )
+
+    for command in COMMANDS:
+        name = ' '.join(command[2:])
+        try:
+            times = [run_python(command)[0] for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f'{name:<32} ошибка: {e}')
+            continue
+        print(f'{name:<32} {statistics.median(times):>8.1f} мс')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""
+Сквозные бенчмарки парсера на локальном стенде API.
+
+Каждый сценарий запускается в отдельном процессе на копии пакета parser
+во временной папке, поэтому данные, состояние, кэш, логи и метрики
+реального запуска не затрагиваются. Для сценария фиксируются время
+выполнения, количество запросов к стенду и пиковый RSS процесса.
+
+Сценарии:
+    main                - parser.main.main() целиком;
+    direct              - YandexDirectReports.save_data;
+    metrica             - YandexMetricaReports.save_data;
+    appmetrica          - YandexAppMetricaReports.save_data, запрос
+                          на каждую пару (дата, кампания);
+    appmetrica_grouped  - то же в группированном режиме.
+
+Запуск из корня репозитория:
+    python -m benchmarks.run_benchmarks --logins 180 --campaigns 10000 \\
+        --days 45 --output bench.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.stub_server import SyntheticApiServer, SyntheticData
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CASES = ['main', 'direct', 'metrica', 'appmetrica', 'appmetrica_grouped']
+
+CLIENT_NAME = 'bench'
+
+CASE_SCRIPT = '''
+import json
+import sys
+
+import parser.constants as constants
+
+case = sys.argv[1]
+with open(sys.argv[2], encoding='utf-8') as file:
+    config = json.load(file)
+constants.CLIENT_INFO.clear()
+constants.CLIENT_INFO[config['client']] = (
+    config['logins'], config['metrica_id'], config['appmetrica_id']
+)
+constants.DAYS_TO_GENERATE_DIRECT = config['days']
+constants.APPMETRICA_GROUPED_MODE = case == 'appmetrica_grouped'
+if config['compression']:
+    for source in constants.CACHE_COMPRESSION:
+        constants.CACHE_COMPRESSION[source] = tuple(config['compression'])
+
+if case == 'main':
+    from parser.main import main
+    sys.argv = ['main']
+    main()
+    sys.exit(0)
+
+from parser.bootstrap import initialize
+from parser.utils import initialize_components
+
+initialize()
+appmetrica, direct, metrica = initialize_components(
+    config['logins'],
+    config['metrica_id'],
+    config['appmetrica_id'],
+    config['client']
+)
+if case == 'direct':
+    direct.save_data(filename_data=f"{config['client']}_direct.csv")
+elif case == 'metrica':
+    metrica.save_data(filename_data=f"{config['client']}_metrica.csv")
+else:
+    appmetrica.grouped_mode = case == 'appmetrica_grouped'
+    appmetrica.save_data(
+        filename_data=f"{config['client']}_appmetrica.csv",
+        campaigns=set(config['campaigns'])
+    )
+'''
+
+
+def run_case(
+    case: str,
+    server: SyntheticApiServer,
+    config: dict,
+    keep: bool = False
+) -> dict:
+    """
+    Запускает сценарий case в отдельном процессе и возвращает
+    время выполнения, количество запросов и пиковый RSS.
+    """
+    workdir = Path(tempfile.mkdtemp(prefix=f'bench_{case}_'))
+    shutil.copytree(
+        ROOT / 'parser',
+        workdir / 'parser',
+        ignore=shutil.ignore_patterns('__pycache__')
+    )
+    env = {
+        **os.environ,
+        **server.urls,
+        'PYTHONPATH': str(workdir),
+        'YANDEX_DIRECT_TOKEN': 'bench',
+        'YANDEX_METRICA_TOKEN': 'bench',
+        'YANDEX_APPMETRICA_TOKEN': 'bench',
+        'YANDEX_PARSER_NO_CACHE': '1'
+    }
+    config_path = workdir / 'bench_config.json'
+    config_path.write_text(json.dumps(config), encoding='utf-8')
+    server.reset_counts()
+
+    start_time = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-c', CASE_SCRIPT, case, str(config_path)],
+        cwd=workdir,
+        env=env
+    )
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall_time = time.perf_counter() - start_time
+
+    data_files = list((workdir / 'data').glob('*.csv*'))
+    result = {
+        'case': case,
+        'returncode': process.returncode,
+        'wall_time': round(wall_time, 3),
+        'cpu_time': round(rusage.ru_utime + rusage.ru_stime, 3),
+        'peak_rss_mb': round(rusage.ru_maxrss / 1024, 1),
+        'requests': sum(server.requests.values()),
+        'requests_by_path': dict(server.requests),
+        'output_bytes': sum(path.stat().st_size for path in data_files)
+    }
+    if keep:
+        result['workdir'] = str(workdir)
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Бенчмарки парсера на локальном стенде API.'
+    )
+    parser.add_argument('--logins', type=int, default=180)
+    parser.add_argument('--campaigns', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=45)
+    parser.add_argument(
+        '--cases',
+        default=','.join(CASES),
+        help=f'Сценарии через запятую из: {", ".join(CASES)}.'
+    )
+    parser.add_argument(
+        '--retry-in',
+        type=int,
+        default=0,
+        help='Значение retryIn стенда Директа в секундах.'
+    )
+    parser.add_argument(
+        '--polls-to-ready',
+        type=int,
+        default=1,
+        help='Количество ответов 202 до готовности отчета Директа.'
+    )
+    parser.add_argument(
+        '--max-report-days',
+        type=int,
+        default=0,
+        help='Максимальный период отчета Директа без ошибки 502 в днях.'
+    )
+    parser.add_argument(
+        '--compression',
+        default='',
+        help='Сжатие кэша всех источников в виде кодек:уровень, '
+             'например gzip:6.'
+    )
+    parser.add_argument('--output', help='Файл для результатов в JSON.')
+    parser.add_argument(
+        '--keep',
+        action='store_true',
+        help='Не удалять рабочие папки сценариев.'
+    )
+    args = parser.parse_args()
+
+    data = SyntheticData(args.logins, args.campaigns)
+    server = SyntheticApiServer(
+        data,
+        retry_in=args.retry_in,
+        polls_to_ready=args.polls_to_ready,
+        max_report_days=args.max_report_days
+    )
+    server.start()
+    config = {
+        'client': CLIENT_NAME,
+        'logins': data.logins,
+        'metrica_id': '1000001',
+        'appmetrica_id': '2000001',
+        'days': args.days,
+        'campaigns': data.campaign_names,
+        'compression': None
+    }
+    if args.compression:
+        codec, level = args.compression.split(':')
+        config['compression'] = [codec, int(level)]
+
+    results = []
+    try:
+        for case in args.cases.split(','):
+            result = run_case(case.strip(), server, config, args.keep)
+            results.append(result)
+            print(
+                f'{result["case"]:<20} '
+                f'код {result["returncode"]:<3} '
+                f'время {result["wall_time"]:>9} сек  '
+                f'CPU {result["cpu_time"]:>9} сек  '
+                f'RSS {result["peak_rss_mb"]:>8} МБ  '
+                f'запросов {result["requests"]:>7}'
+            )
+    finally:
+        server.shutdown()
+
+    if args.output:
+        Path(args.output).write_text(
+            json.dumps(
+                {'params': vars(args), 'results': results},
+                ensure_ascii=False,
+                indent=2
+            ),
+            encoding='utf-8'
+        )
+
+
+if __name__ == '__main__':
+    main()
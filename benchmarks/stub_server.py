@@ -0,0 +1,413 @@
+"""
+Локальный стенд API Яндекс Директ, Метрики и Аппметрики.
+
+Эмулирует офлайн-очередь отчетов Директа (ответы 201/202 с retryIn
+и TSV-отчет с заголовком и строкой Total rows), постраничную выдачу
+stat/v1 Метрики и запросы Аппметрики с фильтром по utm_campaign
+и с группировкой по кампаниям. Данные синтетические и детерминированные.
+
+Запуск отдельно:
+    python -m benchmarks.stub_server --port 8080 --logins 180
+
+URL для парсера задаются переменными окружения, см. SyntheticApiServer.urls.
+"""
+import argparse
+import datetime as dt
+import functools
+import json
+import re
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+DATE_FORMAT = '%Y-%m-%d'
+
+GEO = ['msk', 'spb', 'ekb', 'nsk', 'kzn', 'rf']
+SITE_TYPES = ['search', 'rsya', 'mk']
+GENERATION = ['auto', 'manual', 'feed']
+CATEGORIES = ['tv', 'audio', 'pc', 'phone', 'home', 'kitchen', 'climate']
+SUBJECTS = ['brand', 'model', 'general', 'competitor', 'retarget']
+URL_TYPES = ['catalog', 'product', 'promo']
+
+DIRECT_DEVICES = ['DESKTOP', 'MOBILE', 'TABLET']
+METRICA_DEVICES = ['PC', 'Smartphones', 'Tablets']
+
+DIRECT_PATH = '/direct/json/v5/reports'
+METRICA_PATH = '/metrica/stat/v1/data'
+APPMETRICA_PATH = '/appmetrica/stat/v1/data'
+
+
+class SyntheticData:
+    """
+    Синтетический набор кампаний клиента.
+
+    Кампании равномерно распределены по логинам, около 5% имен
+    не содержат '-' и отбрасываются фильтром Метрики, около 2% содержат
+    'rmp' и пропускаются Аппметрикой. Метрики строк вычисляются
+    арифметически из id кампании и даты, поэтому ответы стенда
+    одинаковы между запусками.
+    """
+
+    def __init__(self, logins: int = 180, campaigns: int = 10000):
+        self.logins = [f'bench-login-{i:03d}' for i in range(logins)]
+        self.campaigns = [
+            (campaign_id, self._get_name(campaign_id), self.logins[
+                campaign_id % logins
+            ])
+            for campaign_id in range(1, campaigns + 1)
+        ]
+        self.by_login = {login: [] for login in self.logins}
+        for campaign in self.campaigns:
+            self.by_login[campaign[2]].append(campaign)
+
+    @staticmethod
+    def _get_name(campaign_id: int) -> str:
+        """Возвращает имя кампании в формате Geo-Site_type-...-Url_type."""
+        if campaign_id % 20 == 0:
+            return f'brand_{campaign_id}'
+        parts = [
+            GEO[campaign_id % len(GEO)],
+            SITE_TYPES[campaign_id // 7 % len(SITE_TYPES)],
+            GENERATION[campaign_id // 11 % len(GENERATION)],
+            CATEGORIES[campaign_id // 13 % len(CATEGORIES)],
+            SUBJECTS[campaign_id // 17 % len(SUBJECTS)],
+            URL_TYPES[campaign_id // 19 % len(URL_TYPES)]
+        ]
+        if campaign_id % 50 == 1:
+            parts[1] = 'rmp'
+        # Часть имен короче шести частей, как в реальных кабинетах.
+        return '-'.join(parts[:6 - campaign_id % 3]) + f'_{campaign_id}'
+
+    @property
+    def campaign_names(self) -> list[str]:
+        return [name for _, name, _ in self.campaigns]
+
+    @staticmethod
+    def get_dates(date_from: str, date_to: str) -> list[str]:
+        start = dt.datetime.strptime(date_from, DATE_FORMAT)
+        end = dt.datetime.strptime(date_to, DATE_FORMAT)
+        return [
+            (start + dt.timedelta(days=i)).strftime(DATE_FORMAT)
+            for i in range((end - start).days + 1)
+        ]
+
+    @staticmethod
+    def _get_value(campaign_id: int, date_str: str, salt: int) -> int:
+        day = dt.datetime.strptime(date_str, DATE_FORMAT).toordinal()
+        return (campaign_id * 7919 + day * 104729 + salt * 1299709) % 10007
+
+    def iter_direct_rows(
+        self,
+        login: str,
+        date_from: str,
+        date_to: str
+    ):
+        """Отдает строки TSV-отчета Директа логина без заголовка."""
+        for date_str in self.get_dates(date_from, date_to):
+            for campaign_id, name, _ in self.by_login.get(login, []):
+                for i, device in enumerate(DIRECT_DEVICES):
+                    if (campaign_id + i) % 3 == 2:
+                        continue
+                    impressions = self._get_value(campaign_id, date_str, i)
+                    clicks = impressions // 37
+                    cost = clicks * 12345678 % 987654321
+                    yield (
+                        f'{date_str}\t{name}\t{campaign_id}\t{device}\t'
+                        f'{impressions}\t{clicks}\t{cost}\n'
+                    )
+
+    @functools.lru_cache(maxsize=32)
+    def get_metrica_rows(
+        self,
+        date_from: str,
+        date_to: str,
+        only_dashed: bool
+    ) -> list:
+        """Возвращает строки отчета Метрики за период."""
+        rows = []
+        for date_str in self.get_dates(date_from, date_to):
+            for campaign_id, name, _ in self.campaigns:
+                if only_dashed and '-' not in name:
+                    continue
+                for i, device in enumerate(METRICA_DEVICES):
+                    purchases = self._get_value(campaign_id, date_str, i) % 7
+                    if not purchases:
+                        continue
+                    rows.append({
+                        'dimensions': [
+                            {'name': date_str},
+                            {'name': f'{name}|{campaign_id}'},
+                            {'name': device}
+                        ],
+                        'metrics': [purchases, purchases * 1999.5]
+                    })
+        return rows
+
+    def get_appmetrica_metrics(
+        self,
+        campaign_id: int,
+        date_str: str
+    ) -> list | None:
+        """Возвращает [Revenue, Transactions] кампании за дату."""
+        orders = self._get_value(campaign_id, date_str, 5) % 4
+        if not orders:
+            return None
+        return [orders * 2499.0, orders]
+
+    @functools.lru_cache(maxsize=32)
+    def get_appmetrica_rows(self, date_from: str, date_to: str) -> list:
+        """Возвращает строки группированного отчета Аппметрики."""
+        rows = []
+        for date_str in self.get_dates(date_from, date_to):
+            for campaign_id, name, _ in self.campaigns:
+                metrics = self.get_appmetrica_metrics(campaign_id, date_str)
+                if metrics is None:
+                    continue
+                rows.append({
+                    'dimensions': [{'name': date_str}, {'name': name}],
+                    'metrics': metrics
+                })
+        return rows
+
+    @functools.cached_property
+    def ids_by_name(self) -> dict:
+        return {name: campaign_id for campaign_id, name, _ in self.campaigns}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов стенда."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(
+        self,
+        status: int,
+        body: bytes = b'',
+        headers: dict | None = None
+    ) -> None:
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, str(value))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data: dict, status: int = 200) -> None:
+        self._send(
+            status,
+            json.dumps(data, ensure_ascii=False).encode('utf-8'),
+            {'Content-Type': 'application/json; charset=utf-8'}
+        )
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        self.server.count(path)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if path != DIRECT_PATH:
+            self._send_json({'error': 'not found'}, 404)
+            return
+        self._handle_direct(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self.server.count(url.path)
+        params = {
+            key: values[0] for key, values in parse_qs(url.query).items()
+        }
+        if url.path == METRICA_PATH:
+            self._handle_metrica(params)
+        elif url.path == APPMETRICA_PATH:
+            self._handle_appmetrica(params)
+        else:
+            self._send_json({'error': 'not found'}, 404)
+
+    def _handle_direct(self, body: bytes) -> None:
+        """Офлайн-очередь отчетов Директа."""
+        server = self.server
+        login = self.headers.get('Client-Login', '')
+        criteria = json.loads(body)['params']['SelectionCriteria']
+        key = (login, body)
+        units = {'Units': '10/99990/100000', 'Units-Used-Login': login}
+        days = len(server.data.get_dates(
+            criteria['DateFrom'],
+            criteria['DateTo']
+        ))
+        if server.max_report_days and days > server.max_report_days:
+            self._send_json({'error': {
+                'error_code': 152,
+                'error_string': 'Время формирования отчета превышено'
+            }}, 502)
+            return
+
+        with server.lock:
+            state = server.reports.get(key)
+            if state is None:
+                if len(server.reports) >= server.queue_limit:
+                    self._send_json({'error': {
+                        'error_code': 9000,
+                        'error_string': 'Превышен лимит очереди отчетов'
+                    }}, 400)
+                    return
+                server.reports[key] = server.polls_to_ready
+                status = 201
+            elif state > 0:
+                server.reports[key] = state - 1
+                status = 202
+            else:
+                del server.reports[key]
+                status = 200
+
+        if status != 200:
+            self._send(
+                status,
+                headers={**units, 'retryIn': server.retry_in}
+            )
+            return
+
+        rows = ''.join(server.data.iter_direct_rows(
+            login,
+            criteria['DateFrom'],
+            criteria['DateTo']
+        ))
+        lines = []
+        if self.headers.get('skipReportHeader') != 'true':
+            lines.append(
+                f'"bench ({criteria["DateFrom"]} - {criteria["DateTo"]})"\n'
+            )
+        lines.append(
+            'Date\tCampaignName\tCampaignId\tDevice\t'
+            'Impressions\tClicks\tCost\n'
+        )
+        lines.append(rows)
+        if self.headers.get('skipReportSummary') != 'true':
+            lines.append(f'Total rows: {rows.count(chr(10))}\n')
+        self._send(
+            200,
+            ''.join(lines).encode('utf-8'),
+            {**units, 'Content-Type': 'text/tab-separated-values'}
+        )
+
+    def _send_page(self, rows: list, params: dict) -> None:
+        offset = int(params.get('offset', 1))
+        limit = int(params.get('limit', 100))
+        self._send_json({
+            'data': rows[offset - 1:offset - 1 + limit],
+            'total_rows': len(rows)
+        })
+
+    def _handle_metrica(self, params: dict) -> None:
+        """Постраничный отчет stat/v1 Метрики."""
+        rows = self.server.data.get_metrica_rows(
+            params['date1'],
+            params['date2'],
+            "=@'-'" in params.get('filters', '')
+        )
+        self._send_page(rows, params)
+
+    def _handle_appmetrica(self, params: dict) -> None:
+        """Отчет Аппметрики с фильтром по кампании или с группировкой."""
+        data = self.server.data
+        if 'utm_campaign' in params.get('dimensions', ''):
+            self._send_page(
+                data.get_appmetrica_rows(params['date1'], params['date2']),
+                params
+            )
+            return
+
+        match = re.search(r"urlParamValue=='(.*?)'", params.get('filters', ''))
+        campaign_id = data.ids_by_name.get(match.group(1)) if match else None
+        metrics = None
+        if campaign_id is not None:
+            metrics = data.get_appmetrica_metrics(campaign_id, params['date1'])
+        rows = [] if metrics is None else [{'metrics': metrics}]
+        self._send_json({'data': rows, 'total_rows': len(rows)})
+
+
+class SyntheticApiServer(ThreadingHTTPServer):
+    """
+    Сервер стенда с подсчетом запросов по путям.
+
+    polls_to_ready задает количество ответов 202 после 201 до готовности
+    отчета Директа, retry_in - значение заголовка retryIn, queue_limit -
+    лимит одновременно формируемых отчетов, max_report_days - наибольший
+    период отчета Директа в днях, на более длинные периоды стенд отвечает
+    ошибкой 502 (0 - без ограничения).
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        data: SyntheticData,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        retry_in: int = 0,
+        polls_to_ready: int = 1,
+        queue_limit: int = 5,
+        max_report_days: int = 0
+    ):
+        super().__init__((host, port), StubHandler)
+        self.data = data
+        self.retry_in = retry_in
+        self.polls_to_ready = polls_to_ready
+        self.queue_limit = queue_limit
+        self.max_report_days = max_report_days
+        self.reports = {}
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    def count(self, path: str) -> None:
+        with self.lock:
+            self.requests[path] += 1
+
+    def reset_counts(self) -> None:
+        with self.lock:
+            self.requests.clear()
+            self.reports.clear()
+
+    @property
+    def urls(self) -> dict:
+        """Переменные окружения с URL стенда для парсера."""
+        base = f'http://{self.server_address[0]}:{self.server_address[1]}'
+        return {
+            'YANDEX_DIRECT_URL': base + DIRECT_PATH,
+            'YANDEX_METRICA_URL': base + METRICA_PATH,
+            'YANDEX_APPMETRICA_URL': base + APPMETRICA_PATH
+        }
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--logins', type=int, default=180)
+    parser.add_argument('--campaigns', type=int, default=10000)
+    parser.add_argument('--retry-in', type=int, default=1)
+    parser.add_argument('--polls-to-ready', type=int, default=1)
+    parser.add_argument('--max-report-days', type=int, default=0)
+    args = parser.parse_args()
+
+    server = SyntheticApiServer(
+        SyntheticData(args.logins, args.campaigns),
+        args.host,
+        args.port,
+        args.retry_in,
+        args.polls_to_ready,
+        max_report_days=args.max_report_days
+    )
+    for key, value in server.urls.items():
+        print(f'{key}={value}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
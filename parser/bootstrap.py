@@ -0,0 +1,16 @@
+from parser.logging_config import setup_logging
+
+
+def initialize(log_name: str | None = None) -> None:
+    """
+    Единая точка инициализации приложения.
+
+    Загружает переменные окружения из .env и настраивает логирование.
+    Модули пакета при импорте ничего не настраивают, поэтому функция
+    вызывается один раз при запуске: из main или из процесса-исполнителя
+    с log_name клиента. Повторные вызовы безопасны.
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    setup_logging(log_name)
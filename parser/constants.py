@@ -1,11 +1,31 @@
-YANDEX_DIRECT_URL = 'https://api.direct.yandex.com/json/v5/reports'
-"""URL для запроса отчета из Direct."""
+import os
 
-YANDEX_METRICA_URL = 'https://api-metrika.yandex.net/stat/v1/data'
-"""URL для запроса отчета из Metrica."""
+YANDEX_DIRECT_URL = os.getenv(
+    'YANDEX_DIRECT_URL',
+    'https://api.direct.yandex.com/json/v5/reports'
+)
+"""
+URL для запроса отчета из Direct.
+Переопределяется одноименной переменной окружения, например для стенда.
+"""
 
-YANDEX_APPMETRICA_URL = 'https://api.appmetrica.yandex.ru/stat/v1/data'
-"""URL для запроса отчета из Appmetrica."""
+YANDEX_METRICA_URL = os.getenv(
+    'YANDEX_METRICA_URL',
+    'https://api-metrika.yandex.net/stat/v1/data'
+)
+"""
+URL для запроса отчета из Metrica.
+Переопределяется одноименной переменной окружения, например для стенда.
+"""
+
+YANDEX_APPMETRICA_URL = os.getenv(
+    'YANDEX_APPMETRICA_URL',
+    'https://api.appmetrica.yandex.ru/stat/v1/data'
+)
+"""
+URL для запроса отчета из Appmetrica.
+Переопределяется одноименной переменной окружения, например для стенда.
+"""
 
 DEFAULT_DELIMETER = '-'
 """Делиметр Campaign по умолчанию."""
@@ -22,6 +42,101 @@ REPORT_NAME = 'all_reports1'
 DEFAULT_FOLDER = 'data'
 """Папка для сохранения .csv файлов по умолчанию."""
 
+CSV_SEPARATOR = ';'
+"""Разделитель .csv файлов кэша."""
+
+CSV_ENCODING = 'cp1251'
+"""Кодировка .csv файлов кэша."""
+
+CSV_CHUNK_SIZE = 100000
+"""Количество строк в чанке при потоковом чтении .csv файлов кэша."""
+
+CACHE_STORAGE = 'file'
+"""
+Формат хранения кэша: 'file' - один .csv файл на источник,
+'partitioned' - партиции по дате в папке источника.
+"""
+
+PARTITION_GRANULARITY = 'month'
+"""Гранулярность партиций кэша: 'day' или 'month'."""
+
+PARTITION_EXPORT = False
+"""
+Выгружать партиции в единый .csv файл для внешних потребителей.
+Выгрузка перечитывает все партиции и перезаписывает файл целиком
+при каждом обновлении, поэтому по умолчанию выключена.
+"""
+
+CACHE_COMPRESSION = {
+    'direct': None,
+    'metrica': None,
+    'appmetrica': None,
+    'romi': None,
+}
+"""
+Сжатие .csv файлов кэша по источникам: None - без сжатия или пара
+(кодек, уровень). Кодеки: 'gzip' (уровень 1-9), 'xz' (пресет 0-9)
+и 'zstd' (уровень 1-22, нужен пакет zstandard). К имени сжатого файла
+добавляется расширение кодека, например {client}_direct.csv.gz.
+"""
+
+CACHE_COMPRESSION_SUFFIXES = {
+    'gzip': '.gz',
+    'xz': '.xz',
+    'zstd': '.zst',
+}
+"""Расширения сжатых .csv файлов кэша по кодекам."""
+
+DB_BACKEND = os.getenv('YANDEX_PARSER_DB', '')
+"""
+База данных, в которую дублируются выгрузки: '' - не писать,
+'sqlite' или 'mysql'. Переопределяется переменной окружения
+YANDEX_PARSER_DB.
+"""
+
+DB_BACKENDS = ('sqlite', 'mysql')
+"""Поддерживаемые базы данных."""
+
+DB_SQLITE_FILENAME = 'yandex_parser.sqlite3'
+"""Имя файла базы SQLite в папке данных."""
+
+DB_BATCH_SIZE = 10000
+"""Количество строк, записываемых в базу в одной транзакции."""
+
+DB_DELETE_BATCH_SIZE = 7
+"""
+Количество обновляемых дат, которые удаляются из таблицы и записываются
+заново в одной транзакции.
+"""
+
+DB_TIMEOUT = 60
+"""
+Время ожидания блокировки базы SQLite другим процессом в секундах.
+Файл базы общий для процессов --workers.
+"""
+
+DIRECT_QUEUE_MODE = False
+"""
+Режим очереди офлайн-отчетов Директа: отчеты по всем логинам ставятся
+в очередь заранее и опрашиваются совместно. По умолчанию выключен:
+отчеты запрашиваются последовательно, как раньше.
+"""
+
+DIRECT_QUEUE_LIMIT = 5
+"""
+Максимальное количество отчетов в офлайн-очереди Директа (5),
+не меньше 1.
+"""
+
+DIRECT_RETRY_IN = 60
+"""Интервал повторного запроса отчета Директа по умолчанию в секундах."""
+
+DIRECT_UNITS_LOW_WATERMARK = 0.1
+"""Доля суточного лимита баллов, ниже которой запросы Директа замедляются."""
+
+DIRECT_UNITS_MAX_BACKOFF = 300
+"""Максимальная пауза при исчерпании баллов Директа в секундах."""
+
 DAYS_TO_GENERATE_DIRECT = 45
 """Количество дней для генерации списка дат по умолчанию."""
 
@@ -31,6 +146,27 @@ DAYS_TO_GENERATE_METRICA = 4
 DAYS_TO_GENERATE_APPMETRICA = 1
 """Количество дней для генерации списка дат по умолчанию."""
 
+INCREMENTAL_REFRESH = True
+"""
+Инкрементальное обновление: список дат строится по файлу состояния,
+а DAYS_TO_GENERATE_* задают лишь максимальную глубину обновления.
+"""
+
+FINALIZATION_DAYS_DIRECT = 14
+"""Через сколько дней данные Яндекс Директ считаются окончательными."""
+
+FINALIZATION_DAYS_METRICA = 4
+"""Через сколько дней данные Яндекс Метрики считаются окончательными."""
+
+FINALIZATION_DAYS_APPMETRICA = 1
+"""Через сколько дней данные Яндекс Аппметрики считаются окончательными."""
+
+STATE_FOLDER = 'state'
+"""Папка файлов состояния инкрементального обновления."""
+
+STATE_KEEP_DAYS = 400
+"""Сколько дней хранить записи о выгруженных датах в файле состояния."""
+
 DAYS_BEFORE = 7
 """Период в днях (7)."""
 
@@ -58,6 +194,129 @@ APPMETRICA_LIMIT = '1000'
 METRICA_LIMIT = 10000
 """Лимит выдачи данных (10000)"""
 
+METRICA_SERVER_FILTER = True
+"""Фильтровать кампании Метрики на стороне сервера."""
+
+METRICA_CAMPAIGN_FILTER = "ym:s:lastsignDirectClickOrder=@'-'"
+"""
+Фильтр Метрики: только кампании, в имени которых есть '-'.
+Задается по тому же измерению, по которому группируется отчет.
+"""
+
+METRICA_REPORT_SAVINGS = False
+"""
+Логировать экономию строк и байт от серверной фильтрации Метрики.
+Требует дополнительного запроса отчета без фильтра.
+"""
+
+HTTP_POOL_CONNECTIONS = 4
+"""Количество пулов соединений (хостов) в общем HTTP-транспорте."""
+
+HTTP_POOL_MAXSIZE = 16
+"""Максимальное количество keep-alive соединений на хост."""
+
+HTTP_TIMEOUT = (10, 300)
+"""Таймауты HTTP-запросов (подключение, чтение) в секундах."""
+
+RETRY_MAX_ATTEMPTS = 5
+"""Максимальное количество попыток запроса к API."""
+
+RETRY_BASE_DELAY = 2
+"""Базовая задержка экспоненциальных повторов в секундах."""
+
+RETRY_MAX_DELAY = 120
+"""Максимальная задержка между повторами в секундах."""
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+"""Коды ответа API, после которых запрос повторяется."""
+
+DIRECT_RETRY_STATUSES = (429, 500, 503, 504)
+"""
+Коды ответа Директа, после которых запрос повторяется.
+502 не повторяется: Директ так сообщает о превышении времени
+формирования отчета.
+"""
+
+POLL_GROWTH_FACTOR = 0.25
+"""Доля времени формирования отчета, задающая паузу между опросами."""
+
+POLL_MAX_DELAY = 300
+"""Максимальная пауза между опросами отчета в секундах."""
+
+HTTP_CACHE_FOLDER = 'cache'
+"""Папка дискового кэша ответов API."""
+
+HTTP_CACHE_BYPASS_ENV = 'YANDEX_PARSER_NO_CACHE'
+"""Переменная окружения, значение '1' которой отключает кэш ответов."""
+
+HTTP_CACHE_MAX_BYTES = 2 * 1024 ** 3
+"""Максимальный размер кэша ответов API в байтах (2 ГБ)."""
+
+HTTP_CACHE_EVICT_RATIO = 0.9
+"""
+Доля HTTP_CACHE_MAX_BYTES, до которой очищается переполненный кэш
+ответов, чтобы следующие записи не запускали очистку снова.
+"""
+
+HTTP_CACHE_CHUNK_SIZE = 1024 * 1024
+"""Размер части тела ответа при записи в кэш ответов в байтах."""
+
+HTTP_CACHE_TTL_YESTERDAY = 3 * 60 * 60
+"""Срок хранения ответов с данными за вчера в секундах (3 часа)."""
+
+HTTP_CACHE_TTL_RECENT = 12 * 60 * 60
+"""Срок хранения ответов с датами внутри окна атрибуции (12 часов)."""
+
+HTTP_CACHE_ATTRIBUTION_DAYS = 7
+"""
+Окно атрибуции в днях. Ответы с датами старше окна кэшируются бессрочно.
+"""
+
+LOG_REQUEST_SAMPLE_RATE = 0.01
+"""
+Доля записываемых строк логов отдельных запросов к API (уровень DEBUG):
+1 - все строки, 0 - ни одной.
+"""
+
+LOG_REQUEST_RATE_LIMIT = 5
+"""Максимальное количество строк логов запросов к API в секунду."""
+
+METRICS_FOLDER = 'metrics'
+"""Папка файлов метрик выгрузки для Prometheus и JSON-сводки."""
+
+METRICS_FILENAME = 'yandex_parser'
+"""Имя файлов метрик выгрузки без расширения."""
+
+METRICS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+"""Границы корзин гистограмм длительности в секундах."""
+
+APPMETRICA_MAX_WORKERS = 8
+"""Количество одновременных запросов к Аппметрике (8)."""
+
+APPMETRICA_GROUPED_MODE = False
+"""
+Группированный режим Аппметрики: постраничный запрос на каждую дату
+с кампанией в измерениях вместо запроса на каждую кампанию и дату.
+Устройства отбираются тем же окном DAYS_BEFORE дней, что и в запросе
+по одной кампании.
+"""
+
+APPMETRICA_CAMPAIGN_DIMENSION = "ym:ec2:urlParameter{'utm_campaign'}"
+"""Измерение кампании для группированного режима Аппметрики."""
+
+APPMETRICA_RECENT_CAMPAIGNS = False
+"""
+Запрашивать в Аппметрике только кампании из последней выгрузки Директа.
+По умолчанию запрашиваются все кампании из файла Директа, включая
+кампании без расходов в обновленном периоде.
+"""
+
+HOST_RATE_LIMITS = {
+    'api.appmetrica.yandex.ru': 10,
+    'api-metrika.yandex.net': 10,
+}
+"""Допустимое количество запросов в секунду для хостов API."""
+
 DEFAULT_COLUMNS_CAMPAIGN = [
     'Geo',
     'Site_type',
@@ -68,6 +327,9 @@ DEFAULT_COLUMNS_CAMPAIGN = [
 ]
 """Поля для разбивки Campaign."""
 
+CAMPAIGN_CACHE_SIZE = 100000
+"""Размер кэша разобранных имен кампаний."""
+
 REPORT_FIELDS_DIRECT = [
     "Date",
     "CampaignName",
@@ -79,6 +341,15 @@ REPORT_FIELDS_DIRECT = [
 ]
 """Запрашиваемые поля для Яндекс Директ."""
 
+DIRECT_CHUNK_SIZE = 100000
+"""Количество строк в чанке при потоковом разборе отчета Директа."""
+
+DIRECT_SHARD_MAX_ROWS = 1000000
+"""
+Ожидаемое количество строк одного отчета Директа, выше которого период
+логина заранее разбивается на части по истории выгрузок. 0 - не разбивать.
+"""
+
 REPORT_FIELDS_APPMETRICA = [
     'Date',
     'CampaignName',
@@ -197,6 +468,27 @@ EAPTEKA_CLIENT_LOGINS = [
 """Список логинов Еаптека."""
 
 
+NATURAL_KEY_DIRECT = ['Date', 'CampaignId', 'Device', 'Account']
+"""Естественный ключ строки отчета Яндекс Директ."""
+
+NATURAL_KEY_METRICA = ['Date', 'CampaignName', 'Device']
+"""Естественный ключ строки отчета Яндекс Метрики."""
+
+NATURAL_KEY_APPMETRICA = ['Date', 'CampaignName', 'Device']
+"""Естественный ключ строки отчета Яндекс Аппметрики."""
+
+NATURAL_KEY_ROMI = ['Date', *DEFAULT_COLUMNS_CAMPAIGN, 'Device', 'Source']
+"""
+Естественный ключ строки витрины ROMI: дата, части кампании, устройство
+и источник.
+"""
+
+ROMI_SOURCE = 'yandex'
+"""
+Источник строк Метрики и Аппметрики в витрине ROMI: выручка
+атрибутирована последнему клику Директа.
+"""
+
 DEVICES = {
     'PC': 'DESKTOP',
     'Smartphones': 'MOBILE',
@@ -0,0 +1,334 @@
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+import pandas as pd
+
+from parser.constants import (
+    DB_BACKEND,
+    DB_BACKENDS,
+    DB_BATCH_SIZE,
+    DB_DELETE_BATCH_SIZE,
+    DB_SQLITE_FILENAME,
+    DB_TIMEOUT,
+    DEFAULT_FOLDER
+)
+from parser.decorators import connection_db
+from parser.metrics import registry
+
+
+class DatabaseSink:
+    """
+    Запись выгрузок источников в таблицы базы данных.
+
+    Таблица источника создается по колонкам первых данных с первичным
+    ключом по естественному ключу строки, который начинается с Date,
+    поэтому запросы по датам идут по индексу. Новые строки сначала
+    записываются во временную таблицу подключения. Затем обновляемые
+    даты заменяются пачками по delete_batch_size дат: в одной транзакции
+    из таблицы удаляются строки дат пачки и записываются новые строки
+    этих дат через REPLACE. Читатели не видят дат без строк, а после
+    сбоя каждая дата остается либо старой, либо новой.
+    Основная база - MySQL (пакет mysql-connector-python), локально
+    и в проверках используется SQLite с ожиданием блокировки timeout
+    секунд, так как файл базы общий для процессов --workers.
+    """
+
+    def __init__(
+        self,
+        backend: str = DB_BACKEND,
+        path: Path | None = None,
+        batch_size: int = DB_BATCH_SIZE,
+        delete_batch_size: int = DB_DELETE_BATCH_SIZE,
+        timeout: float = DB_TIMEOUT
+    ):
+        if backend not in DB_BACKENDS:
+            raise ValueError(f'Неизвестная база данных: {backend}')
+        self.backend = backend
+        self.path = path or (
+            Path(__file__).parent.parent / DEFAULT_FOLDER / DB_SQLITE_FILENAME
+        )
+        self.batch_size = batch_size
+        self.delete_batch_size = delete_batch_size
+        self.timeout = timeout
+        self.placeholder = '?' if backend == 'sqlite' else '%s'
+
+    def connect(self):
+        """Метод открывает подключение к базе данных."""
+        if self.backend == 'sqlite':
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            return sqlite3.connect(self.path, timeout=self.timeout)
+        try:
+            import mysql.connector
+        except ImportError:
+            logging.error(
+                'Для записи в MySQL установите mysql-connector-python'
+            )
+            raise
+        from parser.db_config import config
+
+        return mysql.connector.connect(**config)
+
+    def _quote(self, name: str) -> str:
+        """Защищенный метод. Экранирует имя таблицы или колонки."""
+        if self.backend == 'mysql':
+            return f'`{name}`'
+        return f'"{name}"'
+
+    def _placeholders(self, values: list) -> str:
+        """Защищенный метод. Возвращает список параметров для IN (...)."""
+        return ', '.join([self.placeholder] * len(values))
+
+    @staticmethod
+    def _get_column_type(dtype) -> str:
+        """Защищенный метод. Возвращает SQL-тип колонки по типу pandas."""
+        if pd.api.types.is_integer_dtype(dtype):
+            return 'BIGINT'
+        if pd.api.types.is_float_dtype(dtype):
+            return 'DOUBLE'
+        return 'VARCHAR(255)'
+
+    def _create_table(
+        self,
+        cursor,
+        table: str,
+        df: pd.DataFrame,
+        natural_key: list
+    ) -> None:
+        """
+        Защищенный метод. Создает таблицу по колонкам df, если ее нет,
+        и временную таблицу для новых строк.
+        Колонки естественного ключа объявляются NOT NULL.
+        """
+        columns = [
+            f'{self._quote(column)} {self._get_column_type(dtype)}'
+            + (' NOT NULL' if column in natural_key else '')
+            for column, dtype in df.dtypes.items()
+        ]
+        key = ', '.join(self._quote(column) for column in natural_key)
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {self._quote(table)} '
+            f'({", ".join(columns)}, PRIMARY KEY ({key}))'
+        )
+        cursor.execute(
+            'CREATE TEMPORARY TABLE '
+            f'{self._quote(self._get_staging_table(table))} '
+            f'({", ".join(columns)})'
+        )
+
+    @staticmethod
+    def _get_staging_table(table: str) -> str:
+        """
+        Защищенный метод. Возвращает имя временной таблицы новых строк.
+        """
+        return f'{table}_new'
+
+    def _table_exists(self, cursor, table: str) -> bool:
+        """Защищенный метод. Проверяет, что таблица есть в базе."""
+        if self.backend == 'sqlite':
+            cursor.execute(
+                "SELECT name FROM sqlite_master "
+                "WHERE type = 'table' AND name = ?",
+                (table,)
+            )
+        else:
+            cursor.execute('SHOW TABLES LIKE %s', (table,))
+        return cursor.fetchone() is not None
+
+    def _get_rows(self, df: pd.DataFrame, natural_key: list) -> list:
+        """
+        Защищенный метод. Преобразует DataFrame в список кортежей
+        значений Python. Пропуски становятся NULL, а в колонках
+        естественного ключа - пустыми строками.
+        """
+        values = df.astype(object).to_numpy()
+        missing = pd.isna(values)
+        values[missing] = None
+        for i, column in enumerate(df.columns):
+            if column in natural_key:
+                values[missing[:, i], i] = ''
+        return list(map(tuple, values))
+
+    def _stage_rows(
+        self,
+        connection,
+        cursor,
+        table: str,
+        df: pd.DataFrame,
+        natural_key: list
+    ) -> int:
+        """
+        Защищенный метод. Записывает строки df во временную таблицу
+        пачками по batch_size строк и возвращает количество строк.
+        """
+        columns = ', '.join(self._quote(column) for column in df.columns)
+        values = ', '.join([self.placeholder] * len(df.columns))
+        query = (
+            f'INSERT INTO {self._quote(self._get_staging_table(table))} '
+            f'({columns}) VALUES ({values})'
+        )
+        for i in range(0, len(df), self.batch_size):
+            cursor.executemany(
+                query,
+                self._get_rows(df.iloc[i:i + self.batch_size], natural_key)
+            )
+        connection.commit()
+        return len(df)
+
+    def _replace_dates(
+        self,
+        connection,
+        cursor,
+        table: str,
+        columns: list | None,
+        dates_list: list,
+        scope: dict | None
+    ) -> None:
+        """
+        Защищенный метод. Переносит новые строки из временной таблицы
+        в таблицу table.
+
+        Для каждой пачки по delete_batch_size обновляемых дат в одной
+        транзакции удаляются строки дат пачки, значения колонок которых
+        входят в scope ({колонка: значения}, пустой словарь - все строки
+        дат), и записываются новые строки этих дат. Даты удаляются, даже
+        если новых строк нет. При scope None строки не удаляются. Новые
+        строки других дат записываются последней транзакцией.
+        columns - колонки новых строк, None - новых строк нет.
+        """
+        date_column = self._quote('Date')
+        delete = None
+        if scope is not None and all(scope.values()):
+            delete = f'DELETE FROM {self._quote(table)} WHERE ' + ''.join(
+                f'{self._quote(column)} IN ({self._placeholders(values)}) AND '
+                for column, values in scope.items()
+            ) + date_column
+            scope_params = [
+                value for values in scope.values() for value in values
+            ]
+        insert = None
+        if columns is not None:
+            column_list = ', '.join(self._quote(column) for column in columns)
+            insert = (
+                f'REPLACE INTO {self._quote(table)} ({column_list}) '
+                f'SELECT {column_list} '
+                f'FROM {self._quote(self._get_staging_table(table))} '
+                f'WHERE {date_column}'
+            )
+
+        for i in range(0, len(dates_list), self.delete_batch_size):
+            dates = dates_list[i:i + self.delete_batch_size]
+            if delete is not None:
+                cursor.execute(
+                    f'{delete} IN ({self._placeholders(dates)})',
+                    [*scope_params, *dates]
+                )
+            if insert is not None:
+                cursor.execute(
+                    f'{insert} IN ({self._placeholders(dates)})',
+                    dates
+                )
+            connection.commit()
+        if insert is not None:
+            if dates_list:
+                cursor.execute(
+                    f'{insert} NOT IN ({self._placeholders(dates_list)})',
+                    dates_list
+                )
+            else:
+                cursor.execute(f'{insert} IS NOT NULL')
+            connection.commit()
+
+    @connection_db
+    def write(
+        self,
+        table: str,
+        df_new: pd.DataFrame,
+        dates_list: list,
+        natural_key: list,
+        scope: dict | None,
+        connection=None,
+        cursor=None
+    ) -> int:
+        """
+        Метод заменяет в таблице table обновляемые даты dates_list
+        строками df_new и возвращает количество записанных строк.
+        scope - ограничение удаления дат, см. _replace_dates.
+        """
+        with registry.timer('db_write_seconds', table=table):
+            columns = None
+            rows = 0
+            if not df_new.empty:
+                self._create_table(cursor, table, df_new, natural_key)
+                rows = self._stage_rows(
+                    connection,
+                    cursor,
+                    table,
+                    df_new,
+                    natural_key
+                )
+                columns = list(df_new.columns)
+            if columns is not None or self._table_exists(cursor, table):
+                self._replace_dates(
+                    connection,
+                    cursor,
+                    table,
+                    columns,
+                    dates_list,
+                    scope
+                )
+        registry.inc('db_rows_total', rows, table=table)
+        logging.info(f'Таблица {table} обновлена, записано строк: {rows}')
+        return rows
+
+    @connection_db
+    def write_chunks(
+        self,
+        table: str,
+        chunks: Iterable[pd.DataFrame],
+        dates_list: list,
+        natural_key: list,
+        get_scope: Callable[[], dict | None] = dict,
+        connection=None,
+        cursor=None
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Метод заменяет в таблице table обновляемые даты dates_list
+        строками, поступающими чанками, и отдает чанки дальше.
+
+        Чанки по мере поступления записываются во временную таблицу,
+        поэтому их можно одновременно сохранять в файл кэша, не держа
+        в памяти. Таблица table обновляется после получения всех чанков,
+        get_scope возвращает ограничение удаления дат, см. _replace_dates.
+        """
+        rows = 0
+        columns = None
+        for df in chunks:
+            if df.empty:
+                yield df
+                continue
+            with registry.timer('db_write_seconds', table=table):
+                if columns is None:
+                    self._create_table(cursor, table, df, natural_key)
+                    columns = list(df.columns)
+                rows += self._stage_rows(
+                    connection,
+                    cursor,
+                    table,
+                    df[columns],
+                    natural_key
+                )
+            yield df
+        with registry.timer('db_write_seconds', table=table):
+            if columns is not None or self._table_exists(cursor, table):
+                self._replace_dates(
+                    connection,
+                    cursor,
+                    table,
+                    columns,
+                    dates_list,
+                    get_scope()
+                )
+        registry.inc('db_rows_total', rows, table=table)
+        logging.info(f'Таблица {table} обновлена, записано строк: {rows}')
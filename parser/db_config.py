@@ -0,0 +1,13 @@
+import os
+
+config = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': int(os.getenv('DB_PORT', '3306')),
+    'user': os.getenv('DB_USER'),
+    'password': os.getenv('DB_PASSWORD'),
+    'database': os.getenv('DB_NAME')
+}
+"""
+Параметры подключения к MySQL из переменных окружения.
+Модуль импортируется при подключении, после загрузки .env.
+"""
@@ -1,13 +1,8 @@
 import functools
+import inspect
 import logging
 import time
 from datetime import datetime as dt
-# import mysql.connector
-# from parser.db_config import config
-from parser.logging_config import setup_logging
-
-
-setup_logging()
 
 
 def time_of_function(func):
@@ -39,51 +34,76 @@ def time_of_function(func):
     return wrapper
 
 
-# def connection_db(func):
-#     """
-#     Декоратор для подключения к базе данных.
+def connection_db(func):
+    """
+    Декоратор для подключения к базе данных.
 
-#     Подключается к базе данных, обрабатывает ошибки в процессе подключения,
-#     логирует все успешные/неуспешные действия, вызывает функцию, выполняющую
-#     действия в базе данных и закрывает подключение.
+    Подключается к базе данных методом connect объекта, обрабатывает ошибки
+    в процессе подключения, логирует все неуспешные действия, вызывает
+    метод, выполняющий действия в базе данных, и закрывает подключение.
+    Подключение и курсор передаются в метод аргументами connection
+    и cursor. Метод-генератор держит подключение открытым, пока генератор
+    не будет исчерпан или закрыт.
 
-#     Args:
-#         func (callable): Декорируемая функция, которая выполняет
-#         действия с базой данных.
+    Args:
+        func (callable): Декорируемый метод, который выполняет
+        действия с базой данных.
+
+    Returns:
+        callable: Обёрнутый метод с добавленной функциональностью
+        подключения к базе данных и логирования.
+    """
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(self, *args, **kwargs):
+            connection = self.connect()
+            cursor = connection.cursor()
+            try:
+                kwargs['connection'] = connection
+                kwargs['cursor'] = cursor
+                result = yield from func(self, *args, **kwargs)
+                connection.commit()
+                return result
+            except Exception as e:
+                connection.rollback()
+                logging.error(f'Ошибка в {func.__name__}: {str(e)}')
+                raise
+            finally:
+                cursor.close()
+                connection.close()
+        return generator_wrapper
 
-#     Returns:
-#         callable: Обёрнутая функция с добавленной функциональностью
-#         подключения к базе данных и логирования.
-#     """
-#     def wrapper(*args, **kwargs):
-#         connection = mysql.connector.connect(**config)
-#         cursor = connection.cursor()
-#         try:
-#             kwargs['cursor'] = cursor
-#             result = func(*args, **kwargs)
-#             connection.commit()
-#             return result
-#         except Exception as e:
-#             connection.rollback()
-#             logging.error(f'Ошибка в {func.__name__}: {str(e)}', exc_info=True)
-#             raise
-#         finally:
-#             cursor.close()
-#             connection.close()
-#     return wrapper
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        connection = self.connect()
+        cursor = connection.cursor()
+        try:
+            kwargs['connection'] = connection
+            kwargs['cursor'] = cursor
+            result = func(self, *args, **kwargs)
+            connection.commit()
+            return result
+        except Exception as e:
+            connection.rollback()
+            logging.error(f'Ошибка в {func.__name__}: {str(e)}')
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+    return wrapper
 
 
 def time_of_script(func):
     """Декортаор для измерения времени работы всего приложения."""
     @functools.wraps(func)
-    def wrapper():
+    def wrapper(*args, **kwargs):
         date_str = dt.now().strftime('%Y-%m-%d')
         time_str = dt.now().strftime('%H:%M:%S')
         run_id = str(int(time.time()))
         print(f'Функция main начала работу {date_str} в {time_str}')
         start_time = time.time()
         try:
-            result = func()
+            result = func(*args, **kwargs)
             execution_time = round(time.time() - start_time, 3)
             print(
                 'Функция main завершила '
@@ -91,9 +111,24 @@ def time_of_script(func):
                 f' Время выполнения - {execution_time} сек. '
                 f'или {round(execution_time / 60, 2)} мин.'
             )
-            logging.info('SCRIPT_FINISHED_STATUS=SUCCESS')
+            outcomes = result if isinstance(result, list) else []
+            failed = [
+                outcome['client'] for outcome in outcomes
+                if outcome['status'] != 'SUCCESS'
+            ]
+            status = 'ERROR' if failed else 'SUCCESS'
+            logging.info(f'SCRIPT_FINISHED_STATUS={status}')
             logging.info(f'DATE={date_str}')
             logging.info(f'EXECUTION_TIME={execution_time} сек')
+            for outcome in outcomes:
+                logging.info(
+                    f'CLIENT={outcome["client"]}, '
+                    f'STATUS={outcome["status"]}, '
+                    f'WALL_TIME={outcome["wall_time"]} сек, '
+                    f'CPU_TIME={outcome["cpu_time"]} сек'
+                )
+            if failed:
+                logging.info(f'FAILED_CLIENTS={", ".join(failed)}')
             logging.info(f'FUNCTION_NAME={func.__name__}')
             logging.info(f'RUN_ID={run_id}')
             logging.info('ENDLOGGING=1')
@@ -0,0 +1,198 @@
+import datetime as dt
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Iterable
+
+from parser.constants import (
+    DATE_FORMAT,
+    HTTP_CACHE_ATTRIBUTION_DAYS,
+    HTTP_CACHE_EVICT_RATIO,
+    HTTP_CACHE_FOLDER,
+    HTTP_CACHE_MAX_BYTES,
+    HTTP_CACHE_TTL_RECENT,
+    HTTP_CACHE_TTL_YESTERDAY
+)
+
+
+class ResponseCache:
+    """
+    Дисковый кэш ответов API, адресуемый по содержимому запроса.
+
+    Ключ - sha256 от URL, параметров или тела запроса и Client-Login.
+    Срок хранения зависит от последней даты отчета: данные за сегодня
+    не кэшируются, за вчера хранятся недолго, а даты за пределами окна
+    атрибуции считаются закрытыми и хранятся бессрочно. Общий размер
+    кэша ограничен, при превышении удаляются давно не читавшиеся записи.
+    Размер кэша считается обходом каталога один раз, дальше ведется
+    счетчиком записанных байт, каталог повторно обходится только
+    при превышении лимита, очистка освобождает запас до следующего.
+    """
+
+    def __init__(
+        self,
+        path: Path | None = None,
+        max_bytes: int = HTTP_CACHE_MAX_BYTES,
+        enabled: bool = True,
+        evict_ratio: float = HTTP_CACHE_EVICT_RATIO
+    ):
+        self.path = path or Path(__file__).parent.parent / HTTP_CACHE_FOLDER
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.evict_ratio = evict_ratio
+        self._lock = threading.Lock()
+        self._size = None
+
+    @staticmethod
+    def make_key(
+        url: str,
+        params: dict | None = None,
+        body: str | None = None,
+        login: str | None = None
+    ) -> str:
+        """Метод возвращает ключ кэша для запроса."""
+        payload = json.dumps(
+            [url, params or {}, body or '', login or ''],
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def get_ttl(date_to: str) -> float | None:
+        """
+        Метод возвращает срок хранения в секундах для отчета, последняя
+        дата которого date_to. 0 - не кэшировать, None - хранить бессрочно.
+        """
+        today = dt.date.today()
+        days_ago = (today - dt.datetime.strptime(
+            date_to,
+            DATE_FORMAT
+        ).date()).days
+        if days_ago <= 0:
+            return 0
+        if days_ago == 1:
+            return HTTP_CACHE_TTL_YESTERDAY
+        if days_ago <= HTTP_CACHE_ATTRIBUTION_DAYS:
+            return HTTP_CACHE_TTL_RECENT
+        return None
+
+    def should_store(self, ttl: float | None) -> bool:
+        """Метод проверяет, нужно ли сохранять ответ со сроком ttl."""
+        return self.enabled and ttl != 0
+
+    def _get_paths(self, key: str) -> tuple[Path, Path]:
+        """Защищенный метод. Возвращает пути к телу и метаданным записи."""
+        folder = self.path / key[:2]
+        return folder / f'{key}.body', folder / f'{key}.json'
+
+    def get(self, key: str) -> Path | None:
+        """
+        Метод возвращает путь к телу закэшированного ответа
+        или None, если записи нет или она устарела.
+        """
+        if not self.enabled:
+            return None
+        body_path, meta_path = self._get_paths(key)
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        ttl = meta.get('ttl')
+        if ttl is not None and time.time() > meta['stored_at'] + ttl:
+            return None
+        try:
+            os.utime(body_path)
+        except FileNotFoundError:
+            return None
+        return body_path
+
+    def put(
+        self,
+        key: str,
+        chunks: Iterable[bytes],
+        ttl: float | None
+    ) -> Path:
+        """
+        Метод сохраняет тело ответа, поступающее частями chunks,
+        и возвращает путь к нему.
+        """
+        body_path, meta_path = self._get_paths(key)
+        body_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = body_path.with_name(
+            f'{body_path.name}.{os.getpid()}.{threading.get_ident()}.tmp'
+        )
+        size = 0
+        with open(temp_path, 'wb') as file:
+            for chunk in chunks:
+                size += file.write(chunk)
+        try:
+            size -= body_path.stat().st_size
+        except FileNotFoundError:
+            pass
+        os.replace(temp_path, body_path)
+        meta_path.write_text(
+            json.dumps({'stored_at': time.time(), 'ttl': ttl}),
+            encoding='utf-8'
+        )
+        if self._add_size(size) > self.max_bytes:
+            self.evict()
+        return body_path
+
+    def _scan(self) -> list:
+        """
+        Защищенный метод. Возвращает время доступа, размер и путь
+        каждого тела ответа в кэше.
+        """
+        bodies = []
+        for path in self.path.glob('*/*.body'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            bodies.append((stat.st_mtime, stat.st_size, path))
+        return bodies
+
+    def _add_size(self, size: int) -> int:
+        """
+        Защищенный метод. Прибавляет size к счетчику размера кэша
+        и возвращает новый размер. При первом вызове размер считается
+        обходом каталога.
+        """
+        with self._lock:
+            if self._size is None:
+                self._size = sum(
+                    body_size for _, body_size, _ in self._scan()
+                )
+            else:
+                self._size += size
+            return self._size
+
+    def evict(self) -> None:
+        """
+        Метод удаляет давно не читавшиеся записи, если размер кэша
+        превышает max_bytes, пока он не опустится до доли evict_ratio
+        от max_bytes.
+        """
+        with self._lock:
+            bodies = self._scan()
+            total = sum(size for _, size, _ in bodies)
+            self._size = total
+            if total <= self.max_bytes:
+                return
+            removed = 0
+            for _, size, path in sorted(bodies):
+                if total <= self.max_bytes * self.evict_ratio:
+                    break
+                path.unlink(missing_ok=True)
+                path.with_suffix('.json').unlink(missing_ok=True)
+                total -= size
+                removed += 1
+            self._size = total
+            logging.info(f'Из кэша ответов удалено записей: {removed}')
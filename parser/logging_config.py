@@ -1,10 +1,87 @@
+import atexit
 import logging
 import os
+import queue
+import threading
+import time
 from datetime import datetime as dt
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
+from parser.constants import LOG_REQUEST_RATE_LIMIT, LOG_REQUEST_SAMPLE_RATE
+from parser.metrics import registry
 
-def setup_logging():
+REQUEST_LOGGER_NAME = 'yandex_parser.requests'
+
+request_logger = logging.getLogger(REQUEST_LOGGER_NAME)
+"""
+Логгер строк об отдельных запросах к API. Строки пишутся с уровнем
+DEBUG и проходят выборку и ограничение частоты RequestLogFilter.
+"""
+
+_configured = False
+_configured_log_name = None
+_listener = None
+_listener_pid = None
+
+
+class RequestLogFilter(logging.Filter):
+    """
+    Фильтр строк логов отдельных запросов.
+
+    Пропускает каждую round(1 / sample_rate)-ю строку и не больше
+    rate_limit строк в секунду. Количество записанных и отброшенных
+    строк учитывается в метрике request_log_lines_total.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = LOG_REQUEST_SAMPLE_RATE,
+        rate_limit: int = LOG_REQUEST_RATE_LIMIT
+    ):
+        super().__init__()
+        self.every = round(1 / sample_rate) if sample_rate > 0 else 0
+        self.rate_limit = rate_limit
+        self._seen = 0
+        self._window_start = 0.0
+        self._window_count = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        with self._lock:
+            self._seen += 1
+            passed = bool(self.every) and (self._seen - 1) % self.every == 0
+            if passed and self.rate_limit:
+                now = time.monotonic()
+                if now - self._window_start >= 1:
+                    self._window_start = now
+                    self._window_count = 0
+                passed = self._window_count < self.rate_limit
+                self._window_count += passed
+        registry.inc(
+            'request_log_lines_total',
+            status='written' if passed else 'dropped'
+        )
+        return passed
+
+
+def _stop_listener() -> None:
+    """
+    Останавливает поток записи логов, дописывая очередь в файл,
+    и закрывает файл. Поток, унаследованный от родительского процесса,
+    не трогается.
+    """
+    global _listener
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+    _listener = None
+
+
+atexit.register(_stop_listener)
+
+
+def setup_logging(log_name: str | None = None):
     """
     Настройка логирования приложения.
 
@@ -17,13 +94,32 @@ def setup_logging():
 
     Логи сохраняются в папку 'logs' с именем файла в формате ГГГГ-ММ-ДД.log.
     Автоматически создает папку логов, если она не существует.
+
+    Записи не пишутся в файл в потоке, который их создал: обработчик
+    QueueHandler кладет их в очередь, а файл пишет отдельный поток
+    QueueListener. Очередь дописывается в файл при завершении процесса.
+    Строки логгера request_logger записываются с уровнем DEBUG через
+    фильтр RequestLogFilter.
+
+    Если передан log_name, логи пишутся в отдельный файл
+    ГГГГ-ММ-ДД_{log_name}.log, а ранее настроенные обработчики заменяются.
+    Используется в процессах-исполнителях, чтобы логи клиентов
+    не смешивались.
+
+    Повторный вызов ничего не делает, если логирование уже настроено
+    и не запрошен другой log_name.
     """
+    global _configured, _configured_log_name, _listener, _listener_pid
+    if _configured and log_name in (None, _configured_log_name):
+        return
     log_dir = os.path.abspath(
         os.path.join(os.path.dirname(__file__), '..', 'logs')
     )
     os.makedirs(log_dir, exist_ok=True)
 
     log_filename = dt.now().strftime('%Y-%m-%d.log')
+    if log_name:
+        log_filename = dt.now().strftime(f'%Y-%m-%d_{log_name}.log')
     log_filepath = os.path.join(log_dir, log_filename)
 
     handler = RotatingFileHandler(
@@ -32,16 +128,32 @@ def setup_logging():
         backupCount=3,
         encoding='utf-8'
     )
+    handler.setFormatter(logging.Formatter(
+        '%(asctime)s, '
+        '%(filename)s, '
+        '%(funcName)s, '
+        '%(levelname)s, '
+        '%(message)s, '
+        '%(name)s'
+    ))
 
+    _stop_listener()
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
     logging.basicConfig(
         level=logging.INFO,
-        format=(
-            '%(asctime)s, '
-            '%(filename)s, '
-            '%(funcName)s, '
-            '%(levelname)s, '
-            '%(message)s, '
-            '%(name)s'
-        ),
-        handlers=[handler]
+        handlers=[queue_handler],
+        force=True
     )
+    _listener = QueueListener(log_queue, handler)
+    _listener_pid = os.getpid()
+    _listener.start()
+
+    request_logger.setLevel(logging.DEBUG)
+    for log_filter in list(request_logger.filters):
+        request_logger.removeFilter(log_filter)
+    request_logger.addFilter(RequestLogFilter())
+
+    _configured = True
+    _configured_log_name = log_name
@@ -1,21 +1,172 @@
-from parser.constants import CLIENT_INFO
+import argparse
+import logging
+import time
+from typing import TYPE_CHECKING
+
+from parser.bootstrap import initialize
+from parser.constants import CLIENT_INFO, METRICS_FILENAME
 from parser.decorators import time_of_script
-from parser.utils import initialize_components, run
+from parser.metrics import registry
 
+if TYPE_CHECKING:
+    from parser.throttling import UnitsScheduler
+    from parser.transport import HttpTransport
 
-@time_of_script
-def main():
-    """Основная логика скрипта."""
-    for client_name, info in CLIENT_INFO.items():
-        client_logins, client_m_id, client_am_id = info
+
+def parse_args() -> argparse.Namespace:
+    """Функция разбирает аргументы командной строки."""
+    parser = argparse.ArgumentParser(
+        description='Выгрузка отчетов Яндекс Директ, Метрики и Аппметрики.'
+    )
+    parser.add_argument(
+        'command',
+        nargs='?',
+        default='run',
+        choices=['run', 'clients', 'plan'],
+        help=(
+            'run - выгрузка (по умолчанию), clients - список клиентов, '
+            'plan - даты, которые будут обновлены.'
+        )
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Количество процессов для параллельной выгрузки клиентов.'
+    )
+    return parser.parse_args()
+
+
+def list_clients() -> None:
+    """Функция выводит клиентов, их логины и счетчики."""
+    for client_name, (logins, m_id, am_id) in CLIENT_INFO.items():
+        print(
+            f'{client_name}: логинов {len(logins)}, '
+            f'метрика {m_id}, аппметрика {am_id}'
+        )
+
+
+def plan_run() -> None:
+    """
+    Функция выводит по клиентам и источникам даты, которые будут
+    обновлены при следующем запуске. Запросы к API не выполняются.
+    """
+    from parser.utils import get_dates_lists
+
+    for client_name, (logins, m_id, am_id) in CLIENT_INFO.items():
+        dates = get_dates_lists(logins, m_id, am_id, client_name)
+        for source, (dates_list, _) in dates.items():
+            period = (
+                f'{dates_list[0]} - {dates_list[-1]}' if dates_list
+                else 'нет дат'
+            )
+            print(
+                f'{client_name} {source}: дат {len(dates_list)}, {period}'
+            )
+
+
+def run_client(
+    client_name: str,
+    transport: 'HttpTransport | None' = None,
+    units: 'UnitsScheduler | None' = None
+) -> dict:
+    """
+    Функция выгружает данные одного клиента.
+
+    Ошибки клиента не прерывают выгрузку остальных клиентов
+    и возвращаются в итоговом отчете.
+
+    Returns:
+        dict: имя клиента, статус, текст ошибки, время выполнения
+        и процессорное время в секундах.
+    """
+    from parser.utils import initialize_components, run
+
+    start_time = time.perf_counter()
+    start_cpu = time.process_time()
+    outcome = {'client': client_name, 'status': 'SUCCESS', 'error': None}
+    registry.set_labels(client=client_name)
+    try:
+        client_logins, client_m_id, client_am_id = CLIENT_INFO[client_name]
         appmetrica, direct, metrica = initialize_components(
             client_logins,
             client_m_id,
             client_am_id,
-            client_name
+            client_name,
+            transport,
+            units
         )
         run(direct, metrica, appmetrica, client_name)
+    except Exception as e:
+        logging.error(f'Ошибка клиента {client_name}: {e}', exc_info=True)
+        outcome['status'] = 'ERROR'
+        outcome['error'] = f'{type(e).__name__}: {e}'
+    outcome['wall_time'] = round(time.perf_counter() - start_time, 3)
+    outcome['cpu_time'] = round(time.process_time() - start_cpu, 3)
+    registry.observe('client_seconds', outcome['wall_time'])
+    registry.observe('client_cpu_seconds', outcome['cpu_time'])
+    return outcome
+
+
+def run_client_process(client_name: str) -> dict:
+    """
+    Функция выгружает данные клиента в процессе-исполнителе
+    с отдельным лог-файлом и собственным HTTP-транспортом.
+    Метрики клиента записываются в файлы клиента. Процесс-исполнитель
+    выгружает клиентов по очереди, поэтому метрики предыдущего клиента
+    перед началом очищаются.
+    """
+    from parser.throttling import UnitsScheduler
+    from parser.transport import HttpTransport
+
+    registry.reset()
+    initialize(client_name)
+    transport = HttpTransport()
+    try:
+        return run_client(client_name, transport, UnitsScheduler())
+    finally:
+        transport.log_stats()
+        transport.close()
+        registry.write(f'{METRICS_FILENAME}_{client_name}')
+
+
+@time_of_script
+def main(workers: int = 1):
+    """Основная логика скрипта."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    from parser.throttling import UnitsScheduler
+    from parser.transport import HttpTransport
+
+    initialize()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(run_client_process, CLIENT_INFO))
+
+    transport = HttpTransport()
+    units = UnitsScheduler()
+    try:
+        return [
+            run_client(client_name, transport, units)
+            for client_name in CLIENT_INFO
+        ]
+    finally:
+        transport.log_stats()
+        transport.close()
+        registry.write(METRICS_FILENAME)
+
+
+def cli() -> None:
+    """Точка входа командной строки."""
+    args = parse_args()
+    if args.command == 'clients':
+        list_clients()
+    elif args.command == 'plan':
+        initialize()
+        plan_run()
+    else:
+        main(args.workers)
 
 
 if __name__ == '__main__':
-    main()
+    cli()
@@ -0,0 +1,174 @@
+import logging
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+
+from parser.constants import (
+    CACHE_STORAGE,
+    CSV_CHUNK_SIZE,
+    DEFAULT_FOLDER,
+    NATURAL_KEY_ROMI,
+    ROMI_SOURCE
+)
+from parser.mixins import FileMixin
+from parser.schema import SCHEMA_ROMI, apply_schema
+from parser.storage import (
+    PartitionedStorage,
+    find_cache_path,
+    get_compression,
+    read_csv
+)
+
+
+class RomiMart(FileMixin):
+    """
+    Витрина ROMI клиента: расходы и клики Яндекс Директ вместе
+    с транзакциями и выручкой Яндекс Метрики и Аппметрики по дате,
+    частям кампании, устройству и источнику.
+
+    Витрина строится из кэша источников и сохраняется как обычный
+    источник в {client}_romi.csv. При обновлении пересчитываются только
+    даты dates_list: из кэша каждого источника читаются строки этих дат,
+    агрегируются по ключу витрины и объединяются merge, после чего
+    заменяют в витрине те же даты. Если витрины еще нет, она строится
+    по всем датам источников.
+    """
+
+    source = 'romi'
+
+    def __init__(
+        self,
+        client_name: str,
+        dates_list: list,
+        folder_name: str = DEFAULT_FOLDER,
+        storage: str = CACHE_STORAGE
+    ):
+        FileMixin.__init__(
+            self,
+            dates_list=dates_list,
+            natural_key=NATURAL_KEY_ROMI,
+            folder_name=folder_name,
+            storage=storage,
+            schema=SCHEMA_ROMI
+        )
+        self.client_name = client_name
+
+    def _get_storage(self, filename: str) -> PartitionedStorage:
+        """Защищенный метод. Возвращает партиции кэша файла filename."""
+        return PartitionedStorage(
+            self._get_file_path(Path(filename).stem),
+            self.natural_key
+        )
+
+    def _iter_source(
+        self,
+        source: str,
+        columns: list
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Защищенный метод.
+        Отдает чанки кэша источника source с обновляемыми датами.
+
+        Для партиционированного кэша читаются только партиции этих дат,
+        для .csv файла - только нужные колонки по частям. Файлы читаются
+        со сжатием, заданным для источника.
+        """
+        filename = f'{self.client_name}_{source}.csv'
+        storage = self._get_storage(filename)
+        path = find_cache_path(
+            self._get_file_path(filename),
+            get_compression(source)
+        )
+        if self.storage == 'partitioned' and storage.partitions():
+            if self.dates_list:
+                chunks = storage.iter_dates(self.dates_list)
+            else:
+                chunks = (
+                    read_csv(partition_path)
+                    for partition_path in storage.partitions()
+                )
+        elif path.exists():
+            chunks = read_csv(path, chunksize=CSV_CHUNK_SIZE, usecols=columns)
+        else:
+            logging.warning(f'Файл {filename} для витрины не найден')
+            return
+
+        dates = set(self.dates_list)
+        for df in chunks:
+            if dates:
+                df = df[df['Date'].astype(str).isin(dates)]
+            yield df
+
+    def _group(self, df: pd.DataFrame, metrics: list) -> pd.DataFrame:
+        """Защищенный метод. Суммирует метрики по ключу витрины."""
+        return df.groupby(
+            self.natural_key,
+            dropna=False,
+            observed=True,
+            sort=False
+        )[metrics].sum().reset_index()
+
+    def _aggregate(self, source: str, metrics: list) -> pd.DataFrame:
+        """
+        Защищенный метод. Агрегирует метрики источника по ключу витрины.
+        Чанки агрегируются по мере чтения, в памяти остаются только
+        их агрегаты. Строкам без колонки Source присваивается ROMI_SOURCE.
+        """
+        columns = [*self.natural_key, *metrics]
+        frames = []
+        for df in self._iter_source(source, columns):
+            if df.empty:
+                continue
+            if 'Source' not in df.columns:
+                df = df.assign(Source=ROMI_SOURCE)
+            frames.append(self._group(df[columns], metrics))
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return self._group(pd.concat(frames, ignore_index=True), metrics)
+
+    def _get_romi_data(self) -> pd.DataFrame:
+        """
+        Защищенный метод. Объединяет агрегаты источников в строки витрины
+        и считает ROMI = (выручка - расход) / расход.
+        """
+        key = self.natural_key
+        direct = self._aggregate('direct', ['Impressions', 'Clicks', 'Cost'])
+        metrica = self._aggregate('metrica', ['Transactions', 'Revenue'])
+        appmetrica = self._aggregate(
+            'appmetrica',
+            ['Transactions', 'Revenue']
+        ).rename(columns={
+            'Transactions': 'AppTransactions',
+            'Revenue': 'AppRevenue'
+        })
+
+        df = direct.merge(metrica, on=key, how='outer').merge(
+            appmetrica,
+            on=key,
+            how='outer'
+        )
+        metrics = [column for column in df.columns if column not in key]
+        df[metrics] = df[metrics].fillna(0)
+        cost = df['Cost']
+        df['ROMI'] = ((df['Revenue'] + df['AppRevenue'] - cost) / cost).where(
+            cost > 0
+        )
+        return apply_schema(df, self.schema)
+
+    def save_data(self, filename_data: str) -> None:
+        """
+        Метод обновляет витрину за даты dates_list.
+        Наследуется от миксина FileMixin
+        """
+        exists = (
+            self._find_cache_path(filename_data).exists()
+            or bool(self._get_storage(filename_data).partitions())
+        )
+        if not exists:
+            logging.info('Витрина не найдена, построение по всем датам')
+            self.dates_list = []
+        elif not self.dates_list:
+            logging.info('Нет дат для обновления витрины')
+            return
+        super().save_data(self._get_romi_data(), filename_data)
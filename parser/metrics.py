@@ -0,0 +1,217 @@
+import datetime as dt
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from parser.constants import METRICS_BUCKETS, METRICS_FOLDER
+
+METRIC_PREFIX = 'yandex_parser_'
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик выгрузки: счетчики и гистограммы с метками.
+
+    Метки по умолчанию (например, клиент) задаются через set_labels
+    и добавляются ко всем последующим измерениям. Потокобезопасен.
+    Метрики записываются в текстовый файл Prometheus (node_exporter
+    textfile collector) и в JSON-сводку.
+    """
+
+    def __init__(self, buckets: tuple = METRICS_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.started_at = time.time()
+        self._default_labels = {}
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def set_labels(self, **labels) -> None:
+        """Метод задает метки, добавляемые ко всем измерениям."""
+        with self._lock:
+            self._default_labels = dict(labels)
+
+    def _get_key(self, name: str, labels: dict) -> tuple:
+        """Защищенный метод. Возвращает ключ метрики с метками."""
+        labels = {**self._default_labels, **labels}
+        return name, tuple(sorted(
+            (label, str(value)) for label, value in labels.items()
+        ))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """Метод увеличивает счетчик name на value."""
+        with self._lock:
+            key = self._get_key(name, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Метод добавляет значение value в гистограмму name."""
+        with self._lock:
+            key = self._get_key(name, labels)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = {
+                    'buckets': [0] * len(self.buckets),
+                    'sum': 0.0,
+                    'count': 0,
+                    'max': 0.0
+                }
+                self._histograms[key] = histogram
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+            histogram['max'] = max(histogram['max'], value)
+
+    def get_counters(self, **labels) -> dict:
+        """
+        Метод возвращает суммы счетчиков по именам для измерений
+        с метками labels и метками по умолчанию.
+        """
+        with self._lock:
+            wanted = set(self._get_key('', labels)[1])
+            totals = {}
+            for (name, counter_labels), value in self._counters.items():
+                if wanted <= set(counter_labels):
+                    totals[name] = totals.get(name, 0) + value
+        return totals
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Контекстный менеджер, записывающий длительность блока."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time, **labels)
+
+    def reset(self) -> None:
+        """Метод очищает все накопленные метрики."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started_at = time.time()
+
+    @staticmethod
+    def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+        """Защищенный метод. Форматирует метки для Prometheus."""
+        items = []
+        for label, value in labels + extra:
+            value = value.replace('\\', '\\\\').replace('"', '\\"')
+            value = value.replace('\n', '\\n')
+            items.append(f'{label}="{value}"')
+        return '{' + ','.join(items) + '}' if items else ''
+
+    def to_prometheus(self) -> str:
+        """Метод возвращает метрики в текстовом формате Prometheus."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, dict(value, buckets=list(value['buckets'])))
+                for key, value in self._histograms.items()
+            )
+
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f'{METRIC_PREFIX}{name}'
+            if metric not in typed:
+                lines.append(f'# TYPE {metric} counter')
+                typed.add(metric)
+            lines.append(f'{metric}{self._format_labels(labels)} {value}')
+
+        for (name, labels), histogram in histograms:
+            metric = f'{METRIC_PREFIX}{name}'
+            if metric not in typed:
+                lines.append(f'# TYPE {metric} histogram')
+                typed.add(metric)
+            for bound, count in zip(self.buckets, histogram['buckets']):
+                bucket_labels = self._format_labels(
+                    labels,
+                    (('le', str(bound)),)
+                )
+                lines.append(f'{metric}_bucket{bucket_labels} {count}')
+            inf_labels = self._format_labels(labels, (('le', '+Inf'),))
+            lines.append(f'{metric}_bucket{inf_labels} {histogram["count"]}')
+            lines.append(
+                f'{metric}_sum{self._format_labels(labels)} '
+                f'{round(histogram["sum"], 6)}'
+            )
+            lines.append(
+                f'{metric}_count{self._format_labels(labels)} '
+                f'{histogram["count"]}'
+            )
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> dict:
+        """Метод возвращает сводку метрик для JSON-отчета."""
+        with self._lock:
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                {
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': histogram['count'],
+                    'sum': round(histogram['sum'], 6),
+                    'avg': round(histogram['sum'] / histogram['count'], 6),
+                    'max': round(histogram['max'], 6)
+                }
+                for (name, labels), histogram in sorted(
+                    self._histograms.items()
+                )
+            ]
+        return {
+            'started_at': dt.datetime.fromtimestamp(
+                self.started_at
+            ).isoformat(timespec='seconds'),
+            'finished_at': dt.datetime.now().isoformat(timespec='seconds'),
+            'counters': counters,
+            'histograms': histograms
+        }
+
+    def write(self, filename: str, path: Path | None = None) -> Path:
+        """
+        Метод атомарно записывает метрики в файлы {filename}.prom
+        и {filename}.json и возвращает путь к файлу Prometheus.
+        """
+        folder = path or Path(__file__).parent.parent / METRICS_FOLDER
+        folder.mkdir(parents=True, exist_ok=True)
+        files = {
+            folder / f'{filename}.prom': self.to_prometheus(),
+            folder / f'{filename}.json': json.dumps(
+                self.summary(),
+                ensure_ascii=False,
+                indent=2
+            )
+        }
+        for file_path, content in files.items():
+            temp_path = file_path.with_name(f'{file_path.name}.tmp')
+            temp_path.write_text(content, encoding='utf-8')
+            os.replace(temp_path, file_path)
+        return folder / f'{filename}.prom'
+
+
+registry = MetricsRegistry()
+"""Реестр метрик текущего процесса."""
+
+
+def timed(name: str):
+    """
+    Декоратор методов клиентов API, записывающий длительность вызова
+    в гистограмму name с меткой источника self.source.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with registry.timer(name, source=getattr(self, 'source', '')):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
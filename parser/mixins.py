@@ -1,17 +1,44 @@
+import functools
+import json
 import logging
+import os
+import numpy as np
 import pandas as pd
 from pathlib import Path
+from typing import Iterable, Iterator
 
 from parser.constants import (
+    CACHE_STORAGE,
+    CAMPAIGN_CACHE_SIZE,
+    CSV_CHUNK_SIZE,
     DEVICES,
     DEFAULT_DELIMETER,
     DEFAULT_VALUE,
     DEFAULT_COLUMNS_CAMPAIGN,
-    DEFAULT_FOLDER
+    DEFAULT_FOLDER,
+    PARTITION_EXPORT
+)
+from parser.db import DatabaseSink
+from parser.metrics import registry, timed
+from parser.schema import apply_schema
+from parser.state import RefreshState
+from parser.storage import (
+    PartitionedStorage,
+    collapse_chunks,
+    collapse_keys,
+    drop_dates,
+    drop_keys,
+    find_cache_path,
+    get_cache_path,
+    get_compression,
+    hash_keys,
+    open_csv,
+    read_csv,
+    remove_stale_cache,
+    upsert,
+    write_csv,
+    write_frame
 )
-from parser.logging_config import setup_logging
-
-setup_logging()
 
 
 class ColumnMixin:
@@ -27,22 +54,60 @@ class ColumnMixin:
     ):
         self.columns = columns
 
+    @staticmethod
+    @functools.lru_cache(maxsize=CAMPAIGN_CACHE_SIZE)
+    def _split_campaign_name(
+        name: str,
+        parts: int,
+        default_value: str = DEFAULT_VALUE,
+        delimeter: str = DEFAULT_DELIMETER
+    ) -> tuple:
+        """
+        Защищенный метод. Разбивает одно имя кампании на parts частей,
+        дополняя недостающие части значением default_value.
+        Результат кэшируется для повторяющихся имен.
+        """
+        padded = name + default_value * ((parts - 1) - name.count(delimeter))
+        return tuple(padded.split('-', parts - 1))
+
+    @timed('split_campaign_seconds')
     def _split_campaign(
         self,
         column,
         default_value: str = DEFAULT_VALUE,
         delimeter: str = DEFAULT_DELIMETER
     ):
-        df = pd.DataFrame()
-
-        for i, value in enumerate(self.columns):
-            df[value] = column.apply(
-                lambda x: (
-                    str(x) + default_value *
-                    ((len(self.columns)-1)-str(x).count(delimeter))
-                ).split('-', len(self.columns)-1)[i]
+        """
+        Защищенный метод. Разбивает колонку имен кампаний на колонки
+        self.columns.
+
+        Каждое уникальное имя разбирается один раз, после чего строки
+        результата собираются по кодам pd.factorize без построчных lambda.
+        Колонки результата категориальные: значения частей хранятся
+        один раз, строки - кодами.
+        """
+        parts = len(self.columns)
+        codes, uniques = pd.factorize(column.astype(str))
+        table = np.array(
+            [
+                self._split_campaign_name(
+                    name,
+                    parts,
+                    default_value,
+                    delimeter
+                )
+                for name in uniques
+            ],
+            dtype=object
+        ).reshape(-1, parts)
+        result = {}
+        for i, column_name in enumerate(self.columns):
+            part_codes, part_uniques = pd.factorize(table[:, i])
+            result[column_name] = pd.Categorical.from_codes(
+                part_codes[codes],
+                part_uniques
             )
-        return df
+        return pd.DataFrame(result, index=column.index)
 
     def _rename_columns(self, df):
         df['Devices'] = df['Device'].apply(lambda x: DEVICES.get(x))
@@ -51,20 +116,89 @@ class ColumnMixin:
         return df
 
 
+class RequestMixin:
+    """
+    Миксин-класс, объединяющий в себе общие методы запросов к API
+    для классов:
+    YandexAppMetricaReports, YandexMetricaReports.
+    """
+
+    def _get_json(
+        self,
+        url: str,
+        headers: dict,
+        params: dict,
+        ttl: float | None
+    ) -> tuple[dict, int]:
+        """
+        Защищенный метод. Выполняет GET-запрос к API и возвращает
+        JSON-ответ и его размер в байтах.
+
+        Ответ берется из кэша ответов, если он там есть и не устарел,
+        иначе запрашивается с учетом ограничения частоты и политики
+        повторов и сохраняется в кэш на срок ttl.
+        """
+        key = self.cache.make_key(url, params=params)
+        cached_path = self.cache.get(key)
+        content = None
+        if cached_path is not None:
+            try:
+                content = cached_path.read_bytes()
+                registry.inc('cache_hits_total', source=self.source)
+            except FileNotFoundError:
+                # Запись удалена при вытеснении другим процессом.
+                pass
+        if content is None:
+            self.rate_limiter.wait(url)
+            with registry.timer('api_request_seconds', source=self.source):
+                response = self.retry_policy.call(
+                    self.transport.get,
+                    url,
+                    params=params,
+                    headers=headers
+                )
+            response.raise_for_status()
+            content = response.content
+            registry.inc(
+                'response_bytes_total',
+                len(content),
+                source=self.source
+            )
+            if self.cache.should_store(ttl):
+                self.cache.put(key, [content], ttl)
+        return json.loads(content), len(content)
+
+
 class FileMixin:
     """
     Миксин-класс, объединяющий в себе общие методы работы с файлами
     для классов:
     YandexAppMetricaReports, YandexDirectReports, YandexMetricaReports.
+
+    Файлы кэша сжимаются кодеком источника из CACHE_COMPRESSION,
+    к имени файла добавляется расширение кодека.
     """
 
+    source = ''
+
     def __init__(
         self,
         dates_list: list,
-        folder_name: str = DEFAULT_FOLDER
+        natural_key: list,
+        folder_name: str = DEFAULT_FOLDER,
+        storage: str = CACHE_STORAGE,
+        state: RefreshState | None = None,
+        schema: dict | None = None,
+        sink: DatabaseSink | None = None
     ):
         self.dates_list = dates_list
+        self.natural_key = natural_key
         self.folder = folder_name
+        self.storage = storage
+        self.state = state
+        self.schema = schema
+        self.sink = sink
+        self.compression = get_compression(self.source)
 
     def _get_file_path(self, filename: str) -> Path:
         """Защищенный метод. Создает путь к файлу в указанной папке."""
@@ -76,27 +210,57 @@ class FileMixin:
             logging.error(f'Ошибка: {e}')
             raise
 
+    def _get_cache_path(self, filename: str) -> Path:
+        """
+        Защищенный метод. Возвращает путь к файлу кэша с расширением
+        кодека сжатия источника.
+        """
+        return get_cache_path(self._get_file_path(filename), self.compression)
+
+    def _find_cache_path(self, filename: str) -> Path:
+        """
+        Защищенный метод. Возвращает существующий файл кэша,
+        в том числе записанный с другим сжатием.
+        """
+        return find_cache_path(self._get_file_path(filename), self.compression)
+
+    def _remove_stale_cache(self, filename: str) -> None:
+        """
+        Защищенный метод. Удаляет файлы кэша с другим сжатием,
+        оставшиеся после смены CACHE_COMPRESSION.
+        """
+        remove_stale_cache(self._get_file_path(filename), self.compression)
+
+    def _mark_refreshed(self, logins: list, rows: dict | None = None) -> None:
+        """
+        Защищенный метод. Отмечает обновляемые даты выгруженными
+        в файле состояния для успешно выгруженных логинов.
+        rows - количество строк по логинам и датам, если оно известно.
+        """
+        if self.state is not None and logins:
+            self.state.mark_fetched(logins, self.dates_list, rows=rows)
+
+    def _get_refresh_scope(self) -> dict | None:
+        """
+        Защищенный метод. Возвращает ограничение удаления обновляемых
+        дат из исторических данных, см. drop_dates.
+
+        Пустой словарь - строки обновляемых дат удаляются целиком,
+        None - отчеты не получены и даты не удаляются. Строки с ключами
+        новых данных заменяются в любом случае.
+        """
+        return {}
+
     def _get_filtered_cache_data(self, filename_data: str) -> pd.DataFrame:
         """Защищенный метод, получает отфильтрованные данные из кэш-файла."""
-        cache_path = self._get_file_path(filename_data)
+        cache_path = self._find_cache_path(filename_data)
+        scope = self._get_refresh_scope()
         try:
-            old_df = pd.read_csv(
-                cache_path,
-                sep=';',
-                encoding='cp1251',
-                header=0
+            return drop_dates(
+                apply_schema(read_csv(cache_path), self.schema),
+                self.dates_list if scope is not None else [],
+                scope
             )
-
-            for dates in self.dates_list:
-                old_df = pd.DataFrame(old_df[~pd.Series(
-                    old_df['Date']
-                ).fillna('').str.contains(
-                    fr'{dates}',
-                    case=False,
-                    na=False
-                )])
-
-            return old_df
         except FileNotFoundError:
             logging.warning('Файл кэша не найден. Первый запуск.')
             return pd.DataFrame()
@@ -107,38 +271,228 @@ class FileMixin:
             logging.error(f'Ошибка: {e}')
             raise
 
-    def save_data(self, df_new: pd.DataFrame, filename_data: str) -> None:
-        """Метод сохраняет новые данные, объединяя с существующими."""
-        df_old = self._get_filtered_cache_data(filename_data)
+    def _get_partitioned_storage(
+        self,
+        filename_data: str
+    ) -> PartitionedStorage:
+        """
+        Защищенный метод. Возвращает партиционированное хранилище
+        источника. При первом запуске партиции заполняются
+        из существующего .csv файла, который читается чанками.
+        """
+        cache_path = self._find_cache_path(filename_data)
+        storage = PartitionedStorage(
+            self._get_file_path(Path(filename_data).stem),
+            self.natural_key,
+            schema=self.schema,
+            compression=self.compression
+        )
+        if not storage.partitions() and cache_path.exists():
+            logging.info(f'Перенос {filename_data} в партиции')
+            storage.write_chunks(
+                read_csv(cache_path, chunksize=CSV_CHUNK_SIZE),
+                []
+            )
+        return storage
+
+    def _export_partitions(
+        self,
+        storage: PartitionedStorage,
+        filename_data: str
+    ) -> None:
+        """
+        Защищенный метод. Выгружает партиции в единый .csv файл,
+        если это включено PARTITION_EXPORT.
+        """
+        if not PARTITION_EXPORT:
+            return
+        storage.export(self._get_cache_path(filename_data))
+        self._remove_stale_cache(filename_data)
+
+    def _save_partitioned_data(
+        self,
+        df_new: pd.DataFrame,
+        filename_data: str
+    ) -> None:
+        """
+        Защищенный метод. Сохраняет новые данные в партиционированное
+        хранилище источника и при необходимости выгружает единый .csv файл.
+        """
+        storage = self._get_partitioned_storage(filename_data)
+        scope = self._get_refresh_scope()
+        storage.write(
+            df_new,
+            self.dates_list if scope is not None else [],
+            scope
+        )
+        self._export_partitions(storage, filename_data)
+        logging.info('Данные успешно обновлены')
+
+    def _iter_history(
+        self,
+        path: Path,
+        keys: pd.Index,
+        scope: dict | None
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Защищенный метод. Отдает исторические данные файла кэша path
+        по частям без строк, хэши ключей которых есть в keys, и без
+        обновляемых дат в пределах scope, см. drop_dates.
+        """
+        if not path.exists() or not path.stat().st_size:
+            return
+        dates_list = self.dates_list if scope is not None else []
+        for df_old in read_csv(path, chunksize=CSV_CHUNK_SIZE):
+            yield drop_keys(
+                drop_dates(df_old, dates_list, scope),
+                keys,
+                self.natural_key
+            )
+
+    @timed('save_seconds')
+    def save_chunks(
+        self,
+        chunks: Iterable[pd.DataFrame],
+        filename_data: str
+    ) -> None:
+        """
+        Метод сохраняет новые данные, поступающие чанками, объединяя
+        с существующими.
+
+        Строки с одинаковым естественным ключом во всех чанках
+        сворачиваются в одну, см. collapse_chunks. Чанки дописываются
+        во временный файл по мере поступления, затем к нему по частям
+        дописываются исторические данные без строк с ключами новых данных
+        и без обновляемых дат в пределах _get_refresh_scope, и временный
+        файл заменяет кэш. Временный файл пишется одним сжатым потоком.
+        Объем памяти не зависит от количества и размера чанков: кроме
+        одного чанка хранятся только хэши ключей новых строк. Если задана
+        база данных sink, чанки по пути в файл записываются и в таблицу
+        источника.
+        """
+        cache_path = self._get_cache_path(filename_data)
+        temp_cache_path = cache_path.with_name(f'{cache_path.name}.new')
+        chunks = collapse_chunks(
+            chunks,
+            self.natural_key,
+            self._get_file_path(f'{Path(filename_data).stem}.spool')
+        )
+        if self.sink is not None:
+            chunks = self.sink.write_chunks(
+                Path(filename_data).stem,
+                chunks,
+                self.dates_list,
+                self.natural_key,
+                self._get_refresh_scope
+            )
         try:
-            temp_cache_path = self._get_file_path(filename_data)
-            if df_new.empty:
+            if self.storage == 'partitioned':
+                storage = self._get_partitioned_storage(filename_data)
+                rows = storage.write_chunks(
+                    chunks,
+                    self.dates_list,
+                    self._get_refresh_scope
+                )
+                if not rows:
+                    logging.warning('Нет новых данных для сохранения')
+                    if self._get_refresh_scope() is None:
+                        return
+                registry.inc('saved_rows_total', rows, source=self.source)
+                self._export_partitions(storage, filename_data)
+                logging.info('Данные успешно обновлены')
+                return
+
+            old_cache_path = self._find_cache_path(filename_data)
+            rows = 0
+            columns = None
+            hashes = []
+            with open_csv(temp_cache_path, self.compression) as file:
+                for df in chunks:
+                    write_frame(df, file, header=columns is None)
+                    rows += len(df)
+                    if columns is None:
+                        columns = df.columns
+                    hashes.append(hash_keys(df, self.natural_key))
+                scope = self._get_refresh_scope()
+                if rows or scope is not None:
+                    keys = pd.Index(np.concatenate(hashes) if hashes else [])
+                    for df_old in self._iter_history(
+                        old_cache_path,
+                        keys,
+                        scope
+                    ):
+                        header = columns is None
+                        if header:
+                            columns = df_old.columns
+                        write_frame(
+                            df_old.reindex(columns=columns),
+                            file,
+                            header
+                        )
+            if columns is None:
+                temp_cache_path.unlink()
+                logging.warning('Нет новых данных для сохранения')
+                return
+
+            os.replace(temp_cache_path, cache_path)
+            self._remove_stale_cache(filename_data)
+            registry.inc('saved_rows_total', rows, source=self.source)
+            if not rows:
                 logging.warning('Нет новых данных для сохранения')
+            logging.info(f'Данные успешно обновлены, новых строк: {rows}')
+        except Exception as e:
+            temp_cache_path.unlink(missing_ok=True)
+            logging.error(f'Ошибка во время обновления: {e}')
+            raise
+
+    @timed('save_seconds')
+    def save_data(self, df_new: pd.DataFrame, filename_data: str) -> None:
+        """
+        Метод сохраняет новые данные, объединяя с существующими.
+        Строки с одинаковым естественным ключом сворачиваются в одну.
+        Если задана база данных sink, новые данные сначала записываются
+        в таблицу источника. Если новых данных нет, но отчеты получены,
+        обновляемые даты удаляются в пределах _get_refresh_scope.
+        """
+        df_new = collapse_keys(df_new, self.natural_key)
+        scope = self._get_refresh_scope()
+        if not df_new.empty:
+            registry.inc('saved_rows_total', len(df_new), source=self.source)
+        if self.sink is not None and (not df_new.empty or scope is not None):
+            self.sink.write(
+                Path(filename_data).stem,
+                df_new,
+                self.dates_list,
+                self.natural_key,
+                scope
+            )
+        if df_new.empty:
+            logging.warning('Нет новых данных для сохранения')
+            if scope is None:
                 return
+        if self.storage == 'partitioned':
+            self._save_partitioned_data(df_new, filename_data)
+            return
+
+        df_old = self._get_filtered_cache_data(filename_data)
+        try:
+            temp_cache_path = self._get_cache_path(filename_data)
             if not isinstance(df_old, pd.DataFrame) or df_old.empty:
-                df_new.to_csv(
-                    temp_cache_path,
-                    index=False,
-                    header=True,
-                    sep=';',
-                    encoding='cp1251'
-                )
+                if df_new.empty:
+                    return
+                write_csv(df_new, temp_cache_path, self.compression)
+                self._remove_stale_cache(filename_data)
                 logging.info(
                     'Новые данные сохранены. Исторические данные отсутствовали'
                 )
                 return
-            for dates in self.dates_list:
-                df_old = df_old[~df_old['Date'].fillna('').str.contains(
-                    fr'{dates}', case=False, na=False)]
 
-            df_old = pd.concat([df_new, df_old])
-            df_old.to_csv(
+            write_csv(
+                upsert(df_new, df_old, self.natural_key),
                 temp_cache_path,
-                index=False,
-                header=True,
-                sep=';',
-                encoding='cp1251'
+                self.compression
             )
+            self._remove_stale_cache(filename_data)
             logging.info('Данные успешно обновлены')
         except Exception as e:
             logging.error(f'Ошибка во время обновления: {e}')
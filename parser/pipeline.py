@@ -0,0 +1,108 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable
+
+from parser.metrics import registry
+
+
+class Pipeline:
+    """
+    Граф этапов выгрузки с учетом зависимостей.
+
+    Этап запускается, как только завершены все этапы, от которых
+    он зависит, независимые этапы выполняются параллельно в потоках.
+    Функция этапа получает результаты зависимостей позиционными
+    аргументами в порядке depends_on, результат упавшего этапа - None.
+    Ошибка одного этапа не останавливает остальные и поднимается
+    после завершения всего графа.
+    """
+
+    def __init__(self, max_workers: int | None = None):
+        self.max_workers = max_workers
+        self._stages = {}
+
+    def add_stage(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        depends_on: tuple = ()
+    ) -> None:
+        """Метод добавляет этап name, зависящий от этапов depends_on."""
+        if name in self._stages:
+            raise ValueError(f'Этап {name} уже добавлен')
+        for dependency in depends_on:
+            if dependency not in self._stages:
+                raise ValueError(
+                    f'Этап {name} зависит от неизвестного этапа {dependency}'
+                )
+        self._stages[name] = (func, tuple(depends_on))
+
+    def _run_stage(self, name: str, args: list) -> Any:
+        """
+        Защищенный метод. Выполняет этап и логирует время работы.
+
+        По завершении этапа пишется сводка STAGE=... со статусом,
+        временем и счетчиками метрик с меткой source, равной имени этапа,
+        например ROWS_TOTAL и CACHE_HITS_TOTAL.
+        """
+        func, _ = self._stages[name]
+        start_time = time.time()
+        status = 'ERROR'
+        logging.info(f'Этап {name} начал работу')
+        try:
+            result = func(*args)
+            status = 'SUCCESS'
+            logging.info(
+                f'Этап {name} завершил работу за '
+                f'{round(time.time() - start_time, 3)} сек.'
+            )
+            return result
+        finally:
+            counters = ''.join(
+                f', {counter.upper()}={round(value, 3)}'
+                for counter, value in sorted(
+                    registry.get_counters(source=name).items()
+                )
+            )
+            logging.info(
+                f'STAGE={name}, STATUS={status}, '
+                f'WALL_TIME={round(time.time() - start_time, 3)} сек'
+                f'{counters}'
+            )
+
+    def run(self) -> dict:
+        """
+        Метод выполняет все этапы и возвращает их результаты по именам.
+        Поднимает первую из возникших ошибок этапов.
+        """
+        results = {}
+        errors = []
+        pending = dict(self._stages)
+        running = {}
+        max_workers = self.max_workers or len(self._stages) or 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending or running:
+                for name, (_, depends_on) in list(pending.items()):
+                    if all(dep in results for dep in depends_on):
+                        args = [results[dep] for dep in depends_on]
+                        future = executor.submit(self._run_stage, name, args)
+                        running[future] = name
+                        del pending[name]
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        logging.error(
+                            f'Ошибка на этапе {name}: {e}',
+                            exc_info=True
+                        )
+                        results[name] = None
+                        errors.append(e)
+
+        if errors:
+            raise errors[0]
+        return results
@@ -0,0 +1,110 @@
+import logging
+import random
+import time
+from typing import Callable
+
+import requests
+
+from parser.constants import (
+    HTTP_TIMEOUT,
+    POLL_GROWTH_FACTOR,
+    POLL_MAX_DELAY,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_MAX_DELAY,
+    RETRY_STATUSES
+)
+from parser.metrics import registry
+
+RETRYABLE_EXCEPTIONS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+"""Исключения requests, после которых запрос можно повторить."""
+
+
+class RetryPolicy:
+    """
+    Политика повторов запросов к API.
+
+    Делит ошибки на повторяемые (коды ответа из retry_statuses, обрывы
+    соединения и таймауты) и неповторяемые. Повторяемые запросы
+    отправляются заново с экспоненциальной задержкой и случайным
+    разбросом, но не больше max_attempts раз. Повторы учитываются
+    в метриках с меткой источника source.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        base_delay: float = RETRY_BASE_DELAY,
+        max_delay: float = RETRY_MAX_DELAY,
+        retry_statuses: tuple = RETRY_STATUSES,
+        timeout: tuple = HTTP_TIMEOUT,
+        source: str = ''
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = retry_statuses
+        self.timeout = timeout
+        self.source = source
+
+    def is_retryable(self, error: Exception | int) -> bool:
+        """Метод проверяет, можно ли повторить запрос после ошибки."""
+        if isinstance(error, int):
+            return error in self.retry_statuses
+        return isinstance(error, RETRYABLE_EXCEPTIONS)
+
+    def get_delay(self, attempt: int) -> float:
+        """
+        Метод возвращает задержку перед повтором номер attempt:
+        экспоненциальный рост с разбросом от половины до полной величины.
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(delay / 2, delay)
+
+    def call(self, func: Callable, *args, **kwargs) -> requests.Response:
+        """
+        Метод выполняет запрос func с повторами.
+
+        Возвращает ответ, код которого не требует повтора, либо последний
+        ответ после исчерпания попыток. Неповторяемые исключения и
+        исключения последней попытки пробрасываются.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 1
+        while True:
+            try:
+                response = func(*args, **kwargs)
+                if (
+                    not self.is_retryable(response.status_code)
+                    or attempt >= self.max_attempts
+                ):
+                    return response
+                reason = f'код ответа {response.status_code}'
+                response.close()
+            except Exception as e:
+                if not self.is_retryable(e) or attempt >= self.max_attempts:
+                    raise
+                reason = f'{type(e).__name__}: {e}'
+
+            delay = self.get_delay(attempt)
+            registry.inc('retries_total', source=self.source)
+            logging.warning(
+                f'Попытка {attempt}/{self.max_attempts} не удалась '
+                f'({reason}), повтор через {round(delay, 1)} сек.'
+            )
+            time.sleep(delay)
+            attempt += 1
+
+    def get_poll_delay(self, retry_in: float, elapsed: float) -> float:
+        """
+        Метод возвращает паузу перед следующим опросом отчета.
+
+        Пока отчет формируется недолго, используется retryIn сервера,
+        для долгих отчетов пауза растет пропорционально времени
+        формирования elapsed, но не больше POLL_MAX_DELAY.
+        """
+        return min(max(retry_in, elapsed * POLL_GROWTH_FACTOR), POLL_MAX_DELAY)
@@ -0,0 +1,150 @@
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from parser.constants import DEFAULT_COLUMNS_CAMPAIGN
+
+CATEGORY_COLUMNS = [
+    'Date',
+    'CampaignName',
+    'Account',
+    'Device',
+    'Source',
+    *DEFAULT_COLUMNS_CAMPAIGN
+]
+"""
+Колонки с малым числом уникальных значений, хранимые как category.
+Значение хранится один раз в категориях, строки - целочисленными кодами.
+"""
+
+SCHEMA_DIRECT = {
+    **{column: 'category' for column in CATEGORY_COLUMNS},
+    'CampaignId': 'int64',
+    'Impressions': 'uint32',
+    'Clicks': 'uint32',
+    'Cost': 'float64'
+}
+"""Типы колонок данных Яндекс Директ в памяти."""
+
+SCHEMA_METRICA = {
+    **{column: 'category' for column in CATEGORY_COLUMNS},
+    'Transactions': 'uint32',
+    'Revenue': 'int64'
+}
+"""Типы колонок данных Яндекс Метрики в памяти."""
+
+SCHEMA_APPMETRICA = {
+    **{column: 'category' for column in CATEGORY_COLUMNS},
+    'Transactions': 'uint32',
+    'Revenue': 'float64'
+}
+"""Типы колонок данных Яндекс Аппметрики в памяти."""
+
+SCHEMA_ROMI = {
+    **{column: 'category' for column in CATEGORY_COLUMNS},
+    'Impressions': 'int64',
+    'Clicks': 'int64',
+    'Cost': 'float64',
+    'Transactions': 'int64',
+    'Revenue': 'float64',
+    'AppTransactions': 'int64',
+    'AppRevenue': 'float64',
+    'ROMI': 'float64'
+}
+"""
+Типы колонок витрины ROMI в памяти. Суммы счетчиков по частям
+кампаний хранятся в int64, чтобы не переполнять uint32.
+"""
+
+DIRECT_READ_DTYPES = {
+    'Date': 'category',
+    'CampaignName': 'category',
+    'CampaignId': 'int64',
+    'Device': 'category',
+    'Impressions': 'uint32',
+    'Clicks': 'uint32',
+    'Cost': 'int64'
+}
+"""
+Типы колонок TSV-отчета Яндекс Директ при разборе.
+Cost читается целым в микроединицах и пересчитывается в рубли.
+"""
+
+
+def _to_category(column: pd.Series) -> pd.Series | None:
+    """
+    Защищенная функция. Приводит колонку к category со строковыми
+    категориями или возвращает None, если колонка уже такая.
+
+    Колонка только из цифр или только из пропусков читается из .csv
+    с числовыми категориями, которые не объединяются со строковыми.
+    """
+    if not isinstance(column.dtype, pd.CategoricalDtype):
+        column = column.astype('category')
+    elif column.cat.categories.dtype == object:
+        return None
+    categories = column.cat.categories
+    if categories.dtype != object:
+        column = column.cat.rename_categories(categories.astype(str))
+    return column
+
+
+def apply_schema(df: pd.DataFrame, schema: dict | None) -> pd.DataFrame:
+    """
+    Функция приводит колонки DataFrame к типам схемы schema.
+
+    Колонки, которых нет в схеме, не меняются. Целочисленные типы
+    не применяются к колонкам с пропусками, чтобы исторические данные
+    с пустыми значениями читались без ошибок. Категории category
+    всегда строковые.
+    """
+    if not schema or df.empty:
+        return df
+    dtypes = {}
+    categories = {}
+    for column, dtype in schema.items():
+        if column not in df.columns:
+            continue
+        if dtype == 'category':
+            category = _to_category(df[column])
+            if category is not None:
+                categories[column] = category
+            continue
+        if df[column].dtype == dtype or df[column].isna().any():
+            continue
+        dtypes[column] = dtype
+    if dtypes:
+        df = df.astype(dtypes)
+    if categories:
+        df = df.assign(**categories)
+    return df
+
+
+def concat_frames(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Функция объединяет DataFrame построчно, сохраняя категориальные
+    колонки.
+
+    pd.concat превращает категориальные колонки с разными категориями
+    в object, поэтому такие колонки объединяются через union_categoricals.
+    """
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+
+    columns = list(dict.fromkeys(
+        column for df in frames for column in df.columns
+    ))
+    result = {}
+    for column in columns:
+        parts = [
+            df[column] if column in df.columns
+            else pd.Series(index=df.index, dtype=object)
+            for df in frames
+        ]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            result[column] = union_categoricals(parts, ignore_order=True)
+        else:
+            result[column] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(result)
@@ -0,0 +1,132 @@
+import datetime as dt
+import json
+import logging
+import os
+from pathlib import Path
+
+from parser.constants import DATE_FORMAT, STATE_FOLDER, STATE_KEEP_DAYS
+
+
+class RefreshState:
+    """
+    Состояние обновления источника клиента по логинам и датам.
+
+    Хранится в файле state/{client}_{source}.json и для каждого логина
+    содержит дату последней успешной выгрузки каждой даты отчета и
+    признак того, что данные за эту дату окончательные. Дата считается
+    окончательной, если с нее до дня выгрузки прошло не меньше
+    finalization_days дней. Если при выгрузке известно количество строк
+    за дату, оно тоже сохраняется и используется для оценки объема
+    будущих отчетов. Записи старше STATE_KEEP_DAYS дней удаляются.
+    """
+
+    def __init__(
+        self,
+        client_name: str,
+        source: str,
+        finalization_days: int,
+        path: Path | None = None
+    ):
+        folder = path or Path(__file__).parent.parent / STATE_FOLDER
+        self.path = folder / f'{client_name}_{source}.json'
+        self.finalization_days = finalization_days
+        self.logins = self._load()
+
+    def _load(self) -> dict:
+        """Защищенный метод. Читает состояние из файла."""
+        try:
+            return json.loads(self.path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            logging.warning(f'Файл состояния {self.path.name} поврежден')
+            return {}
+
+    def _save(self) -> None:
+        """Защищенный метод. Атомарно записывает состояние в файл."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(f'{self.path.name}.tmp')
+        temp_path.write_text(
+            json.dumps(self.logins, ensure_ascii=False, indent=2),
+            encoding='utf-8'
+        )
+        os.replace(temp_path, self.path)
+
+    def is_final(self, login: str, date_str: str) -> bool:
+        """Метод проверяет, выгружены ли окончательные данные за дату."""
+        return self.logins.get(login, {}).get(date_str, {}).get('final', False)
+
+    def get_dates_list(
+        self,
+        logins: list,
+        max_days: int,
+        today: dt.date | None = None
+    ) -> list[str]:
+        """
+        Метод возвращает список дат для обновления по возрастанию.
+
+        Список начинается с самой ранней из последних max_days дат, по
+        которой хотя бы у одного логина нет окончательных данных: дата еще
+        внутри окна изменения данных или не была выгружена из-за ошибки.
+        Список заканчивается вчерашним днем.
+        """
+        today = today or dt.date.today()
+        horizon = [
+            (today - dt.timedelta(days=i)).strftime(DATE_FORMAT)
+            for i in range(max_days, 0, -1)
+        ]
+        for i, date_str in enumerate(horizon):
+            if not all(self.is_final(login, date_str) for login in logins):
+                return horizon[i:]
+        return []
+
+    def get_rows_per_day(self, login: str) -> float | None:
+        """
+        Метод возвращает среднее количество строк отчета логина за день
+        по сохраненным выгрузкам или None, если данных нет.
+        """
+        rows = [
+            date_state['rows']
+            for date_state in self.logins.get(login, {}).values()
+            if 'rows' in date_state
+        ]
+        if not rows:
+            return None
+        return sum(rows) / len(rows)
+
+    def mark_fetched(
+        self,
+        logins: list,
+        dates_list: list,
+        today: dt.date | None = None,
+        rows: dict | None = None
+    ) -> None:
+        """
+        Метод отмечает даты dates_list выгруженными для логинов.
+        rows - количество строк по логинам и датам: {логин: {дата: строк}}.
+        """
+        today = today or dt.date.today()
+        oldest = (today - dt.timedelta(days=STATE_KEEP_DAYS)).strftime(
+            DATE_FORMAT
+        )
+        for login in logins:
+            login_state = self.logins.setdefault(login, {})
+            for date_str in [d for d in login_state if d < oldest]:
+                del login_state[date_str]
+            for date_str in dates_list:
+                date_obj = dt.datetime.strptime(date_str, DATE_FORMAT).date()
+                login_state[date_str] = {
+                    'fetched_at': today.strftime(DATE_FORMAT),
+                    'final': (
+                        (today - date_obj).days >= self.finalization_days
+                    )
+                }
+                if rows is not None and login in rows:
+                    login_state[date_str]['rows'] = int(
+                        rows[login].get(date_str, 0)
+                    )
+        self._save()
+        logging.info(
+            f'Состояние {self.path.name} обновлено: логинов {len(logins)}, '
+            f'дат {len(dates_list)}'
+        )
@@ -0,0 +1,596 @@
+import gzip
+import importlib.util
+import logging
+import lzma
+import os
+import pickle
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, TextIO
+
+import numpy as np
+import pandas as pd
+
+from parser.constants import (
+    CACHE_COMPRESSION,
+    CACHE_COMPRESSION_SUFFIXES,
+    CSV_ENCODING,
+    CSV_SEPARATOR,
+    PARTITION_GRANULARITY
+)
+from parser.schema import CATEGORY_COLUMNS, apply_schema, concat_frames
+
+PARTITION_KEY_LENGTH = {
+    'day': 10,
+    'month': 7,
+}
+"""Длина префикса даты 'ГГГГ-ММ-ДД', задающего ключ партиции."""
+
+
+def _get_dates_mask(df: pd.DataFrame, dates_list: list) -> np.ndarray:
+    """
+    Защищенная функция. Возвращает маску строк DataFrame с датами
+    из dates_list. Для категориальной колонки Date проверяются только
+    категории.
+    """
+    dates = df['Date']
+    if isinstance(dates.dtype, pd.CategoricalDtype):
+        matched = dates.cat.categories.astype(str).str[:10].isin(
+            set(dates_list)
+        )
+        codes = dates.cat.codes.to_numpy()
+        return (codes >= 0) & matched[codes]
+    dates = dates.fillna('').astype(str).str[:10]
+    return dates.isin(set(dates_list)).to_numpy()
+
+
+def drop_dates(
+    df: pd.DataFrame,
+    dates_list: list,
+    scope: dict | None = None
+) -> pd.DataFrame:
+    """
+    Функция удаляет из DataFrame строки с датами из dates_list.
+
+    scope - ограничение удаления вида {колонка: значения}: удаляются
+    только строки дат, значения колонок которых входят в scope,
+    например строки успешно выгруженных логинов. Пустой scope
+    не ограничивает удаление.
+    """
+    if df.empty or not dates_list or 'Date' not in df.columns:
+        return df
+    mask = _get_dates_mask(df, dates_list)
+    for column, values in (scope or {}).items():
+        if column in df.columns:
+            mask &= df[column].astype(str).isin(set(values)).to_numpy()
+    return df[~mask]
+
+
+def hash_keys(df: pd.DataFrame, natural_key: list) -> np.ndarray:
+    """
+    Функция возвращает 64-битные хэши естественного ключа строк.
+    Значения ключа хэшируются строками, поэтому хэши строк новых данных
+    и данных, прочитанных из .csv файла, совпадают.
+    """
+    return pd.util.hash_pandas_object(
+        df[natural_key].astype(str),
+        index=False
+    ).to_numpy()
+
+
+def drop_keys(
+    df: pd.DataFrame,
+    keys: pd.Index,
+    natural_key: list
+) -> pd.DataFrame:
+    """
+    Функция удаляет из DataFrame строки, хэш естественного ключа которых
+    есть в индексе хэшей keys. Если в DataFrame нет колонок ключа,
+    он возвращается без изменений.
+    """
+    if df.empty or keys.empty or not set(natural_key) <= set(df.columns):
+        return df
+    return df[keys.get_indexer(hash_keys(df, natural_key)) < 0]
+
+
+def collapse_keys(df: pd.DataFrame, natural_key: list) -> pd.DataFrame:
+    """
+    Функция сворачивает строки с одинаковым естественным ключом в одну.
+
+    Числовые колонки вне ключа суммируются, остальные колонки берутся
+    из первой строки ключа. Если повторов ключа нет, DataFrame
+    возвращается без изменений.
+    """
+    key = [column for column in natural_key if column in df.columns]
+    if df.empty or not key or not df.duplicated(key).any():
+        return df
+    agg = {
+        column: 'sum' if pd.api.types.is_numeric_dtype(df[column])
+        else 'first'
+        for column in df.columns
+        if column not in key
+    }
+    return df.groupby(
+        key,
+        dropna=False,
+        observed=True,
+        sort=False
+    ).agg(agg).reset_index()[df.columns]
+
+
+def collapse_chunks(
+    chunks: Iterable[pd.DataFrame],
+    natural_key: list,
+    path: Path
+) -> Iterator[pd.DataFrame]:
+    """
+    Функция сворачивает строки с одинаковым естественным ключом
+    во всех чанках, см. collapse_keys.
+
+    Каждый чанк сворачивается сам по себе и откладывается во временный
+    файл path. Затем чанки читаются обратно и отдаются без строк, ключ
+    которых встретился в нескольких чанках. Такие строки собираются
+    отдельно и отдаются последним чанком после сворачивания. В памяти
+    находятся один чанк и строки повторяющихся ключей.
+    """
+    hashes = []
+    try:
+        with open(path, 'wb') as file:
+            for df in chunks:
+                df = collapse_keys(df, natural_key)
+                if df.empty:
+                    continue
+                hashes.append(hash_keys(df, natural_key))
+                pickle.dump(df, file, protocol=pickle.HIGHEST_PROTOCOL)
+        if not hashes:
+            return
+        all_hashes = pd.Series(np.concatenate(hashes))
+        repeated = pd.Index(
+            all_hashes[all_hashes.duplicated(keep=False)].unique()
+        )
+        held = []
+        with open(path, 'rb') as file:
+            for chunk_hashes in hashes:
+                df = pickle.load(file)
+                mask = repeated.get_indexer(chunk_hashes) >= 0
+                if mask.any():
+                    held.append(df[mask])
+                    df = df[~mask]
+                if not df.empty:
+                    yield df
+        if held:
+            yield collapse_keys(concat_frames(held), natural_key)
+    finally:
+        path.unlink(missing_ok=True)
+
+
+def upsert(
+    df_new: pd.DataFrame,
+    df_old: pd.DataFrame,
+    natural_key: list,
+    dates_list: list | None = None,
+    scope: dict | None = None
+) -> pd.DataFrame:
+    """
+    Функция объединяет новые данные с историческими за один проход.
+
+    Строки новых данных с одинаковым ключом natural_key сворачиваются
+    в одну. Из исторических данных удаляются строки, ключ которых есть
+    в новых данных, и строки обновляемых дат dates_list в пределах
+    scope, см. drop_dates. Новые данные ставятся перед оставшимися
+    историческими. Категориальные колонки остаются категориальными.
+    """
+    df_new = collapse_keys(df_new, natural_key)
+    df_old = drop_dates(df_old, dates_list or [], scope)
+    key = [
+        column for column in natural_key
+        if column in df_new.columns and column in df_old.columns
+    ]
+    if key and not df_old.empty and not df_new.empty:
+        df_old = drop_keys(df_old, pd.Index(hash_keys(df_new, key)), key)
+    return concat_frames([df_new, df_old])
+
+
+def get_compression(source: str) -> tuple | None:
+    """
+    Функция возвращает пару (кодек, уровень) сжатия .csv файлов кэша
+    источника source из CACHE_COMPRESSION или None, если сжатие не задано.
+    """
+    compression = CACHE_COMPRESSION.get(source)
+    if compression is None:
+        return None
+    codec, level = compression
+    if codec not in CACHE_COMPRESSION_SUFFIXES:
+        logging.error(f'Неизвестный кодек сжатия кэша {source}: {codec}')
+        raise ValueError(f'Неизвестный кодек сжатия кэша: {codec}')
+    if codec == 'zstd' and importlib.util.find_spec('zstandard') is None:
+        logging.error('Для сжатия кэша zstd установите пакет zstandard')
+        raise ModuleNotFoundError('zstandard')
+    return codec, level
+
+
+def get_cache_path(path: Path, compression: tuple | None = None) -> Path:
+    """
+    Функция возвращает путь к .csv файлу кэша path с расширением
+    кодека compression.
+    """
+    if compression is None:
+        return path
+    return path.with_name(
+        f'{path.name}{CACHE_COMPRESSION_SUFFIXES[compression[0]]}'
+    )
+
+
+def _get_cache_variants(path: Path) -> list[Path]:
+    """
+    Защищенная функция. Возвращает возможные пути .csv файла кэша path:
+    без сжатия и с расширениями всех кодеков.
+    """
+    return [path] + [
+        path.with_name(f'{path.name}{suffix}')
+        for suffix in CACHE_COMPRESSION_SUFFIXES.values()
+    ]
+
+
+def find_cache_path(path: Path, compression: tuple | None = None) -> Path:
+    """
+    Функция возвращает существующий .csv файл кэша path.
+
+    Сначала ищется файл, сжатый кодеком compression, затем файл
+    без сжатия или с другим кодеком, оставшийся после смены настройки
+    CACHE_COMPRESSION. Если файла нет, возвращается путь для compression.
+    """
+    cache_path = get_cache_path(path, compression)
+    if cache_path.exists():
+        return cache_path
+    for variant in _get_cache_variants(path):
+        if variant.exists():
+            return variant
+    return cache_path
+
+
+def remove_stale_cache(path: Path, compression: tuple | None = None) -> None:
+    """
+    Функция удаляет файлы кэша path с другим сжатием, чем compression,
+    чтобы после смены настройки CACHE_COMPRESSION рядом не оставались
+    устаревшие копии.
+    """
+    cache_path = get_cache_path(path, compression)
+    for variant in _get_cache_variants(path):
+        if variant != cache_path and variant.exists():
+            variant.unlink()
+            logging.info(f'Файл {variant.name} заменен на {cache_path.name}')
+
+
+def open_csv(path: Path, compression: tuple | None = None) -> TextIO:
+    """
+    Функция открывает .csv файл кэша на запись как текстовый поток.
+    При заданном compression данные сжимаются по мере записи.
+    """
+    if compression is None:
+        return open(path, 'w', encoding=CSV_ENCODING, newline='')
+    codec, level = compression
+    if codec == 'gzip':
+        return gzip.open(
+            path,
+            'wt',
+            compresslevel=level,
+            encoding=CSV_ENCODING,
+            newline=''
+        )
+    if codec == 'xz':
+        return lzma.open(
+            path,
+            'wt',
+            preset=level,
+            encoding=CSV_ENCODING,
+            newline=''
+        )
+    import zstandard
+
+    return zstandard.open(
+        path,
+        'w',
+        cctx=zstandard.ZstdCompressor(level=level),
+        encoding=CSV_ENCODING,
+        newline=''
+    )
+
+
+def write_frame(df: pd.DataFrame, file: TextIO, header: bool) -> None:
+    """Функция дописывает DataFrame в открытый open_csv поток."""
+    df.to_csv(file, index=False, header=header, sep=CSV_SEPARATOR)
+
+
+def write_csv(
+    df: pd.DataFrame,
+    path: Path,
+    compression: tuple | None = None
+) -> None:
+    """
+    Функция атомарно записывает DataFrame в .csv файл кэша,
+    сжимая его кодеком compression.
+
+    Данные пишутся во временный файл рядом с целевым и переименовываются
+    в него, поэтому читатели никогда не видят файл записанным наполовину.
+    """
+    temp_path = path.with_name(f'{path.name}.tmp')
+    with open_csv(temp_path, compression) as file:
+        write_frame(df, file, header=True)
+    os.replace(temp_path, path)
+
+
+def append_csv(df: pd.DataFrame, path: Path) -> None:
+    """
+    Функция дописывает DataFrame в конец .csv файла кэша.
+    Заголовок пишется, только если файл еще не существует.
+    """
+    header = not path.exists()
+    df.to_csv(
+        path,
+        mode='w' if header else 'a',
+        index=False,
+        header=header,
+        sep=CSV_SEPARATOR,
+        encoding=CSV_ENCODING
+    )
+
+
+def read_csv(
+    path: Path,
+    chunksize: int | None = None,
+    usecols: list | None = None,
+    nrows: int | None = None
+):
+    """
+    Функция читает .csv файл кэша.
+    При заданном chunksize возвращает итератор DataFrame-чанков.
+    usecols - читаемые колонки; отсутствующие в файле пропускаются.
+    nrows - количество читаемых строк, 0 - только заголовок.
+    Колонки CATEGORY_COLUMNS читаются строками, даже если в файле
+    в них только цифры. Сжатый файл распаковывается потоком, кодек определяется
+    по расширению.
+    """
+    return pd.read_csv(
+        path,
+        sep=CSV_SEPARATOR,
+        encoding=CSV_ENCODING,
+        header=0,
+        dtype={column: str for column in CATEGORY_COLUMNS},
+        chunksize=chunksize,
+        usecols=None if usecols is None else lambda c: c in usecols,
+        nrows=nrows
+    )
+
+
+class PartitionedStorage:
+    """
+    Хранилище кэша источника, разбитое на партиции по колонке Date.
+
+    Каждая партиция (день или месяц) хранится в отдельном .csv файле
+    в папке источника, сжатом кодеком compression. При обновлении
+    перезаписываются только партиции, затронутые обновляемыми датами
+    и новыми данными. Прочитанные партиции приводятся к типам схемы schema.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        natural_key: list,
+        granularity: str = PARTITION_GRANULARITY,
+        schema: dict | None = None,
+        compression: tuple | None = None
+    ):
+        if granularity not in PARTITION_KEY_LENGTH:
+            raise ValueError(f'Неизвестная гранулярность: {granularity}')
+        self.path = path
+        self.natural_key = natural_key
+        self.key_length = PARTITION_KEY_LENGTH[granularity]
+        self.schema = schema
+        self.compression = compression
+
+    def _read(self, path: Path) -> pd.DataFrame:
+        """Защищенный метод. Читает файл партиции с типами схемы."""
+        return apply_schema(read_csv(path), self.schema)
+
+    def _partition_keys(self, dates: pd.Series) -> pd.Series:
+        """Защищенный метод. Возвращает ключи партиций для колонки дат."""
+        return dates.astype(str).str[:self.key_length]
+
+    def _partition_path(self, key: str) -> Path:
+        """
+        Защищенный метод. Возвращает путь к файлу партиции
+        без расширения кодека сжатия.
+        """
+        return self.path / f'{key}.csv'
+
+    @staticmethod
+    def _partition_key(path: Path) -> str:
+        """Защищенный метод. Возвращает ключ партиции по имени файла."""
+        return path.name.split('.')[0]
+
+    def _write_partition(self, df: pd.DataFrame, key: str) -> None:
+        """
+        Защищенный метод. Записывает партицию key, а пустую партицию
+        удаляет. Файлы партиции с другим сжатием удаляются.
+        """
+        partition_path = self._partition_path(key)
+        if df.empty:
+            for path in _get_cache_variants(partition_path):
+                path.unlink(missing_ok=True)
+            return
+        write_csv(
+            df,
+            get_cache_path(partition_path, self.compression),
+            self.compression
+        )
+        remove_stale_cache(partition_path, self.compression)
+
+    def _read_partition(self, key: str) -> pd.DataFrame:
+        """
+        Защищенный метод. Читает партицию key с любым сжатием
+        или возвращает пустой DataFrame, если ее нет.
+        """
+        path = find_cache_path(self._partition_path(key), self.compression)
+        if not path.exists():
+            return pd.DataFrame()
+        return self._read(path)
+
+    def partitions(self) -> list[Path]:
+        """Метод возвращает файлы партиций от новых к старым."""
+        if not self.path.exists():
+            return []
+        suffixes = ('.csv', *(
+            f'.csv{suffix}' for suffix in CACHE_COMPRESSION_SUFFIXES.values()
+        ))
+        return sorted(
+            (path for path in self.path.iterdir()
+             if path.name.endswith(suffixes)),
+            reverse=True
+        )
+
+    def write(
+        self,
+        df_new: pd.DataFrame,
+        dates_list: list,
+        scope: dict | None = None
+    ) -> None:
+        """
+        Метод обновляет партиции: удаляет из них обновляемые даты
+        в пределах scope и строки с ключами новых данных и дописывает
+        новые данные, см. upsert.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        new_keys = self._partition_keys(
+            df_new['Date'] if 'Date' in df_new.columns
+            else pd.Series(index=df_new.index, dtype=str)
+        )
+        touched = set(new_keys) | set(
+            self._partition_keys(pd.Series(dates_list))
+        )
+
+        for key in sorted(touched):
+            df = upsert(
+                df_new[new_keys == key],
+                self._read_partition(key),
+                self.natural_key,
+                dates_list,
+                scope
+            )
+            self._write_partition(df, key)
+
+        logging.info(
+            f'Обновлено партиций: {len(touched)}, '
+            f'всего партиций: {len(self.partitions())}'
+        )
+
+    def write_chunks(
+        self,
+        chunks: Iterable[pd.DataFrame],
+        dates_list: list,
+        get_scope: Callable[[], dict | None] = dict
+    ) -> int:
+        """
+        Метод обновляет партиции данными, поступающими чанками.
+
+        Чанки раскладываются по временным несжатым файлам партиций,
+        после чего каждая затронутая партиция объединяется
+        с историческими данными, см. upsert. В памяти одновременно
+        находится не больше одной партиции.
+
+        get_scope вызывается после получения всех чанков и возвращает
+        ограничение удаления обновляемых дат, см. drop_dates. Если он
+        возвращает None, даты не удаляются, а при отсутствии новых строк
+        партиции не перезаписываются.
+
+        Returns:
+            int: количество записанных новых строк.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        rows = 0
+        new_paths = {}
+        for df in chunks:
+            rows += len(df)
+            keys = self._partition_keys(df['Date'])
+            for key, part in df.groupby(keys, sort=False):
+                new_path = self.path / f'{key}.csv.new'
+                if key not in new_paths:
+                    new_path.unlink(missing_ok=True)
+                new_paths[key] = new_path
+                append_csv(part, new_path)
+
+        scope = get_scope()
+        if scope is None:
+            if not rows:
+                return 0
+            dates_list = []
+
+        touched = set(new_paths) | set(
+            self._partition_keys(pd.Series(dates_list))
+        )
+        for key in sorted(touched):
+            df_new = pd.DataFrame()
+            if key in new_paths:
+                df_new = self._read(new_paths[key])
+            df = upsert(
+                df_new,
+                self._read_partition(key),
+                self.natural_key,
+                dates_list,
+                scope
+            )
+            self._write_partition(df, key)
+            if key in new_paths:
+                new_paths[key].unlink()
+
+        logging.info(
+            f'Обновлено партиций: {len(touched)}, '
+            f'всего партиций: {len(self.partitions())}'
+        )
+        return rows
+
+    def iter_dates(self, dates_list: list) -> Iterator[pd.DataFrame]:
+        """
+        Метод отдает по одной партиции, содержащие даты dates_list.
+        Строки других дат из партиций не удаляются.
+        """
+        keys = set(self._partition_keys(pd.Series(dates_list)))
+        for path in self.partitions():
+            if self._partition_key(path) in keys:
+                yield self._read(path)
+
+    def read(self) -> pd.DataFrame:
+        """Метод читает все партиции в один DataFrame."""
+        return concat_frames([
+            self._read(path) for path in self.partitions()
+        ])
+
+    def export(self, path: Path) -> None:
+        """
+        Метод выгружает все партиции в один .csv файл в прежнем формате,
+        сжатый кодеком compression. Партиции читаются и дописываются
+        в поток по одной.
+
+        Колонки файла - объединение колонок всех партиций в порядке
+        от новых партиций к старым. Каждая партиция приводится к этим
+        колонкам, недостающие остаются пустыми.
+        """
+        partitions = self.partitions()
+        if not partitions:
+            return
+        columns = list(dict.fromkeys(
+            column
+            for partition_path in partitions
+            for column in read_csv(partition_path, nrows=0).columns
+        ))
+        temp_path = path.with_name(f'{path.name}.tmp')
+        with open_csv(temp_path, self.compression) as file:
+            header = True
+            for partition_path in partitions:
+                write_frame(
+                    read_csv(partition_path).reindex(columns=columns),
+                    file,
+                    header
+                )
+                header = False
+        os.replace(temp_path, path)
+        logging.info(f'Партиции выгружены в {path.name}')
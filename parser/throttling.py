@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+from parser.constants import (
+    DIRECT_UNITS_LOW_WATERMARK,
+    DIRECT_UNITS_MAX_BACKOFF,
+    HOST_RATE_LIMITS
+)
+from parser.logging_config import request_logger
+
+
+class RateLimiter:
+    """
+    Ограничитель частоты запросов к API по хостам.
+
+    Для каждого хоста выдерживает минимальный интервал между запросами,
+    исходя из допустимого количества запросов в секунду. Потокобезопасен,
+    поэтому один объект можно использовать из нескольких потоков.
+    """
+
+    def __init__(self, rate_limits: dict = HOST_RATE_LIMITS):
+        self.rate_limits = rate_limits
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str) -> None:
+        """Метод блокирует поток, пока для хоста url не освободится слот."""
+        host = urlsplit(url).netloc
+        rate = self.rate_limits.get(host)
+        if not rate:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + 1 / rate
+
+        time.sleep(max(0.0, slot - now))
+
+
+class UnitsScheduler:
+    """
+    Планировщик запросов к API Директа по остатку баллов.
+
+    Читает заголовки Units ('израсходовано/остаток/суточный лимит')
+    и Units-Used-Login из ответов API и хранит остаток баллов по тому
+    логину, с которого они списаны: логину клиента или агентства.
+    Пока остаток выше порога, запросы отправляются без задержек,
+    при его снижении задержка растет пропорционально нехватке баллов.
+    """
+
+    def __init__(
+        self,
+        low_watermark: float = DIRECT_UNITS_LOW_WATERMARK,
+        max_backoff: float = DIRECT_UNITS_MAX_BACKOFF
+    ):
+        self.low_watermark = low_watermark
+        self.max_backoff = max_backoff
+        self._balances = {}
+        self._owners = {}
+        self._lock = threading.Lock()
+
+    def update(self, login: str, headers) -> None:
+        """Метод обновляет остаток баллов по заголовкам ответа API."""
+        units = headers.get('Units')
+        if not units:
+            return
+        try:
+            spent, rest, limit = (int(value) for value in units.split('/'))
+        except ValueError:
+            logging.warning(f'Некорректный заголовок Units: {units}')
+            return
+
+        owner = headers.get('Units-Used-Login', login)
+        with self._lock:
+            self._owners[login] = owner
+            self._balances[owner] = (spent, rest, limit)
+        request_logger.debug(
+            f'Баллы {owner}: израсходовано {spent}, '
+            f'остаток {rest} из {limit}'
+        )
+
+    def get_delay(self, login: str) -> float:
+        """Метод возвращает задержку в секундах перед запросом логина."""
+        with self._lock:
+            owner = self._owners.get(login, login)
+            balance = self._balances.get(owner)
+        if balance is None:
+            return 0.0
+
+        _, rest, limit = balance
+        threshold = limit * self.low_watermark
+        if not threshold or rest >= threshold:
+            return 0.0
+        return self.max_backoff * (1 - max(rest, 0) / threshold)
+
+    def wait(self, login: str) -> None:
+        """Метод блокирует поток, если баллов логина недостаточно."""
+        delay = self.get_delay(login)
+        if delay:
+            logging.warning(
+                f'Мало баллов для {login}, пауза {round(delay, 1)} сек.'
+            )
+            time.sleep(delay)
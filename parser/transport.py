@@ -0,0 +1,133 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from parser.constants import (
+    HTTP_POOL_CONNECTIONS,
+    HTTP_POOL_MAXSIZE,
+    HTTP_TIMEOUT
+)
+from parser.metrics import registry
+
+
+class HttpTransport:
+    """
+    Общий HTTP-транспорт для клиентов API Яндекса.
+
+    Держит одну requests.Session с пулом keep-alive соединений, поэтому
+    TCP и TLS соединения переиспользуются между запросами и клиентами.
+    Принимает сжатые gzip ответы, подставляет таймаут по умолчанию и
+    собирает статистику запросов по хостам.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = HTTP_POOL_CONNECTIONS,
+        pool_maxsize: int = HTTP_POOL_MAXSIZE,
+        timeout: tuple = HTTP_TIMEOUT
+    ):
+        self.timeout = timeout
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self.session.headers.update({
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive'
+        })
+        self._stats = defaultdict(lambda: {'requests': 0, 'bytes': 0})
+        self._lock = threading.Lock()
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        **kwargs
+    ) -> requests.Response:
+        """
+        Метод выполняет HTTP-запрос через общую сессию.
+
+        Для потоковых ответов объем берется из заголовка Content-Length,
+        так как тело еще не прочитано.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlsplit(url).hostname
+        start_time = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except Exception:
+            registry.inc('http_requests_total', host=host, status='error')
+            raise
+
+        if kwargs.get('stream'):
+            size = int(response.headers.get('Content-Length', 0))
+        else:
+            size = len(response.content)
+        registry.observe(
+            'http_request_seconds',
+            time.perf_counter() - start_time,
+            host=host,
+            method=method
+        )
+        registry.inc(
+            'http_requests_total',
+            host=host,
+            status=response.status_code
+        )
+        registry.inc('http_response_bytes_total', size, host=host)
+        with self._lock:
+            stats = self._stats[host]
+            stats['requests'] += 1
+            stats['bytes'] += size
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Метод выполняет GET-запрос."""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, data=None, **kwargs) -> requests.Response:
+        """Метод выполняет POST-запрос."""
+        return self.request('POST', url, data=data, **kwargs)
+
+    def pool_stats(self) -> dict:
+        """
+        Метод возвращает статистику по хостам: количество запросов,
+        полученных байт и открытых соединений пула.
+        """
+        with self._lock:
+            stats = {host: dict(value) for host, value in self._stats.items()}
+
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host_stats = stats.setdefault(
+                pool.host,
+                {'requests': 0, 'bytes': 0}
+            )
+            host_stats['connections'] = (
+                host_stats.get('connections', 0) + pool.num_connections
+            )
+        return stats
+
+    def log_stats(self) -> None:
+        """Метод логирует статистику пула соединений по хостам."""
+        for host, stats in self.pool_stats().items():
+            logging.info(
+                f'Хост {host}: запросов {stats["requests"]}, '
+                f'соединений {stats.get("connections", 0)}, '
+                f'получено байт {stats["bytes"]}'
+            )
+
+    def close(self) -> None:
+        """Метод закрывает сессию и все соединения пула."""
+        self.session.close()
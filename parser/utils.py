@@ -1,21 +1,30 @@
 import datetime as dt
 import logging
 import os
-
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING
 
 from parser.constants import (
     DATE_FORMAT,
     DAYS_TO_GENERATE_APPMETRICA,
     DAYS_TO_GENERATE_DIRECT,
-    DAYS_TO_GENERATE_METRICA
+    DAYS_TO_GENERATE_METRICA,
+    DB_BACKEND,
+    FINALIZATION_DAYS_APPMETRICA,
+    FINALIZATION_DAYS_DIRECT,
+    FINALIZATION_DAYS_METRICA,
+    HTTP_CACHE_BYPASS_ENV,
+    INCREMENTAL_REFRESH
 )
-from parser.logging_config import setup_logging
-from parser.ya_appmetrica import YandexAppMetricaReports
-from parser.ya_direct import YandexDirectReports
-from parser.ya_metrica import YandexMetricaReports
+from parser.http_cache import ResponseCache
+from parser.pipeline import Pipeline
+from parser.state import RefreshState
+from parser.throttling import RateLimiter, UnitsScheduler
 
-setup_logging()
+if TYPE_CHECKING:
+    from parser.transport import HttpTransport
+    from parser.ya_appmetrica import YandexAppMetricaReports
+    from parser.ya_direct import YandexDirectReports
+    from parser.ya_metrica import YandexMetricaReports
 
 
 def get_date_list(
@@ -34,17 +43,97 @@ def get_date_list(
     return dates_list
 
 
-def initialize_components(
+def get_dates_lists(
     logins: list[str],
     client_m_id: str,
     client_am_id: str,
     client_name: str
+) -> dict:
+    """
+    Функция возвращает списки обновляемых дат и состояния обновления
+    источников клиента.
+
+    При INCREMENTAL_REFRESH списки дат строятся по файлам состояния:
+    обновляются даты внутри окна изменения данных и пропуски после
+    неудачных выгрузок, но не глубже DAYS_TO_GENERATE_* дней.
+
+    Returns:
+        dict: {источник: (список дат, состояние или None)}.
+    """
+    date_list_direct = get_date_list(DAYS_TO_GENERATE_DIRECT, 0, -1)
+    date_list_appmetrica = get_date_list(DAYS_TO_GENERATE_APPMETRICA, 2)
+    date_list_metrica = get_date_list(DAYS_TO_GENERATE_METRICA, 0, -1)
+
+    state_direct = state_metrica = state_appmetrica = None
+    if INCREMENTAL_REFRESH:
+        state_direct = RefreshState(
+            client_name,
+            'direct',
+            FINALIZATION_DAYS_DIRECT
+        )
+        state_metrica = RefreshState(
+            client_name,
+            'metrica',
+            FINALIZATION_DAYS_METRICA
+        )
+        state_appmetrica = RefreshState(
+            client_name,
+            'appmetrica',
+            FINALIZATION_DAYS_APPMETRICA
+        )
+        date_list_direct = state_direct.get_dates_list(
+            logins,
+            DAYS_TO_GENERATE_DIRECT
+        )
+        date_list_metrica = state_metrica.get_dates_list(
+            [client_m_id],
+            DAYS_TO_GENERATE_METRICA
+        )
+        date_list_appmetrica = state_appmetrica.get_dates_list(
+            [client_am_id],
+            DAYS_TO_GENERATE_APPMETRICA
+        )
+        logging.info(
+            f'Даты для обновления {client_name}: '
+            f'direct {len(date_list_direct)}, '
+            f'metrica {len(date_list_metrica)}, '
+            f'appmetrica {len(date_list_appmetrica)}'
+        )
+
+    return {
+        'direct': (date_list_direct, state_direct),
+        'metrica': (date_list_metrica, state_metrica),
+        'appmetrica': (date_list_appmetrica, state_appmetrica)
+    }
+
+
+def initialize_components(
+    logins: list[str],
+    client_m_id: str,
+    client_am_id: str,
+    client_name: str,
+    transport: 'HttpTransport | None' = None,
+    units: UnitsScheduler | None = None
 ) -> tuple:
     """
     Инициализирует и возвращает все необходимые
     компоненты для работы проекта.
+
+    Все клиенты API используют общий HTTP-транспорт transport
+    и общий ограничитель частоты запросов. Остатки баллов Директа units
+    могут разделяться между клиентами одного агентства. Кэш ответов
+    отключается переменной окружения YANDEX_PARSER_NO_CACHE=1.
+    Если задана база данных DB_BACKEND, выгрузки дублируются в ее таблицы.
+    Списки дат строятся функцией get_dates_lists.
+
+    Модули клиентов API импортируются здесь, а не при импорте utils,
+    чтобы легкие команды не загружали pandas и requests.
     """
-    load_dotenv()
+    from parser.db import DatabaseSink
+    from parser.transport import HttpTransport
+    from parser.ya_appmetrica import YandexAppMetricaReports
+    from parser.ya_direct import YandexDirectReports
+    from parser.ya_metrica import YandexMetricaReports
 
     token_direct = str(os.getenv('YANDEX_DIRECT_TOKEN'))
     token_metrica = str(os.getenv('YANDEX_METRICA_TOKEN'))
@@ -54,21 +143,37 @@ def initialize_components(
         logging.error('Отсутствуют переменные окружения')
         raise ValueError
 
-    date_list_direct = get_date_list(DAYS_TO_GENERATE_DIRECT, 0, -1)
-    date_list_appmetrica = get_date_list(DAYS_TO_GENERATE_APPMETRICA, 2)
-    date_list_metrica = get_date_list(DAYS_TO_GENERATE_METRICA, 0, -1)
+    dates = get_dates_lists(logins, client_m_id, client_am_id, client_name)
+    date_list_direct, state_direct = dates['direct']
+    date_list_metrica, state_metrica = dates['metrica']
+    date_list_appmetrica, state_appmetrica = dates['appmetrica']
+
+    transport = transport or HttpTransport()
+    rate_limiter = RateLimiter()
+    cache = ResponseCache(enabled=os.getenv(HTTP_CACHE_BYPASS_ENV) != '1')
+    sink = DatabaseSink(DB_BACKEND) if DB_BACKEND else None
 
     metrica = YandexMetricaReports(
         token=token_metrica,
         dates_list=date_list_metrica,
         login=logins,
-        metrica_id=client_m_id
+        metrica_id=client_m_id,
+        state=state_metrica,
+        rate_limiter=rate_limiter,
+        transport=transport,
+        cache=cache,
+        sink=sink
     )
 
     direct = YandexDirectReports(
         token=token_direct,
         dates_list=date_list_direct,
-        login=logins
+        login=logins,
+        state=state_direct,
+        transport=transport,
+        units=units,
+        cache=cache,
+        sink=sink
     )
 
     appmetrica = YandexAppMetricaReports(
@@ -76,18 +181,62 @@ def initialize_components(
         dates_list=date_list_appmetrica,
         appmetrica_id=client_am_id,
         filename_temp=f'{client_name}_direct.csv',
+        state=state_appmetrica,
+        rate_limiter=rate_limiter,
+        transport=transport,
+        cache=cache,
+        sink=sink
     )
 
     return appmetrica, direct, metrica
 
 
 def run(
-    obj_direct: YandexDirectReports,
-    obj_metrica: YandexMetricaReports,
-    obj_appmetrica: YandexAppMetricaReports,
+    obj_direct: 'YandexDirectReports',
+    obj_metrica: 'YandexMetricaReports',
+    obj_appmetrica: 'YandexAppMetricaReports',
     client_name: str
 ) -> None:
-    """Функция запуска активных методов объектов класса."""
-    obj_direct.save_data(filename_data=f'{client_name}_direct.csv')
-    obj_metrica.save_data(filename_data=f'{client_name}_metrica.csv')
-    obj_appmetrica.save_data(filename_data=f'{client_name}_appmetrica.csv')
+    """
+    Функция запуска активных методов объектов класса.
+
+    Метрика не зависит от Директа и выгружается параллельно с ним.
+    Аппметрика запускается после Директа и получает набор его кампаний
+    из памяти, который дополняется кампаниями из файла Директа. Витрина ROMI
+    обновляется последней за даты, обновленные в любом из источников.
+    """
+    from parser.mart import RomiMart
+
+    def run_direct() -> set | None:
+        obj_direct.save_data(filename_data=f'{client_name}_direct.csv')
+        return obj_direct.get_campaigns()
+
+    def run_metrica() -> None:
+        obj_metrica.save_data(filename_data=f'{client_name}_metrica.csv')
+
+    def run_appmetrica(campaigns: set | None) -> None:
+        obj_appmetrica.save_data(
+            filename_data=f'{client_name}_appmetrica.csv',
+            campaigns=campaigns
+        )
+
+    def run_romi(*_) -> None:
+        dates_list = sorted(
+            set(obj_direct.dates_list)
+            | set(obj_metrica.dates_list)
+            | set(obj_appmetrica.dates_list)
+        )
+        RomiMart(client_name, dates_list).save_data(
+            filename_data=f'{client_name}_romi.csv'
+        )
+
+    pipeline = Pipeline()
+    pipeline.add_stage('direct', run_direct)
+    pipeline.add_stage('metrica', run_metrica)
+    pipeline.add_stage('appmetrica', run_appmetrica, depends_on=('direct',))
+    pipeline.add_stage(
+        'romi',
+        run_romi,
+        depends_on=('direct', 'metrica', 'appmetrica')
+    )
+    pipeline.run()
@@ -1,32 +1,54 @@
 import datetime as dt
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
-from dotenv import load_dotenv
 import pandas as pd
 import requests
 
 from parser.constants import (
+    CACHE_STORAGE,
+    APPMETRICA_CAMPAIGN_DIMENSION,
+    APPMETRICA_GROUPED_MODE,
+    APPMETRICA_MAX_WORKERS,
+    APPMETRICA_RECENT_CAMPAIGNS,
+    CSV_CHUNK_SIZE,
     DATE_FORMAT,
     DAYS_BEFORE,
     DEFAULT_COLUMNS_CAMPAIGN,
     DEFAULT_FOLDER,
+    NATURAL_KEY_APPMETRICA,
+    NATURAL_KEY_DIRECT,
     REPORT_FIELDS_APPMETRICA,
     YANDEX_APPMETRICA_URL,
     APPMETRICA_LIMIT,
 )
-from parser.logging_config import setup_logging
-from parser.mixins import ColumnMixin, FileMixin
-
-load_dotenv()
-setup_logging()
+from parser.db import DatabaseSink
+from parser.http_cache import ResponseCache
+from parser.logging_config import request_logger
+from parser.metrics import registry
+from parser.mixins import ColumnMixin, FileMixin, RequestMixin
+from parser.retry import RetryPolicy
+from parser.schema import SCHEMA_APPMETRICA, apply_schema
+from parser.state import RefreshState
+from parser.storage import (
+    PartitionedStorage,
+    find_cache_path,
+    get_compression,
+    read_csv
+)
+from parser.throttling import RateLimiter
+from parser.transport import HttpTransport
 
 
-class YandexAppMetricaReports(ColumnMixin, FileMixin):
+class YandexAppMetricaReports(ColumnMixin, FileMixin, RequestMixin):
     """
     Класс для получения и сохранения данных
     отчетов из Яндекс appmetrica.
     """
 
+    source = 'appmetrica'
+
     def __init__(
         self,
         token: str,
@@ -36,21 +58,91 @@ class YandexAppMetricaReports(ColumnMixin, FileMixin):
         report_fields: list = REPORT_FIELDS_APPMETRICA,
         columns: list = DEFAULT_COLUMNS_CAMPAIGN,
         folder_name: str = DEFAULT_FOLDER,
-        limit: str = APPMETRICA_LIMIT
+        storage: str = CACHE_STORAGE,
+        state: RefreshState | None = None,
+        limit: str = APPMETRICA_LIMIT,
+        max_workers: int = APPMETRICA_MAX_WORKERS,
+        rate_limiter: RateLimiter | None = None,
+        grouped_mode: bool = APPMETRICA_GROUPED_MODE,
+        recent_campaigns: bool = APPMETRICA_RECENT_CAMPAIGNS,
+        transport: HttpTransport | None = None,
+        retry_policy: RetryPolicy | None = None,
+        cache: ResponseCache | None = None,
+        sink: DatabaseSink | None = None
     ):
         FileMixin.__init__(
             self,
             dates_list=dates_list,
-            folder_name=folder_name
+            natural_key=NATURAL_KEY_APPMETRICA,
+            folder_name=folder_name,
+            storage=storage,
+            state=state,
+            schema=SCHEMA_APPMETRICA,
+            sink=sink
         )
         ColumnMixin.__init__(self, columns=columns)
         if not token:
             logging.error('Токен отсутствует или не действителен')
         self.token = token
+        self.transport = transport or HttpTransport()
+        self.retry_policy = retry_policy or RetryPolicy(source=self.source)
+        self.cache = cache or ResponseCache()
+        self.fetch_failed = False
         self.appmetrica_id = appmetrica_id
         self.filename_temp = filename_temp
         self.report_fields = report_fields
         self.limit = limit or '1000'
+        self.max_workers = max_workers
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.grouped_mode = grouped_mode
+        self.recent_campaigns = recent_campaigns
+
+    def _get_appmetrica_params(
+        self,
+        date_from: str,
+        date_to: str,
+        dimensions: str = 'ym:ec2:date'
+    ) -> dict:
+        """Защищенный метод. Формирует общие параметры запроса Аппметрики."""
+        return {
+            "ids": self.appmetrica_id,
+            "date1": date_from,
+            "date2": date_to,
+            "group": "Day",
+            "metrics": "ym:ec2:ecomRevenueFiatRUB,ym:ec2:ecomOrdersCount",
+            "dimensions": dimensions,
+            "limit": self.limit,
+            "accuracy": "1",
+            "include_undefined": "true",
+            "currency": "RUB",
+            "event_attribution": "last_appmetrica",
+            "sort": "-ym:ec2:ecomOrdersCount",
+            "lang": "ru",
+            "request_domain": "ru"
+        }
+
+    def _get_device_filter(
+        self,
+        date_reports: str,
+        campaign_name: str | None = None
+    ) -> str:
+        """
+        Защищенный метод. Формирует фильтр устройств с меткой utm_campaign
+        кампании campaign_name (или любой кампании, если она не задана),
+        пришедших в течение DAYS_BEFORE дней до даты отчета.
+        """
+        date_obj = dt.datetime.strptime(date_reports, DATE_FORMAT)
+        days_before = date_obj - dt.timedelta(days=DAYS_BEFORE)
+        days_before = days_before.strftime(DATE_FORMAT)
+        campaign = "urlParamKey=='utm_campaign'"
+        if campaign_name is not None:
+            campaign += f" and urlParamValue=='{campaign_name}'"
+        return (
+            "(exists ym:o:device with "
+            f"(exists({campaign}) "
+            f"and specialDefaultDate>='{days_before}' "
+            f"and specialDefaultDate<='{date_reports}'))"
+        )
 
     def _get_appmetrica_report(
         self,
@@ -62,56 +154,31 @@ class YandexAppMetricaReports(ColumnMixin, FileMixin):
         Получает отчет из Яндекс.Апметрика для указанного магазина и периода.
         """
         try:
-            date_obj = dt.datetime.strptime(date_reports, DATE_FORMAT)
-            days_before = date_obj - dt.timedelta(days=DAYS_BEFORE)
-            days_before = days_before.strftime(DATE_FORMAT)
             url = YANDEX_APPMETRICA_URL
             headers = {
                 "Authorization": f"OAuth {self.token}"}
-            params = {
-                "ids": self.appmetrica_id,
-                "date1": date_reports,
-                "date2": date_reports,
-                "group": "Day",
-                "metrics": "ym:ec2:ecomRevenueFiatRUB,ym:ec2:ecomOrdersCount",
-                "dimensions": "ym:ec2:date",
-                "limit": self.limit,
-                "accuracy": "1",
-                "include_undefined": "true",
-                "currency": "RUB",
-                "event_attribution": "last_appmetrica",
-                "sort": "-ym:ec2:ecomOrdersCount",
-                "lang": "ru",
-                "request_domain": "ru"
-            }
-
-            filters = (
-                "(exists ym:o:device with "
-                "(exists(urlParamKey=='utm_campaign' "
-                f"and urlParamValue=='{campaign_name}') "
-                f"and specialDefaultDate>='{days_before}' "
-                f"and specialDefaultDate<='{date_reports}'))"
+            params = self._get_appmetrica_params(date_reports, date_reports)
+            params['filters'] = self._get_device_filter(
+                date_reports,
+                campaign_name
             )
-            params['filters'] = filters
-            logging.info(f'Параметры запроса: {params}')
+            request_logger.debug(f'Параметры запроса: {params}')
 
-            response = requests.get(
+            data, _ = self._get_json(
                 url,
-                params=params,
-                headers=headers,
+                headers,
+                params,
+                self.cache.get_ttl(date_reports)
             )
-            logging.info(f'Полный URL запроса: {response.request.url}')
-            response.raise_for_status()
-            data = response.json()
 
             if not data or 'data' not in data or not data['data']:
-                logging.warning(
+                request_logger.debug(
                     'Нет данных для кампании '
                     f'{campaign_name} на {date_reports}'
                 )
                 return [date_reports, campaign_name, 0, 0.0]
             else:
-                logging.info(
+                request_logger.debug(
                     'Данные для кампании '
                     f'{campaign_name} на {date_reports} успешно получены'
                 )
@@ -131,42 +198,211 @@ class YandexAppMetricaReports(ColumnMixin, FileMixin):
             logging.error(f'Ошибка: {e}')
             raise
 
+    def _get_appmetrica_grouped_report(self, date_reports: str) -> dict:
+        """
+        Защищенный метод.
+        Получает отчет Аппметрики за дату с группировкой по кампаниям.
+
+        Кампания запрашивается измерением APPMETRICA_CAMPAIGN_DIMENSION,
+        а устройства отбираются тем же фильтром окна DAYS_BEFORE дней,
+        что и в запросе по одной кампании, см. _get_device_filter.
+        Страницы отчета перебираются через offset до total_rows,
+        метрики нескольких строк одной кампании суммируются.
+
+        Returns:
+            dict: {(дата, кампания): (Transactions, Revenue)}.
+        """
+        url = YANDEX_APPMETRICA_URL
+        headers = {
+            "Authorization": f"OAuth {self.token}"}
+        params = self._get_appmetrica_params(
+            date_reports,
+            date_reports,
+            dimensions=f'ym:ec2:date,{APPMETRICA_CAMPAIGN_DIMENSION}'
+        )
+        params['filters'] = self._get_device_filter(date_reports)
+        ttl = self.cache.get_ttl(date_reports)
+        result = {}
+        offset = 1
+
+        while True:
+            params['offset'] = offset
+            data, _ = self._get_json(url, headers, params, ttl)
+
+            for item in data.get('data', []):
+                key = (
+                    item['dimensions'][0]['name'],
+                    item['dimensions'][1]['name']
+                )
+                revenue, transactions = item.get('metrics', [0.0, 0.0])
+                total_transactions, total_revenue = result.get(key, (0, 0.0))
+                result[key] = (
+                    total_transactions + int(float(transactions)),
+                    total_revenue + float(revenue)
+                )
+
+            offset += int(self.limit)
+            if not data.get('data') or offset > data.get('total_rows', 0):
+                break
+
+        request_logger.debug(
+            f'Группированный отчет за {date_reports} получен, '
+            f'строк: {len(result)}'
+        )
+        return result
+
+    def _get_filtered_data(self, tasks: list) -> list:
+        """
+        Защищенный метод.
+        Получает данные Аппметрики отдельным запросом на каждую пару
+        (дата, кампания) с фильтром по utm_campaign. Строки об отдельных
+        запросах пишутся выборочно, итог - одной строкой.
+        """
+        data_list = []
+        errors = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(self._get_appmetrica_report, *task)
+                for task in tasks
+            ]
+            for (date_str, campaign_name), future in zip(tasks, futures):
+                try:
+                    data_list.append(future.result())
+                except Exception as e:
+                    logging.error(
+                        f'Ошибка для кампании {campaign_name} '
+                        f'на дату {date_str}: {e}')
+                    self.fetch_failed = True
+                    errors += 1
+                    continue
+        logging.info(
+            f'Запросов к Аппметрике: {len(tasks)}, '
+            f'с данными: {sum(1 for row in data_list if any(row[2:]))}, '
+            f'ошибок: {errors}'
+        )
+        return data_list
+
+    def _get_grouped_data(self, tasks: list) -> list:
+        """
+        Защищенный метод.
+        Получает данные Аппметрики группированным запросом на каждую дату
+        и раскладывает их по парам (дата, кампания) из tasks. Кампании
+        без данных получают нулевые значения, пары дат, запрос которых
+        завершился ошибкой, пропускаются.
+        """
+        dates = sorted({date_str for date_str, _ in tasks})
+        report = {}
+        failed = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(self._get_appmetrica_grouped_report, date_str)
+                for date_str in dates
+            ]
+            for date_str, future in zip(dates, futures):
+                try:
+                    report.update(future.result())
+                except Exception as e:
+                    logging.error(
+                        f'Ошибка группированного запроса на дату {date_str}: '
+                        f'{e}'
+                    )
+                    self.fetch_failed = True
+                    failed.add(date_str)
+        logging.info(
+            f'Группированных запросов к Аппметрике: {len(dates)}, '
+            f'ошибок: {len(failed)}'
+        )
+
+        return [
+            [date_str, campaign_name, *report.get(
+                (date_str, campaign_name),
+                (0, 0.0)
+            )]
+            for date_str, campaign_name in tasks
+            if date_str not in failed
+        ]
+
+    def _get_campaigns_list(self, filename_temp: str) -> list | None:
+        """
+        Защищенный метод. Читает названия кампаний из файла Директа
+        по частям. Файл читается со сжатием, заданным для Директа.
+        При хранении кэша в партициях кампании читаются из партиций
+        Директа.
+        """
+        paths = [find_cache_path(
+            self._get_file_path(filename_temp),
+            get_compression('direct')
+        )]
+        if self.storage == 'partitioned':
+            storage = PartitionedStorage(
+                self._get_file_path(Path(filename_temp).stem),
+                NATURAL_KEY_DIRECT
+            )
+            paths = storage.partitions() or paths
+        campaigns = {}
+        try:
+            for path in paths:
+                for campaign_df in read_csv(
+                    path,
+                    chunksize=CSV_CHUNK_SIZE,
+                    usecols=['CampaignName']
+                ):
+                    campaigns.update(
+                        dict.fromkeys(campaign_df['CampaignName'].unique())
+                    )
+        except FileNotFoundError:
+            logging.error('Файл с кампаниями не найден')
+            return None
+        return list(campaigns)
+
     def _get_all_appmetrica_data(
         self,
-        filename_temp: str
+        filename_temp: str,
+        campaigns: set | None = None
     ) -> pd.DataFrame:
         """
         Защищенный метод, получает данные из Яндекс Апметрика
         для указанного id и периода.
-        """
-        data_list = []
 
+        Запрашиваются все кампании из файла Директа filename_temp,
+        объединенные с набором campaigns последней выгрузки Директа,
+        чтобы не пропускать кампании без расходов в обновленном периоде.
+        При APPMETRICA_RECENT_CAMPAIGNS запрашиваются только кампании
+        из campaigns.
+        """
+        self.fetch_failed = False
         df = pd.DataFrame(columns=self.report_fields)
-        temp_cache_path = self._get_file_path(filename_temp)
-        try:
-            campaign_df = pd.read_csv(
-                temp_cache_path,
-                sep=';',
-                encoding='cp1251'
-            )
-            campaigns_list = campaign_df['CampaignName'].unique().tolist()
-        except FileNotFoundError:
-            logging.error('Файл с кампаниями не найден')
+        if campaigns is not None and self.recent_campaigns:
+            campaigns_list = campaigns
+        else:
+            campaigns_list = self._get_campaigns_list(filename_temp)
+            if campaigns is not None:
+                campaigns_list = [*(campaigns_list or []), *campaigns]
+        if campaigns_list is None:
+            self.fetch_failed = True
             return df
+        campaigns_list = sorted({
+            campaign_name for campaign_name in campaigns_list
+            if isinstance(campaign_name, str)
+        })
 
-        for date_str in self.dates_list:
-            for campaign_name in campaigns_list:
-                try:
-                    if 'rmp' in campaign_name:
-                        continue
+        tasks = [
+            (date_str, campaign_name)
+            for date_str in self.dates_list
+            for campaign_name in campaigns_list
+            if 'rmp' not in campaign_name
+        ]
+        if self.grouped_mode:
+            data_list = self._get_grouped_data(tasks)
+        else:
+            data_list = self._get_filtered_data(tasks)
 
-                    data = self._get_appmetrica_report(date_str, campaign_name)
-                    data_list.append(data)
-                except Exception as e:
-                    logging.error(
-                        f'Ошибка для кампании {campaign_name} '
-                        f'на дату {date_str}: {e}')
-                    continue
+        registry.inc(
+            'rows_total',
+            len(data_list),
+            source=self.source,
+            login=self.appmetrica_id
+        )
         if data_list:
             df = pd.DataFrame(data_list, columns=self.report_fields)
         else:
@@ -178,12 +414,29 @@ class YandexAppMetricaReports(ColumnMixin, FileMixin):
         campaign_parts = self._split_campaign(df['CampaignName'])
         df = pd.concat([df, campaign_parts], axis=1)
 
-        return df
+        return apply_schema(df, self.schema)
 
-    def save_data(self, filename_data: str) -> None:
+    def _get_refresh_scope(self) -> dict | None:
+        """
+        Защищенный метод. Если часть запросов завершилась ошибкой,
+        обновляемые даты из кэша не удаляются, а заменяются только
+        полученные строки.
+        """
+        return None if self.fetch_failed else {}
+
+    def save_data(
+        self,
+        filename_data: str,
+        campaigns: set | None = None
+    ) -> None:
         """
         Метод сохраняет новые данные, объединяя с существующими.
         Наследуется от миксина FileMixin
         """
-        df_new = self._get_all_appmetrica_data(self.filename_temp)
+        if not self.dates_list:
+            logging.info('Нет дат для обновления')
+            return
+        df_new = self._get_all_appmetrica_data(self.filename_temp, campaigns)
         super().save_data(df_new, filename_data)
+        if not self.fetch_failed:
+            self._mark_refreshed([self.appmetrica_id])
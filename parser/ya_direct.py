@@ -1,30 +1,55 @@
-import io
+import datetime as dt
+import heapq
 import json
 import logging
+import math
 import time
-from typing import Any
+from collections import deque
+from itertools import count
+from typing import Any, BinaryIO, Iterator
 
-from dotenv import load_dotenv
 import pandas as pd
 import requests
 
 from parser.constants import (
+    CACHE_STORAGE,
+    DATE_FORMAT,
     DEFAULT_FOLDER,
+    NATURAL_KEY_DIRECT,
     DEFAULT_COLUMNS_CAMPAIGN,
+    DIRECT_CHUNK_SIZE,
+    DIRECT_QUEUE_LIMIT,
+    DIRECT_QUEUE_MODE,
+    DIRECT_RETRY_IN,
+    DIRECT_RETRY_STATUSES,
+    DIRECT_SHARD_MAX_ROWS,
+    HTTP_CACHE_CHUNK_SIZE,
     REPORT_FIELDS_DIRECT,
     REPORT_NAME,
     YANDEX_DIRECT_URL
 )
-from parser.logging_config import setup_logging
+from parser.db import DatabaseSink
+from parser.http_cache import ResponseCache
+from parser.logging_config import request_logger
+from parser.metrics import registry
 from parser.mixins import ColumnMixin, FileMixin
-
-load_dotenv()
-setup_logging()
+from parser.retry import RETRYABLE_EXCEPTIONS, RetryPolicy
+from parser.schema import (
+    DIRECT_READ_DTYPES,
+    SCHEMA_DIRECT,
+    apply_schema,
+    concat_frames
+)
+from parser.state import RefreshState
+from parser.throttling import UnitsScheduler
+from parser.transport import HttpTransport
 
 
 class YandexDirectReports(ColumnMixin, FileMixin):
     """Класс для получения и сохранения данных отчетов из Яндекс direct."""
 
+    source = 'direct'
+
     def __init__(
         self,
         token: str,
@@ -32,19 +57,55 @@ class YandexDirectReports(ColumnMixin, FileMixin):
         login: list,
         report_fields: list = REPORT_FIELDS_DIRECT,
         columns: list = DEFAULT_COLUMNS_CAMPAIGN,
-        folder_name: str = DEFAULT_FOLDER
+        folder_name: str = DEFAULT_FOLDER,
+        storage: str = CACHE_STORAGE,
+        state: RefreshState | None = None,
+        queue_mode: bool = DIRECT_QUEUE_MODE,
+        queue_limit: int = DIRECT_QUEUE_LIMIT,
+        chunk_size: int = DIRECT_CHUNK_SIZE,
+        shard_max_rows: int = DIRECT_SHARD_MAX_ROWS,
+        transport: HttpTransport | None = None,
+        units: UnitsScheduler | None = None,
+        retry_policy: RetryPolicy | None = None,
+        cache: ResponseCache | None = None,
+        sink: DatabaseSink | None = None
     ):
         FileMixin.__init__(
             self,
             dates_list=dates_list,
-            folder_name=folder_name
+            natural_key=NATURAL_KEY_DIRECT,
+            folder_name=folder_name,
+            storage=storage,
+            state=state,
+            schema=SCHEMA_DIRECT,
+            sink=sink
         )
         ColumnMixin.__init__(self, columns=columns)
         if not token:
             logging.error('Токен отсутствует или не действителен')
         self.token = token
+        self.transport = transport or HttpTransport()
+        self.units = units or UnitsScheduler()
+        self.retry_policy = retry_policy or RetryPolicy(
+            retry_statuses=DIRECT_RETRY_STATUSES,
+            source=self.source
+        )
+        self.cache = cache or ResponseCache()
+        self.fetched_logins = []
+        self.failed_logins = set()
+        self.row_counts = {}
+        self.campaigns = set()
         self.logins = login
         self.report_fields = report_fields
+        if queue_limit < 1:
+            logging.error(
+                f'Лимит офлайн-очереди Директа меньше 1: {queue_limit}'
+            )
+            raise ValueError(f'Некорректный лимит очереди: {queue_limit}')
+        self.queue_mode = queue_mode
+        self.queue_limit = queue_limit
+        self.chunk_size = chunk_size
+        self.shard_max_rows = shard_max_rows
 
     def _decode_if_bytes(self, x: Any) -> Any:
         """
@@ -56,24 +117,23 @@ class YandexDirectReports(ColumnMixin, FileMixin):
         else:
             return x
 
-    def _get_direct_report(
+    def _get_direct_headers(
         self,
         login: str,
-        date_from: str,
-        date_to: str
-    ) -> str:
-        """
-        Защищенный метод.
-        Получает отчет из Яндекс direct для указанного логина и периода.
-        """
-
-        headers = {
+        processing_mode: str = 'auto'
+    ) -> dict:
+        """Защищенный метод. Формирует заголовки запроса отчета Директа."""
+        return {
             "Authorization": "Bearer " + self.token,
             "Client-Login": login,
             "Accept-Language": "ru",
-            "processingMode": "auto"
+            "processingMode": processing_mode,
+            "skipReportHeader": "true",
+            "skipReportSummary": "true"
         }
 
+    def _get_direct_body(self, date_from: str, date_to: str) -> str:
+        """Защищенный метод. Формирует тело запроса отчета Директа."""
         body = {
             "params": {
                 "SelectionCriteria": {
@@ -89,130 +149,655 @@ class YandexDirectReports(ColumnMixin, FileMixin):
                 "IncludeDiscount": "NO"
             }
         }
+        return json.dumps(body, indent=4)
 
-        body = json.dumps(body, indent=4)
+    def _send_direct_request(
+        self,
+        headers: dict,
+        body: str
+    ) -> tuple[str, Any]:
+        """
+        Защищенный метод.
+        Отправляет один запрос отчета Директа и разбирает ответ.
 
-        while True:
-            try:
-                response = requests.post(
+        Готовый отчет возвращается потоковым ответом, тело которого
+        читается при разборе и не загружается в память целиком.
+
+        Returns:
+            tuple: ('ready', ответ), ('pending', retryIn в секундах),
+            ('split', None), если период отчета нужно разбить,
+            или ('failed', None).
+        """
+        login = headers['Client-Login']
+        try:
+            self.units.wait(login)
+            with registry.timer(
+                'api_request_seconds',
+                source=self.source,
+                login=login
+            ):
+                response = self.retry_policy.call(
+                    self.transport.post,
                     YANDEX_DIRECT_URL,
                     body,
-                    headers=headers
-                )
-                response.encoding = 'utf-8'
-
-                if response.status_code == requests.codes.bad_request:
-
-                    logging.error(
-                        'Параметры запроса указаны неверно или достигнут '
-                        'лимит отчетов в очереди\n'
-                        'RequestId: '
-                        f'{response.headers.get('RequestId', None)}\n'
-                        f'JSON-код запроса: {self._decode_if_bytes(body)}\n'
-                        'JSON-код ответа сервера: '
-                        f'{self._decode_if_bytes(response.json())}'
-                    )
-                    break
-                elif response.status_code == requests.codes.ok:
-                    logging.info('Ответ успешно получен')
-                    break
-                elif response.status_code == requests.codes.created:
-                    retryIn = int(response.headers.get('retryIn', 60))
-                    logging.warning('Отчет еще создается')
-                    time.sleep(retryIn)
-                elif response.status_code == requests.codes.accepted:
-                    retryIn = int(response.headers.get('retryIn', 60))
-                    logging.warning('Отчет еще создается')
-                    time.sleep(retryIn)
-                elif response.status_code == \
-                        requests.codes.internal_server_error:
-                    logging.error(
-                        'Ошибка. Повторить запрос позднее.\n'
-                        'RequestId: '
-                        f'{response.headers.get('RequestId', None)}\n'
-                        'JSON-код ответа сервера: '
-                        f'{self._decode_if_bytes(response.json())}'
-                    )
-                    break
-                elif response.status_code == requests.codes.bad_gateway:
-                    logging.error(
-                        'Время формирования отчета превышено. '
-                        'Изменить параметры запроса.\n'
-                        'RequestId: '
-                        f'{response.headers.get('RequestId', None)}\n'
-                        f'JSON-код запроса: {self._decode_if_bytes(body)}\n'
-                        'JSON-код ответа сервера: '
-                        f'{self._decode_if_bytes(response.json())}'
-                    )
-                    break
-                else:
-                    logging.error(
-                        'Произошла непредвиденная ошибка.\n'
-                        'RequestId: '
-                        f'{response.headers.get('RequestId', None)}\n'
-                        f'JSON-код запроса: {self._decode_if_bytes(body)}\n'
-                        'JSON-код ответа сервера: '
-                        f'{self._decode_if_bytes(response.json())}'
-                    )
-                    break
-
-            except requests.exceptions.ConnectionError:
-                logging.error('Произошла ошибка соединения с сервером API')
-                break
+                    headers=headers,
+                    stream=True
+                )
+            response.encoding = 'utf-8'
+            self.units.update(login, response.headers)
 
-            except Exception as e:
-                logging.error(f'ошибка: {e}')
-                break
+            if response.status_code == requests.codes.bad_request:
+                logging.error(
+                    'Параметры запроса указаны неверно или достигнут '
+                    'лимит отчетов в очереди\n'
+                    'RequestId: '
+                    f'{response.headers.get('RequestId', None)}\n'
+                    f'JSON-код запроса: {self._decode_if_bytes(body)}\n'
+                    'JSON-код ответа сервера: '
+                    f'{self._decode_if_bytes(response.json())}'
+                )
+                return 'failed', None
+            elif response.status_code == requests.codes.ok:
+                request_logger.debug(f'Отчет {login} получен')
+                registry.inc(
+                    'response_bytes_total',
+                    int(response.headers.get('Content-Length', 0)),
+                    source=self.source,
+                    login=login
+                )
+                return 'ready', response
+            elif response.status_code in (
+                requests.codes.created,
+                requests.codes.accepted
+            ):
+                retryIn = int(
+                    response.headers.get('retryIn', DIRECT_RETRY_IN)
+                )
+                request_logger.debug(f'Отчет {login} еще создается')
+                response.close()
+                return 'pending', retryIn
+            elif response.status_code == \
+                    requests.codes.internal_server_error:
+                logging.error(
+                    'Ошибка. Повторить запрос позднее.\n'
+                    'RequestId: '
+                    f'{response.headers.get('RequestId', None)}\n'
+                    'JSON-код ответа сервера: '
+                    f'{self._decode_if_bytes(response.json())}'
+                )
+                return 'failed', None
+            elif response.status_code == requests.codes.bad_gateway:
+                logging.warning(
+                    'Время формирования отчета превышено. '
+                    'Период отчета будет разбит на части.\n'
+                    'RequestId: '
+                    f'{response.headers.get('RequestId', None)}\n'
+                    f'JSON-код запроса: {self._decode_if_bytes(body)}\n'
+                    'JSON-код ответа сервера: '
+                    f'{self._decode_if_bytes(response.json())}'
+                )
+                return 'split', None
+            else:
+                logging.error(
+                    'Произошла непредвиденная ошибка.\n'
+                    'RequestId: '
+                    f'{response.headers.get('RequestId', None)}\n'
+                    f'JSON-код запроса: {self._decode_if_bytes(body)}\n'
+                    'JSON-код ответа сервера: '
+                    f'{self._decode_if_bytes(response.json())}'
+                )
+                return 'failed', None
 
-        return response.text
+        except RETRYABLE_EXCEPTIONS as e:
+            logging.error(
+                'Произошла ошибка соединения с сервером API '
+                f'после {self.retry_policy.max_attempts} попыток: {e}'
+            )
+            return 'failed', None
 
-    def _get_all_direct_data(self) -> pd.DataFrame:
-        """Метод получает данные из Яндекс direct для всех клиентов."""
-        data_frames = []
+        except Exception as e:
+            logging.error(f'ошибка: {e}')
+            return 'failed', None
 
-        for i, login in enumerate(self.logins, 1):
-            try:
+    def _split_task(
+        self,
+        task: tuple,
+        replay: bool = False
+    ) -> list[tuple] | None:
+        """
+        Защищенный метод. Делит период задачи (логин, начало, конец)
+        пополам. Возвращает две задачи или None, если период - один день.
+        replay - повтор разбиения прошлой выгрузки, он не логируется
+        и не учитывается в метриках.
+        """
+        login, date_from, date_to = task
+        start = dt.datetime.strptime(date_from, DATE_FORMAT).date()
+        end = dt.datetime.strptime(date_to, DATE_FORMAT).date()
+        if end <= start:
+            logging.error(
+                f'Ошибка в аккаунте {login}: отчет за {date_from} '
+                'не сформирован, период нельзя разбить'
+            )
+            return None
+        middle = start + dt.timedelta(days=(end - start).days // 2)
+        if not replay:
+            logging.warning(
+                f'Аккаунт {login}: период {date_from} - {date_to} '
+                f'разбит по {middle.strftime(DATE_FORMAT)}'
+            )
+            registry.inc(
+                'report_splits_total',
+                source=self.source,
+                login=login
+            )
+        return [
+            (login, date_from, middle.strftime(DATE_FORMAT)),
+            (
+                login,
+                (middle + dt.timedelta(days=1)).strftime(DATE_FORMAT),
+                date_to
+            )
+        ]
+
+    def _remember_split(self, task: tuple) -> None:
+        """
+        Защищенный метод. Отмечает в кэше ответов, что период задачи
+        пришлось разбить, чтобы при повторной выгрузке сразу искать
+        в кэше отчеты по частям.
+        """
+        ttl = self.cache.get_ttl(task[2])
+        if self.cache.should_store(ttl):
+            self.cache.put(self._get_split_key(task), [b''], ttl)
+
+    def _open_cached(self, task: tuple) -> BinaryIO | None:
+        """
+        Защищенный метод. Открывает отчет задачи из кэша ответов.
+        Возвращает None, если отчета в кэше нет или его файл удален
+        другим процессом при вытеснении.
+        """
+        login, date_from, date_to = task
+        cached_path = self.cache.get(self._get_cache_key(task))
+        if cached_path is None:
+            return None
+        try:
+            stream = open(cached_path, 'rb')
+        except FileNotFoundError:
+            return None
+        logging.info(
+            f'Аккаунт {login}, период {date_from} - {date_to}: '
+            'отчет взят из кэша'
+        )
+        registry.inc('cache_hits_total', source=self.source, login=login)
+        return stream
+
+    def _iter_cached(
+        self,
+        tasks: list[tuple]
+    ) -> Iterator[tuple[tuple, BinaryIO | None]]:
+        """
+        Защищенный метод. Отдает задачи с открытыми отчетами из кэша
+        ответов или с None, если отчета в кэше нет.
+
+        Задачи, период которых при прошлой выгрузке разбивался,
+        заменяются частями, и в кэше ищутся уже отчеты частей.
+        Файлы открываются по одному по мере перебора.
+        """
+        tasks = deque(tasks)
+        while tasks:
+            task = tasks.popleft()
+            stream = self._open_cached(task)
+            if stream is not None:
+                yield task, stream
+                continue
+            if self.cache.get(self._get_split_key(task)) is not None:
+                shards = self._split_task(task, replay=True)
+                if shards:
+                    tasks.extendleft(reversed(shards))
+                    continue
+            yield task, None
+
+    def _get_cache_periods(self) -> list[list[str]]:
+        """
+        Защищенный метод.
+        Делит обновляемые даты на закрытые, которые старше окна
+        атрибуции, и остальные.
+
+        Срок хранения отчета в кэше ответов определяется его последней
+        датой, а обновляемый период всегда заканчивается вчерашним днем.
+        Поэтому закрытые даты запрашиваются отдельным отчетом, который
+        кэшируется бессрочно. При выключенном кэше период не делится.
+        """
+        if not self.dates_list:
+            return []
+        if not self.cache.enabled:
+            return [self.dates_list]
+        closed = [
+            date_str for date_str in self.dates_list
+            if self.cache.get_ttl(date_str) is None
+        ]
+        recent = self.dates_list[len(closed):]
+        return [dates for dates in (closed, recent) if dates]
+
+    def _plan_tasks(self, login: str) -> list[tuple]:
+        """
+        Защищенный метод.
+        Разбивает обновляемый период логина на задачи отчетов.
+
+        Закрытые даты и даты окна атрибуции запрашиваются разными
+        отчетами, см. _get_cache_periods. Если по истории выгрузок
+        в файле состояния отчет за период ожидается больше
+        shard_max_rows строк, период заранее делится на равные части,
+        чтобы не ждать ошибки формирования отчета.
+        """
+        rows_per_day = None
+        if self.state is not None and self.shard_max_rows:
+            rows_per_day = self.state.get_rows_per_day(login)
+        tasks = []
+        for dates in self._get_cache_periods():
+            shards = 1
+            if rows_per_day:
+                shards = min(
+                    len(dates),
+                    math.ceil(rows_per_day * len(dates) / self.shard_max_rows)
+                )
+            size = math.ceil(len(dates) / shards)
+            tasks.extend(
+                (login, dates[i], dates[min(i + size, len(dates)) - 1])
+                for i in range(0, len(dates), size)
+            )
+        if len(tasks) > 1:
+            logging.info(
+                f'Аккаунт {login}: период разбит на части: {len(tasks)}'
+            )
+        return tasks
+
+    def _get_direct_report(
+        self,
+        login: str,
+        date_from: str,
+        date_to: str
+    ) -> tuple[str, requests.Response | None]:
+        """
+        Защищенный метод.
+        Получает отчет из Яндекс direct для указанного логина и периода.
+
+        Returns:
+            tuple: ('ready', ответ), ('split', None) или ('failed', None).
+        """
+        headers = self._get_direct_headers(login)
+        body = self._get_direct_body(date_from, date_to)
+        started_at = time.monotonic()
+
+        while True:
+            state, payload = self._send_direct_request(headers, body)
+            if state != 'pending':
+                registry.observe(
+                    'report_wait_seconds',
+                    time.monotonic() - started_at,
+                    source=self.source,
+                    login=login
+                )
+                return state, payload
+            time.sleep(self.retry_policy.get_poll_delay(
+                payload,
+                time.monotonic() - started_at
+            ))
+
+    def _iter_direct_reports(
+        self,
+        tasks: list[tuple]
+    ) -> Iterator[tuple[tuple, requests.Response | BinaryIO | None]]:
+        """
+        Защищенный метод.
+        Последовательно получает отчеты Директа по задачам tasks.
+
+        Если отчет не успевает сформироваться, период задачи делится
+        пополам и части запрашиваются следующими. Части, отчеты
+        которых уже есть в кэше ответов, отдаются из кэша.
+        """
+        tasks = deque(tasks)
+        done = 0
+        while tasks:
+            task = tasks.popleft()
+            login, date_from, date_to = task
+            done += 1
+            logging.info(
+                f'Выгрузка {done}/{done + len(tasks)}, аккаунт: {login}, '
+                f'период: {date_from} - {date_to}'
+            )
+            state, response = self._get_direct_report(*task)
+            if state == 'split':
+                shards = self._split_task(task)
+                if shards:
+                    self._remember_split(task)
+                    done -= 1
+                    missing = []
+                    for shard, stream in self._iter_cached(shards):
+                        if stream is None:
+                            missing.append(shard)
+                            continue
+                        yield shard, stream
+                    tasks.extendleft(reversed(missing))
+                    continue
+            yield task, response
+
+    def _iter_direct_reports_queue(
+        self,
+        tasks: list[tuple]
+    ) -> Iterator[tuple[tuple, requests.Response | BinaryIO | None]]:
+        """
+        Защищенный метод.
+        Получает отчеты Директа через офлайн-очередь.
+
+        Ставит в очередь отчеты по задачам, не превышая лимит очереди,
+        опрашивает их совместно с учетом retryIn каждого отчета и отдает
+        готовые отчеты в порядке их готовности. Если отчет не успевает
+        сформироваться, период задачи делится пополам и обе части
+        ставятся в очередь первыми и формируются параллельно. Части,
+        отчеты которых уже есть в кэше ответов, отдаются из кэша.
+
+        Отчет, который уже был принят в очередь, но опрос которого
+        завершился ошибкой, больше не опрашивается. Он может еще
+        формироваться на сервере, поэтому его место считается занятым
+        в течение последнего retryIn этого отчета.
+        """
+        not_submitted = deque(tasks)
+        in_queue = []
+        abandoned = []
+        submitted_at = {}
+        retry_in = {}
+        order = count()
+        submitted = 0
+
+        while not_submitted or in_queue:
+            now = time.monotonic()
+            while abandoned and abandoned[0] <= now:
+                heapq.heappop(abandoned)
+            limit = self.queue_limit - len(abandoned)
+            while not_submitted and len(in_queue) < limit:
+                task = not_submitted.popleft()
+                login, date_from, date_to = task
+                submitted += 1
                 logging.info(
-                    f'Выгрузка {i}/{len(self.logins)}, аккаунт: {login}')
-                data = self._get_direct_report(
-                    login,
-                    self.dates_list[0],
-                    self.dates_list[-1]
+                    f'Постановка в очередь {submitted}/'
+                    f'{submitted + len(not_submitted)}, аккаунт: {login}, '
+                    f'период: {date_from} - {date_to}'
                 )
-                df = pd.read_csv(
-                    io.StringIO(data),
-                    sep='\t',
-                    encoding='cp1251',
-                    header=1
+                submitted_at[task] = time.monotonic()
+                heapq.heappush(
+                    in_queue,
+                    (submitted_at[task], next(order), task)
                 )
-                df['Account'] = login
-                campaign_parts = self._split_campaign(df['CampaignName'])
-                df = pd.concat([df, campaign_parts], axis=1)
-                data_frames.append(df)
+            if not in_queue:
+                # Все места очереди заняты отчетами, завершенными ошибкой.
+                time.sleep(max(0.0, abandoned[0] - time.monotonic()))
+                continue
+
+            poll_at, _, task = heapq.heappop(in_queue)
+            login, date_from, date_to = task
+            time.sleep(max(0.0, poll_at - time.monotonic()))
+
+            state, payload = self._send_direct_request(
+                self._get_direct_headers(login, processing_mode='offline'),
+                self._get_direct_body(date_from, date_to)
+            )
+            if state == 'pending':
+                now = time.monotonic()
+                retry_in[task] = payload
+                delay = self.retry_policy.get_poll_delay(
+                    payload,
+                    now - submitted_at[task]
+                )
+                heapq.heappush(in_queue, (now + delay, next(order), task))
+                continue
+            if state == 'failed' and task in retry_in:
+                logging.warning(
+                    f'Аккаунт {login}: отчет за период {date_from} - '
+                    f'{date_to} занимает место в очереди еще '
+                    f'{retry_in[task]} сек.'
+                )
+                heapq.heappush(
+                    abandoned,
+                    time.monotonic() + retry_in.pop(task)
+                )
+            retry_in.pop(task, None)
+            registry.observe(
+                'report_wait_seconds',
+                time.monotonic() - submitted_at.pop(task),
+                source=self.source,
+                login=login
+            )
+            if state == 'split':
+                shards = self._split_task(task)
+                if shards:
+                    self._remember_split(task)
+                    submitted -= 1
+                    missing = []
+                    for shard, stream in self._iter_cached(shards):
+                        if stream is None:
+                            missing.append(shard)
+                            continue
+                        yield shard, stream
+                    not_submitted.extendleft(reversed(missing))
+                    continue
+            yield task, payload
+
+    def _parse_direct_report(
+        self,
+        login: str,
+        stream: BinaryIO
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Защищенный метод.
+        Потоково разбирает TSV-отчет логина на DataFrame-чанки.
+
+        Тело отчета читается парсером по частям с явными типами колонок
+        DIRECT_READ_DTYPES, каждый чанк сразу дополняется колонками
+        аккаунта, источника и частей кампании и приводится к схеме
+        SCHEMA_DIRECT. Время чтения и обработки чанков
+        учитывается в метриках без времени их записи потребителем.
+        """
+        chunks = iter(pd.read_csv(
+            stream,
+            sep='\t',
+            encoding='utf-8',
+            header=0,
+            dtype=DIRECT_READ_DTYPES,
+            chunksize=self.chunk_size
+        ))
+        while True:
+            start_time = time.perf_counter()
+            df = next(chunks, None)
+            if df is None:
+                return
+            df['Account'] = login
+            campaign_parts = self._split_campaign(df['CampaignName'])
+            df = pd.concat([df, campaign_parts], axis=1)
+            df['Source'] = 'yandex'
+            df['Cost'] = df['Cost'] * 1.2 / 1000000
+            df = apply_schema(df, self.schema)
+            registry.observe(
+                'parse_seconds',
+                time.perf_counter() - start_time,
+                source=self.source,
+                login=login
+            )
+            yield df
+
+    def _open_report_stream(
+        self,
+        response: requests.Response,
+        cache_key: str,
+        ttl: float | None
+    ) -> BinaryIO:
+        """
+        Защищенный метод. Возвращает поток с телом готового отчета.
 
-                time.sleep(1)
+        Если отчет подлежит кэшированию, тело по частям записывается
+        в кэш ответов и читается уже из файла кэша.
+        """
+        if not self.cache.should_store(ttl):
+            response.raw.decode_content = True
+            return response.raw
+        path = self.cache.put(
+            cache_key,
+            response.iter_content(HTTP_CACHE_CHUNK_SIZE),
+            ttl
+        )
+        return open(path, 'rb')
 
+    def _iter_login_data(
+        self,
+        task: tuple,
+        stream: BinaryIO
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Защищенный метод.
+        Отдает DataFrame-чанки отчета задачи, логируя ошибки разбора.
+        Строки отчета учитываются по датам для планирования разбиения
+        периода при следующих выгрузках.
+        """
+        login, date_from, date_to = task
+        row_counts = self.row_counts.setdefault(login, {})
+        try:
+            rows = 0
+            for df in self._parse_direct_report(login, stream):
+                rows += len(df)
+                self.campaigns.update(df['CampaignName'].dropna().unique())
+                date_counts = df['Date'].value_counts()
+                for date_str, n in date_counts[date_counts > 0].items():
+                    row_counts[date_str] = row_counts.get(date_str, 0) + n
+                yield df
+            logging.info(
+                f'Аккаунт {login}, период {date_from} - {date_to}: '
+                f'получено строк {rows}'
+            )
+            registry.inc(
+                'rows_total',
+                rows,
+                source=self.source,
+                login=login
+            )
+        except Exception as e:
+            self.failed_logins.add(login)
+            logging.error(f'Ошибка в аккаунте {login}: {e}')
+        finally:
+            stream.close()
+
+    def _iter_direct_data(self) -> Iterator[pd.DataFrame]:
+        """
+        Защищенный метод.
+        Отдает данные Директа по всем логинам DataFrame-чанками по мере
+        получения отчетов. Период каждого логина может быть разбит
+        на части: периоды частей не пересекаются, поэтому их чанки
+        просто идут друг за другом. Отчеты, найденные в кэше ответов,
+        читаются с диска без запросов к API. Логин считается выгруженным,
+        если получены отчеты по всем его частям.
+        """
+        self.fetched_logins = []
+        self.failed_logins = set()
+        self.row_counts = {}
+        self.campaigns = set()
+
+        tasks = []
+        for login in self.logins:
+            for task, stream in self._iter_cached(self._plan_tasks(login)):
+                if stream is None:
+                    tasks.append(task)
+                    continue
+                yield from self._iter_login_data(task, stream)
+
+        if self.queue_mode:
+            reports = self._iter_direct_reports_queue(tasks)
+        else:
+            reports = self._iter_direct_reports(tasks)
+
+        for task, response in reports:
+            login = task[0]
+            if response is None:
+                self.failed_logins.add(login)
+                logging.error(
+                    f'Ошибка в аккаунте {login}: отчет за период '
+                    f'{task[1]} - {task[2]} не получен'
+                )
+                continue
+            if not isinstance(response, requests.Response):
+                # Отчет части разбитого периода, найденный в кэше.
+                yield from self._iter_login_data(task, response)
+                continue
+            try:
+                stream = self._open_report_stream(
+                    response,
+                    self._get_cache_key(task),
+                    self.cache.get_ttl(task[2])
+                )
             except Exception as e:
+                self.failed_logins.add(login)
                 logging.error(f'Ошибка в аккаунте {login}: {e}')
+                response.close()
                 continue
+            yield from self._iter_login_data(task, stream)
+            response.close()
 
-        if not data_frames:
-            return pd.DataFrame()
+        self.fetched_logins = [
+            login for login in self.logins if login not in self.failed_logins
+        ]
+
+    def _get_cache_key(self, task: tuple) -> str:
+        """Защищенный метод. Возвращает ключ кэша отчета задачи."""
+        login, date_from, date_to = task
+        return self.cache.make_key(
+            YANDEX_DIRECT_URL,
+            body=self._get_direct_body(date_from, date_to),
+            login=login
+        )
+
+    def _get_split_key(self, task: tuple) -> str:
+        """
+        Защищенный метод. Возвращает ключ отметки кэша о том,
+        что период задачи был разбит.
+        """
+        login, date_from, date_to = task
+        return self.cache.make_key(
+            YANDEX_DIRECT_URL,
+            params={'split': True},
+            body=self._get_direct_body(date_from, date_to),
+            login=login
+        )
 
-        data = pd.concat(data_frames, ignore_index=True)
-        data['Source'] = 'yandex'
-        data['Cost'] = data['Cost'] * 1.2 / 1000000
-        data = data[~data['Date'].str.contains(
-            'Total',
-            case=False,
-            na=False
-        )]
-        return data
+    def _get_all_direct_data(self) -> pd.DataFrame:
+        """Метод получает данные из Яндекс direct для всех клиентов."""
+        return concat_frames(list(self._iter_direct_data()))
+
+    def get_campaigns(self) -> set | None:
+        """
+        Метод возвращает названия кампаний из последней выгрузки.
+        Аппметрика дополняет их кампаниями из файла Директа.
+        Если отчеты получены не по всем логинам, возвращает None.
+        """
+        if not self.dates_list:
+            return None
+        if set(self.fetched_logins) != set(self.logins):
+            return None
+        return self.campaigns
+
+    def _get_refresh_scope(self) -> dict | None:
+        """
+        Защищенный метод. Ограничивает удаление обновляемых дат
+        успешно выгруженными логинами: строки логинов, отчеты которых
+        не получены, остаются в кэше.
+        """
+        if not self.fetched_logins:
+            return None
+        return {'Account': self.fetched_logins}
 
     def save_data(self, filename_data: str) -> None:
         """
         Метод сохраняет новые данные, объединяя с существующими.
-        Наследуется от миксина FileMixin
+        Данные записываются чанками через save_chunks миксина FileMixin.
         """
-        df_new = self._get_all_direct_data()
-        super().save_data(df_new, filename_data)
+        if not self.dates_list:
+            logging.info('Нет дат для обновления')
+            return
+        self.save_chunks(self._iter_direct_data(), filename_data)
+        self._mark_refreshed(self.fetched_logins, self.row_counts)
@@ -1,26 +1,38 @@
 import logging
+from typing import Iterator
 
-from dotenv import load_dotenv
 import pandas as pd
-import requests
 
-from parser.logging_config import setup_logging
 from parser.constants import (
+    CACHE_STORAGE,
     DEFAULT_FOLDER,
+    NATURAL_KEY_METRICA,
     YANDEX_METRICA_URL,
     METRICA_LIMIT,
     REPORT_FIELDS_METRICA,
     DEFAULT_COLUMNS_CAMPAIGN,
+    METRICA_CAMPAIGN_FILTER,
+    METRICA_REPORT_SAVINGS,
+    METRICA_SERVER_FILTER,
 )
-from parser.mixins import ColumnMixin, FileMixin
+from parser.db import DatabaseSink
+from parser.http_cache import ResponseCache
+from parser.logging_config import request_logger
+from parser.metrics import registry
+from parser.mixins import ColumnMixin, FileMixin, RequestMixin
+from parser.retry import RetryPolicy
+from parser.schema import SCHEMA_METRICA, apply_schema
+from parser.state import RefreshState
+from parser.storage import collapse_keys
+from parser.throttling import RateLimiter
+from parser.transport import HttpTransport
 
-setup_logging()
-load_dotenv()
 
-
-class YandexMetricaReports(ColumnMixin, FileMixin):
+class YandexMetricaReports(ColumnMixin, FileMixin, RequestMixin):
     """Класс для получения и сохранения данных отчетов из Яндекс metrica."""
 
+    source = 'metrica'
+
     def __init__(
         self,
         token: str,
@@ -30,90 +42,236 @@ class YandexMetricaReports(ColumnMixin, FileMixin):
         report_fields: list = REPORT_FIELDS_METRICA,
         columns: list = DEFAULT_COLUMNS_CAMPAIGN,
         folder_name: str = DEFAULT_FOLDER,
-        limit: int = METRICA_LIMIT
+        storage: str = CACHE_STORAGE,
+        state: RefreshState | None = None,
+        limit: int = METRICA_LIMIT,
+        rate_limiter: RateLimiter | None = None,
+        server_filter: bool = METRICA_SERVER_FILTER,
+        report_savings: bool = METRICA_REPORT_SAVINGS,
+        transport: HttpTransport | None = None,
+        retry_policy: RetryPolicy | None = None,
+        cache: ResponseCache | None = None,
+        sink: DatabaseSink | None = None
     ):
         FileMixin.__init__(
             self,
             dates_list=dates_list,
-            folder_name=folder_name
+            natural_key=NATURAL_KEY_METRICA,
+            folder_name=folder_name,
+            storage=storage,
+            state=state,
+            schema=SCHEMA_METRICA,
+            sink=sink
         )
         ColumnMixin.__init__(self, columns=columns)
         if not token:
             logging.error('Токен отсутствует или не действителен')
         self.token = token
+        self.transport = transport or HttpTransport()
+        self.retry_policy = retry_policy or RetryPolicy(source=self.source)
+        self.cache = cache or ResponseCache()
         self.logins = login
         self.report_fields = report_fields
         self.metrica_id = metrica_id
         self.limit = limit
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.server_filter = server_filter
+        self.report_savings = report_savings
+        self.fetched_rows = 0
+        self.fetched_bytes = 0
+        self.fetch_failed = False
 
-    def _get_metrica_reports(self):
+    def _get_metrica_params(self) -> dict:
         """
-        Защищенный метод.
-        Получает отчет из Яндекс metrica для указанного id и периода.
+        Защищенный метод. Формирует параметры запроса отчета Метрики.
+
+        При включенной серверной фильтрации в запрос добавляется фильтр
+        METRICA_CAMPAIGN_FILTER, чтобы строки без '-' в имени кампании
+        не передавались с сервера.
         """
-        start_date = self.dates_list[0]
-        end_date = self.dates_list[-1]
-        url = YANDEX_METRICA_URL
-        headers = {
-            "Authorization": f"OAuth {self.token}"
-        }
         params = {
             "ids": self.metrica_id,
             "metrics": "ym:s:ecommercePurchases,ym:s:ecommerceRevenue",
-            "dimensions": "ym:s:date,ym:s:lastsignDirectClickOrder, "
+            "dimensions": "ym:s:date,ym:s:lastsignDirectClickOrder,"
             "ym:s:DeviceCategory",
-            "date1": start_date,
-            "date2": end_date,
+            "date1": self.dates_list[0],
+            "date2": self.dates_list[-1],
             "accuracy": "full",
             "limit": self.limit
         }
+        if self.server_filter:
+            params['filters'] = METRICA_CAMPAIGN_FILTER
+        return params
+
+    def _get_metrica_total_rows(self, params: dict) -> int | None:
+        """
+        Защищенный метод.
+        Получает total_rows отчета минимальным запросом (limit=1).
+        """
+        url = YANDEX_METRICA_URL
+        headers = {
+            "Authorization": f"OAuth {self.token}"
+        }
         try:
-            response = requests.get(url, headers=headers, params=params)
-            if response.status_code == requests.codes.ok:
-                data = response.json()
+            data, _ = self._get_json(
+                url,
+                headers,
+                {**params, 'limit': 1},
+                self.cache.get_ttl(self.dates_list[-1])
+            )
+            return int(data.get('total_rows', 0))
+        except Exception as e:
+            logging.error(f'Ошибка: {e}')
+            return None
+
+    def _log_filter_savings(self) -> None:
+        """
+        Защищенный метод.
+        Логирует, сколько строк и байт сэкономила серверная фильтрация.
+
+        Количество строк без фильтра берется из total_rows отдельного
+        запроса с limit=1, объем в байтах оценивается по среднему размеру
+        полученной строки.
+        """
+        params = self._get_metrica_params()
+        params.pop('filters', None)
+        total_unfiltered = self._get_metrica_total_rows(params)
+        rows, size = self.fetched_rows, self.fetched_bytes
+        if total_unfiltered is None or not rows:
+            return
+        rows_saved = max(total_unfiltered - rows, 0)
+        bytes_saved = round(rows_saved * size / rows)
+        logging.info(
+            f'Серверная фильтрация Метрики: получено строк {rows} '
+            f'({size} байт), отброшено на сервере строк {rows_saved} '
+            f'(~{bytes_saved} байт)'
+        )
+
+    def _get_metrica_reports(self) -> Iterator[list]:
+        """
+        Защищенный метод.
+        Постранично получает отчет из Яндекс metrica для указанного id
+        и периода.
 
-                if not data or 'data' not in data or not data['data']:
+        Перебирает offset с шагом limit, пока не будут получены все
+        total_rows строк, и отдает каждую страницу по мере получения.
+        """
+        url = YANDEX_METRICA_URL
+        headers = {
+            "Authorization": f"OAuth {self.token}"
+        }
+        params = self._get_metrica_params()
+        ttl = self.cache.get_ttl(self.dates_list[-1])
+        self.fetched_rows = 0
+        self.fetched_bytes = 0
+        self.fetch_failed = False
+        offset = 1
+        total_rows = None
+
+        while total_rows is None or offset <= total_rows:
+            params['offset'] = offset
+            try:
+                data, size = self._get_json(url, headers, params, ttl)
+            except Exception as e:
+                logging.error(f'Ошибка: {e}')
+                self.fetch_failed = True
+                if total_rows is None:
+                    return
+                logging.error(
+                    f'Отчет получен не полностью: offset={offset}, '
+                    f'всего строк {total_rows}'
+                )
+                raise
+
+            if not data or 'data' not in data or not data['data']:
+                if total_rows is None:
                     logging.warning('Нет данных для кампании ')
-                    return []
+                return
 
-                return data['data']
-            else:
-                logging.error(f'Ошибка API: {response.status_code}')
-                return []
-        except Exception as e:
-            logging.error(f'Ошибка: {e}')
-            return []
+            total_rows = data.get('total_rows', 0)
+            self.fetched_rows += len(data['data'])
+            self.fetched_bytes += size
+            request_logger.debug(
+                f'Получена страница offset={offset}, '
+                f'строк: {len(data['data'])} из {total_rows}'
+            )
+            yield data['data']
+            offset += self.limit
 
-    def _get_all_metrika_data(self):
-        """Защищенный метод, получает все данные из Яндекс metrica."""
-        result = []
-        data = self._get_metrica_reports()
-        try:
-            for i in data:
-                if '-' in str(i['dimensions'][1]['name']):
-                    result.append(
-                        [
-                            i['dimensions'][0]['name'],
-                            i['dimensions'][1]['name'].split('|')[0],
-                            i['dimensions'][2]['name'],
-                            int(i['metrics'][0]),
-                            int(float(i['metrics'][1]))
-                        ]
-                    )
-
-            df = pd.DataFrame(result, columns=self.report_fields)
-            campaign_parts = self._split_campaign(df['CampaignName'])
-            df = pd.concat([df, campaign_parts], axis=1)
-            df = self._rename_columns(df)
+    def _get_page_data(self, page: list) -> pd.DataFrame:
+        """
+        Защищенный метод. Преобразует страницу отчета Метрики
+        в DataFrame по схеме источника.
+
+        После отбрасывания части имени кампании после '|' и приведения
+        устройств Метрика может вернуть несколько строк на один ключ,
+        их метрики суммируются.
+        """
+        rows = [
+            [
+                i['dimensions'][0]['name'],
+                i['dimensions'][1]['name'].split('|')[0],
+                i['dimensions'][2]['name'],
+                int(i['metrics'][0]),
+                int(float(i['metrics'][1]))
+            ]
+            for i in page
+            if '-' in str(i['dimensions'][1]['name'])
+        ]
+        df = pd.DataFrame(rows, columns=self.report_fields)
+        if df.empty:
             return df
+        df = collapse_keys(self._rename_columns(df), self.natural_key)
+        campaign_parts = self._split_campaign(df['CampaignName'])
+        df = pd.concat([df, campaign_parts], axis=1)
+        return apply_schema(df, self.schema)
+
+    def _iter_metrika_data(self) -> Iterator[pd.DataFrame]:
+        """
+        Защищенный метод, отдает данные из Яндекс metrica по страницам.
+
+        Каждая страница отчета сразу преобразуется в DataFrame
+        с категориальными колонками и отдается на сохранение, поэтому
+        в памяти не копятся ни строки отчета, ни страницы. Строки
+        с одинаковым ключом на разных страницах суммируются при
+        сохранении, см. FileMixin.save_chunks.
+        """
+        rows = 0
+        try:
+            for page in self._get_metrica_reports():
+                df = self._get_page_data(page)
+                rows += len(df)
+                yield df
+
+            if self.server_filter and self.report_savings:
+                self._log_filter_savings()
+
+            registry.inc(
+                'rows_total',
+                rows,
+                source=self.source,
+                login=self.metrica_id
+            )
         except Exception as e:
             logging.error(f'Ошибка при получении данных из метрики: {e}')
             raise
 
+    def _get_refresh_scope(self) -> dict | None:
+        """
+        Защищенный метод. Обновляемые даты удаляются из кэша, только
+        если отчет Метрики получен.
+        """
+        return None if self.fetch_failed else {}
+
     def save_data(self, filename_data: str) -> None:
         """
         Метод сохраняет новые данные, объединяя с существующими.
-        Наследуется от миксина FileMixin
+        Страницы отчета записываются по мере получения через save_chunks
+        миксина FileMixin.
         """
-        df_new = self._get_all_metrika_data()
-        super().save_data(df_new, filename_data)
+        if not self.dates_list:
+            logging.info('Нет дат для обновления')
+            return
+        self.save_chunks(self._iter_metrika_data(), filename_data)
+        if not self.fetch_failed:
+            self._mark_refreshed([self.metrica_id])
@@ -0,0 +1,92 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from parser.db import DatabaseSink
+
+NATURAL_KEY = ['Date', 'Account', 'CampaignName']
+
+
+@pytest.fixture
+def sink(tmp_path):
+    """SQLite-база во временной папке."""
+    return DatabaseSink('sqlite', path=tmp_path / 'db.sqlite')
+
+
+def make_frame(rows: list) -> pd.DataFrame:
+    """Создает DataFrame из строк (дата, логин, кампания, расход)."""
+    return pd.DataFrame(
+        rows,
+        columns=['Date', 'Account', 'CampaignName', 'Cost']
+    )
+
+
+def read_table(sink: DatabaseSink, table: str) -> list:
+    """Читает строки таблицы в порядке ключа."""
+    with sqlite3.connect(sink.path) as connection:
+        return connection.execute(
+            f'SELECT Date, Account, CampaignName, Cost FROM {table} '
+            'ORDER BY Date, Account, CampaignName'
+        ).fetchall()
+
+
+def test_write_replaces_dates_in_scope(sink):
+    sink.write(
+        'direct',
+        make_frame([
+            ('2024-01-01', 'a', 'c-1', 1),
+            ('2024-01-01', 'b', 'c-1', 2),
+            ('2024-01-02', 'a', 'c-1', 3),
+        ]),
+        ['2024-01-01', '2024-01-02'],
+        NATURAL_KEY,
+        {}
+    )
+    rows = sink.write(
+        'direct',
+        make_frame([('2024-01-02', 'a', 'c-2', 4)]),
+        ['2024-01-01', '2024-01-02'],
+        NATURAL_KEY,
+        {'Account': ['a']}
+    )
+    assert rows == 1
+    assert read_table(sink, 'direct') == [
+        ('2024-01-01', 'b', 'c-1', 2),
+        ('2024-01-02', 'a', 'c-2', 4),
+    ]
+
+
+def test_write_empty_frame_clears_dates(sink):
+    sink.write(
+        'metrica',
+        make_frame([
+            ('2024-01-01', 'a', 'c-1', 1),
+            ('2024-01-02', 'a', 'c-1', 2),
+        ]),
+        ['2024-01-01', '2024-01-02'],
+        NATURAL_KEY,
+        {}
+    )
+    sink.write('metrica', make_frame([]), ['2024-01-02'], NATURAL_KEY, None)
+    assert len(read_table(sink, 'metrica')) == 2
+    sink.write('metrica', make_frame([]), ['2024-01-02'], NATURAL_KEY, {})
+    assert read_table(sink, 'metrica') == [('2024-01-01', 'a', 'c-1', 1)]
+
+
+def test_write_chunks_passes_chunks_through(sink):
+    chunks = [
+        make_frame([('2024-01-01', 'a', 'c-1', 1)]),
+        make_frame([('2024-01-02', 'a', 'c-1', 2)]),
+    ]
+    passed = list(sink.write_chunks(
+        'appmetrica',
+        iter(chunks),
+        ['2024-01-01', '2024-01-02'],
+        NATURAL_KEY
+    ))
+    assert len(passed) == 2
+    assert read_table(sink, 'appmetrica') == [
+        ('2024-01-01', 'a', 'c-1', 1),
+        ('2024-01-02', 'a', 'c-1', 2),
+    ]
@@ -0,0 +1,53 @@
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from benchmarks.run_benchmarks import run_case
+from benchmarks.stub_server import SyntheticApiServer, SyntheticData
+from parser.constants import (
+    NATURAL_KEY_APPMETRICA,
+    NATURAL_KEY_DIRECT,
+    NATURAL_KEY_METRICA
+)
+
+
+@pytest.fixture
+def server():
+    """Локальный стенд API с небольшими синтетическими данными."""
+    server = SyntheticApiServer(SyntheticData(logins=3, campaigns=30))
+    server.start()
+    yield server
+    server.shutdown()
+
+
+def test_main_against_stub_server(server):
+    config = {
+        'client': 'bench',
+        'logins': server.data.logins,
+        'metrica_id': '1000001',
+        'appmetrica_id': '2000001',
+        'days': 5,
+        'campaigns': server.data.campaign_names,
+        'compression': None
+    }
+    result = run_case('main', server, config, keep=True)
+    workdir = Path(result['workdir'])
+    try:
+        assert result['returncode'] == 0
+        data = workdir / 'data'
+        for source, natural_key in (
+            ('direct', NATURAL_KEY_DIRECT),
+            ('metrica', NATURAL_KEY_METRICA),
+            ('appmetrica', NATURAL_KEY_APPMETRICA),
+        ):
+            df = pd.read_csv(data / f'bench_{source}.csv', sep=';')
+            assert not df.empty
+            assert not df.duplicated(natural_key).any()
+        direct = pd.read_csv(data / 'bench_direct.csv', sep=';')
+        assert set(direct['Account']) == set(server.data.logins)
+        assert direct['Date'].nunique() == 5
+        assert (data / 'bench_romi.csv').exists()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,50 @@
+import datetime as dt
+
+from parser.constants import (
+    DATE_FORMAT,
+    HTTP_CACHE_ATTRIBUTION_DAYS,
+    HTTP_CACHE_TTL_RECENT,
+    HTTP_CACHE_TTL_YESTERDAY
+)
+from parser.http_cache import ResponseCache
+
+
+def days_ago(days: int) -> str:
+    """Возвращает дату days дней назад в формате DATE_FORMAT."""
+    return (dt.date.today() - dt.timedelta(days=days)).strftime(DATE_FORMAT)
+
+
+def test_get_ttl_depends_on_report_date():
+    assert ResponseCache.get_ttl(days_ago(0)) == 0
+    assert ResponseCache.get_ttl(days_ago(1)) == HTTP_CACHE_TTL_YESTERDAY
+    assert ResponseCache.get_ttl(
+        days_ago(HTTP_CACHE_ATTRIBUTION_DAYS)
+    ) == HTTP_CACHE_TTL_RECENT
+    assert ResponseCache.get_ttl(
+        days_ago(HTTP_CACHE_ATTRIBUTION_DAYS + 1)
+    ) is None
+
+
+def test_put_and_get(tmp_path):
+    cache = ResponseCache(tmp_path)
+    key = cache.make_key('url', params={'a': 1}, login='login')
+    assert cache.get(key) is None
+    cache.put(key, [b'abc', b'def'], None)
+    assert cache.get(key).read_bytes() == b'abcdef'
+    assert not cache.should_store(0)
+
+
+def test_expired_entry_is_not_returned(tmp_path):
+    cache = ResponseCache(tmp_path)
+    key = cache.make_key('url')
+    cache.put(key, [b'abc'], -1)
+    assert cache.get(key) is None
+
+
+def test_evict_trims_cache_below_limit(tmp_path):
+    cache = ResponseCache(tmp_path, max_bytes=1000, evict_ratio=0.5)
+    for i in range(11):
+        cache.put(cache.make_key(f'url{i}'), [b'x' * 100], None)
+    sizes = [path.stat().st_size for path in tmp_path.glob('*/*.body')]
+    assert sum(sizes) <= 500
+    assert cache.get(cache.make_key('url10')) is not None
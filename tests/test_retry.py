@@ -0,0 +1,37 @@
+from parser.constants import POLL_GROWTH_FACTOR, POLL_MAX_DELAY
+from parser.retry import RetryPolicy
+from parser.throttling import UnitsScheduler
+
+
+def test_get_poll_delay():
+    policy = RetryPolicy()
+    assert policy.get_poll_delay(5, 0) == 5
+    assert policy.get_poll_delay(1, 100) == min(
+        100 * POLL_GROWTH_FACTOR,
+        POLL_MAX_DELAY
+    )
+    assert policy.get_poll_delay(1, 10 ** 9) == POLL_MAX_DELAY
+
+
+def test_get_delay_is_bounded():
+    policy = RetryPolicy(base_delay=1, max_delay=4)
+    for attempt in range(1, 10):
+        delay = policy.get_delay(attempt)
+        assert 0 < delay <= 4
+
+
+def test_units_scheduler_delays_owner_logins():
+    scheduler = UnitsScheduler(low_watermark=0.5, max_backoff=10)
+    assert scheduler.get_delay('a') == 0
+    scheduler.update('a', {'Units': '10/900/1000'})
+    assert scheduler.get_delay('a') == 0
+    scheduler.update(
+        'b',
+        {'Units': '10/250/1000', 'Units-Used-Login': 'agency'}
+    )
+    assert scheduler.get_delay('b') == 5
+    scheduler.update(
+        'c',
+        {'Units': '10/0/1000', 'Units-Used-Login': 'agency'}
+    )
+    assert scheduler.get_delay('b') == 10
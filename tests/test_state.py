@@ -0,0 +1,40 @@
+import datetime as dt
+
+from parser.state import RefreshState
+
+TODAY = dt.date(2024, 1, 10)
+
+
+def test_get_dates_list_without_state(tmp_path):
+    state = RefreshState('client', 'direct', 3, path=tmp_path)
+    assert state.get_dates_list(['a'], 3, today=TODAY) == [
+        '2024-01-07',
+        '2024-01-08',
+        '2024-01-09',
+    ]
+
+
+def test_get_dates_list_starts_from_first_not_final_date(tmp_path):
+    state = RefreshState('client', 'direct', 3, path=tmp_path)
+    state.mark_fetched(
+        ['a', 'b'],
+        ['2024-01-05', '2024-01-06', '2024-01-07'],
+        today=dt.date(2024, 1, 9)
+    )
+    state = RefreshState('client', 'direct', 3, path=tmp_path)
+    assert state.is_final('a', '2024-01-06')
+    assert not state.is_final('a', '2024-01-07')
+    assert state.get_dates_list(['a', 'b'], 5, today=TODAY) == [
+        '2024-01-07',
+        '2024-01-08',
+        '2024-01-09',
+    ]
+    assert state.get_dates_list(['a', 'c'], 5, today=TODAY)[0] == (
+        '2024-01-05'
+    )
+
+
+def test_get_dates_list_is_empty_when_all_final(tmp_path):
+    state = RefreshState('client', 'direct', 1, path=tmp_path)
+    state.mark_fetched(['a'], ['2024-01-08', '2024-01-09'], today=TODAY)
+    assert state.get_dates_list(['a'], 2, today=TODAY) == []
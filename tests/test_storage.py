@@ -0,0 +1,120 @@
+import pandas as pd
+
+from parser.storage import (
+    PartitionedStorage,
+    collapse_chunks,
+    collapse_keys,
+    drop_dates,
+    upsert
+)
+
+NATURAL_KEY = ['Date', 'Account', 'CampaignName']
+
+
+def make_frame(rows: list) -> pd.DataFrame:
+    """Создает DataFrame из строк (дата, логин, кампания, расход)."""
+    return pd.DataFrame(
+        rows,
+        columns=['Date', 'Account', 'CampaignName', 'Cost']
+    )
+
+
+def test_collapse_keys_sums_duplicate_keys():
+    df = make_frame([
+        ('2024-01-01', 'a', 'c-1', 1),
+        ('2024-01-01', 'a', 'c-1', 2),
+        ('2024-01-01', 'a', 'c-2', 5),
+    ])
+    result = collapse_keys(df, NATURAL_KEY)
+    assert list(result.columns) == list(df.columns)
+    assert result.set_index('CampaignName')['Cost'].to_dict() == {
+        'c-1': 3,
+        'c-2': 5
+    }
+
+
+def test_collapse_chunks_sums_keys_across_chunks(tmp_path):
+    chunks = [
+        make_frame([
+            ('2024-01-01', 'a', 'c-1', 1),
+            ('2024-01-01', 'a', 'c-2', 2),
+        ]),
+        make_frame([('2024-01-01', 'a', 'c-1', 4)]),
+    ]
+    path = tmp_path / 'chunks.spool'
+    result = pd.concat(list(collapse_chunks(chunks, NATURAL_KEY, path)))
+    assert result.set_index('CampaignName')['Cost'].to_dict() == {
+        'c-1': 5,
+        'c-2': 2
+    }
+    assert not path.exists()
+
+
+def test_drop_dates_keeps_rows_outside_scope():
+    df = make_frame([
+        ('2024-01-01', 'a', 'c-1', 1),
+        ('2024-01-01', 'b', 'c-1', 2),
+        ('2024-01-02', 'a', 'c-1', 3),
+    ])
+    result = drop_dates(df, ['2024-01-01'], {'Account': ['a']})
+    assert result['Cost'].tolist() == [2, 3]
+    assert drop_dates(df, ['2024-01-01'])['Cost'].tolist() == [3]
+
+
+def test_upsert_replaces_keys_and_refreshed_dates():
+    df_old = make_frame([
+        ('2024-01-01', 'a', 'c-1', 1),
+        ('2024-01-01', 'a', 'c-old', 7),
+        ('2024-01-02', 'a', 'c-1', 3),
+        ('2024-01-02', 'b', 'c-1', 9),
+    ])
+    df_new = make_frame([
+        ('2024-01-02', 'a', 'c-1', 10),
+        ('2024-01-02', 'a', 'c-1', 5),
+        ('2024-01-01', 'a', 'c-1', 2),
+    ])
+    result = upsert(
+        df_new,
+        df_old,
+        NATURAL_KEY,
+        ['2024-01-02'],
+        {'Account': ['a']}
+    )
+    assert sorted(result.itertuples(index=False, name=None)) == [
+        ('2024-01-01', 'a', 'c-1', 2),
+        ('2024-01-01', 'a', 'c-old', 7),
+        ('2024-01-02', 'a', 'c-1', 15),
+        ('2024-01-02', 'b', 'c-1', 9),
+    ]
+
+
+def test_partitioned_storage_write_chunks(tmp_path):
+    storage = PartitionedStorage(tmp_path / 'source', NATURAL_KEY)
+    storage.write(
+        make_frame([
+            ('2024-01-01', 'a', 'c-1', 1),
+            ('2024-02-01', 'a', 'c-1', 2),
+        ]),
+        []
+    )
+    rows = storage.write_chunks(
+        [
+            make_frame([('2024-02-01', 'a', 'c-2', 3)]),
+            make_frame([('2024-02-01', 'a', 'c-2', 4)]),
+        ],
+        ['2024-02-01']
+    )
+    assert rows == 2
+    result = storage.read()
+    assert sorted(result.itertuples(index=False, name=None)) == [
+        ('2024-01-01', 'a', 'c-1', 1),
+        ('2024-02-01', 'a', 'c-2', 7),
+    ]
+
+
+def test_partitioned_storage_keeps_dates_without_scope(tmp_path):
+    storage = PartitionedStorage(tmp_path / 'source', NATURAL_KEY)
+    storage.write(make_frame([('2024-01-01', 'a', 'c-1', 1)]), [])
+    rows = storage.write_chunks([], ['2024-01-01'], lambda: None)
+    assert rows == 0
+    assert storage.read()['Cost'].tolist() == [1]
@@ -0,0 +1,73 @@
+import json
+from collections import Counter
+
+import pytest
+
+from parser.http_cache import ResponseCache
+from parser.ya_direct import YandexDirectReports
+
+
+@pytest.fixture
+def direct(tmp_path):
+    """Объект Директа с кэшем ответов во временной папке."""
+    return YandexDirectReports(
+        token='token',
+        dates_list=[],
+        login=['a'],
+        queue_limit=2,
+        cache=ResponseCache(tmp_path)
+    )
+
+
+def test_split_task(direct):
+    assert direct._split_task(('a', '2024-01-01', '2024-01-04')) == [
+        ('a', '2024-01-01', '2024-01-02'),
+        ('a', '2024-01-03', '2024-01-04'),
+    ]
+    assert direct._split_task(('a', '2024-01-01', '2024-01-02')) == [
+        ('a', '2024-01-01', '2024-01-01'),
+        ('a', '2024-01-02', '2024-01-02'),
+    ]
+    assert direct._split_task(('a', '2024-01-01', '2024-01-01')) is None
+
+
+def test_iter_direct_reports_queue(direct, monkeypatch):
+    calls = Counter()
+    in_queue = set()
+    max_in_queue = 0
+
+    def send_direct_request(headers, body):
+        nonlocal max_in_queue
+        criteria = json.loads(body)['params']['SelectionCriteria']
+        task = (
+            headers['Client-Login'],
+            criteria['DateFrom'],
+            criteria['DateTo']
+        )
+        calls[task] += 1
+        in_queue.add(task)
+        max_in_queue = max(max_in_queue, len(in_queue))
+        if calls[task] == 1:
+            return 'pending', 0
+        in_queue.discard(task)
+        if task[1:] == ('2024-01-01', '2024-01-04'):
+            return 'split', None
+        if task[0] == 'c':
+            return 'failed', None
+        return 'ready', task
+
+    monkeypatch.setattr(direct, '_send_direct_request', send_direct_request)
+    tasks = [
+        ('a', '2024-01-01', '2024-01-04'),
+        ('b', '2024-01-01', '2024-01-02'),
+        ('c', '2024-01-01', '2024-01-01'),
+    ]
+    result = dict(direct._iter_direct_reports_queue(tasks))
+
+    assert result == {
+        ('a', '2024-01-01', '2024-01-02'): ('a', '2024-01-01', '2024-01-02'),
+        ('a', '2024-01-03', '2024-01-04'): ('a', '2024-01-03', '2024-01-04'),
+        ('b', '2024-01-01', '2024-01-02'): ('b', '2024-01-01', '2024-01-02'),
+        ('c', '2024-01-01', '2024-01-01'): None,
+    }
+    assert max_in_queue <= direct.queue_limit